@@ -0,0 +1,101 @@
+"""
+Cold Start Benchmark - Import time and first-request latency per endpoint
+
+Each endpoint is measured in a fresh interpreter, as a serverless cold
+start would see it: time to import index.py, latency of the first
+request, latency of a second (warm) request, and whether the Gemini SDK
+had to be imported. LLM routes run with MOCK_LLM=true unless --live is
+given.
+
+Usage:
+    python api/benchmarks/cold_start.py [--runs 3] [--live]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS = [
+    ('GET', '/api/status', None),
+    ('GET', '/api/drafts', None),
+    ('GET', '/api/emails/load', None),
+    ('GET', '/api/data/default_prompts.json', None),
+    ('GET', '/api/prompts', None),
+    ('POST', '/api/emails/process', 'process'),
+    ('POST', '/api/chat/query', 'chat'),
+]
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+
+from starlette.testclient import TestClient
+method, path, body_kind = json.loads(sys.argv[1])
+body = None
+if body_kind:
+    with open('data/mock_inbox.json', 'r', encoding='utf-8') as f:
+        emails = json.load(f)[:5]
+    body = {'emails': emails} if body_kind == 'process' else {'query': 'summarize this', 'emailId': emails[0]['id'], 'emails': emails}
+
+client = TestClient(index.app)
+timings = []
+for _ in range(2):
+    t = time.perf_counter()
+    response = client.request(method, path, json=body)
+    timings.append(time.perf_counter() - t)
+
+print(json.dumps({
+    'import': imported - started,
+    'first': timings[0],
+    'warm': timings[1],
+    'status': response.status_code,
+    'sdk': 'google.generativeai' in sys.modules
+}))
+'''
+
+
+def run_child(endpoint, env):
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD, json.dumps(endpoint)],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per endpoint (median reported)')
+    parser.add_argument('--live', action='store_true', help='call the real Gemini API on LLM routes')
+    args = parser.parse_args()
+    
+    env = dict(os.environ)
+    if not args.live:
+        env['MOCK_LLM'] = 'true'
+    
+    baseline = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baseline.append(time.perf_counter() - started)
+    print(f"Bare interpreter startup: {statistics.median(baseline) * 1000:.1f} ms (not included below)\n")
+    
+    print(f"{'endpoint':<38} {'import':>9} {'first req':>10} {'warm req':>9} {'SDK':>4}")
+    for endpoint in ENDPOINTS:
+        samples = [run_child(endpoint, env) for _ in range(args.runs)]
+        med = lambda key: statistics.median(s[key] for s in samples) * 1000
+        sdk = 'yes' if any(s['sdk'] for s in samples) else 'no'
+        label = f"{endpoint[0]} {endpoint[1]}"
+        print(f"{label:<38} {med('import'):>7.1f}ms {med('first'):>8.1f}ms {med('warm'):>7.1f}ms {sdk:>4}  [{samples[-1]['status']}]")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Email Model Profile - Heap usage of plain email dicts vs the compact EmailStore
+
+Usage:
+    python api/benchmarks/email_model_profile.py [--count 100000] [--body-size 600]
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.email_model import EmailStore
+
+
+CATEGORIES = ['Important', 'Newsletter', 'Spam', 'To-Do', 'Uncategorized']
+PRIORITIES = ['high', 'medium', 'low']
+
+
+def make_emails(count, body_size, senders=500, seed=7):
+    """Build synthetic processed emails the way they arrive from JSON (fresh strings)"""
+    rng = random.Random(seed)
+    words = ['meeting', 'review', 'budget', 'update', 'please', 'confirm', 'agenda', 'report', 'team', 'deadline']
+    emails = []
+    for i in range(count):
+        sender_index = rng.randrange(senders)
+        body = ' '.join(rng.choice(words) for _ in range(body_size // 7))[:body_size]
+        category = rng.choice(CATEGORIES)
+        action_items = []
+        if category in ('Important', 'To-Do'):
+            action_items = [
+                {'task': f"Follow up on item {i}", 'deadline': 'none', 'priority': rng.choice(PRIORITIES)}
+            ]
+        emails.append({
+            'id': f"email-{i:06d}",
+            # ''.join forces distinct string objects, as json.loads would produce
+            'sender': ''.join(['user', str(sender_index), '@example.com']),
+            'senderName': ''.join(['User ', str(sender_index)]),
+            'subject': f"Subject line number {i}",
+            'body': body,
+            'timestamp': f"2025-11-{1 + i % 28:02d}T09:{i % 60:02d}:00Z",
+            'category': ''.join(category),
+            'actionItems': action_items,
+            'isRead': bool(i % 2),
+            'hasAttachments': i % 5 == 0
+        })
+    return emails
+
+
+def measure(build):
+    """Return (retained heap bytes, seconds) for the object built by build()"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--body-size', type=int, default=600)
+    args = parser.parse_args()
+    
+    print(f"Profiling {args.count:,} emails with ~{args.body_size} byte bodies\n")
+    
+    dicts, dict_bytes, dict_time = measure(lambda: make_emails(args.count, args.body_size))
+    
+    def build_store(spill):
+        store = EmailStore(spill_bodies=spill)
+        for email in make_emails(args.count, args.body_size):
+            store.put(email)
+        return store
+    
+    inline, inline_bytes, inline_time = measure(lambda: build_store(False))
+    spilled, spilled_bytes, spilled_time = measure(lambda: build_store(True))
+    
+    def row(name, size, elapsed):
+        print(f"{name:<28} {size / 2**20:>9.1f} MiB {size / args.count:>8.0f} B/email {elapsed:>7.2f}s")
+    
+    row('dicts', dict_bytes, dict_time)
+    row('EmailStore (inline bodies)', inline_bytes, inline_time)
+    row('EmailStore (spilled bodies)', spilled_bytes, spilled_time)
+    print(f"\nSaved vs dicts: {1 - inline_bytes / dict_bytes:.0%} inline, {1 - spilled_bytes / dict_bytes:.0%} spilled "
+          f"({spilled.body_store.size / 2**20:.1f} MiB of bodies on disk)")
+    
+    sample = dicts[123]
+    assert inline.get(sample['id']).to_dict() == {**sample}
+    assert spilled.get(sample['id']).to_dict() == {**sample}
+    spilled.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+Load Test - In-process ASGI load generator for the whole API
+
+Drives the FastAPI app from index.py over httpx's ASGI transport (no
+network, no server) with an open-loop Poisson arrival process, replaying
+a weighted mix of inbox loads, batch processing, chat intents (including
+streamed answers) and draft create/list/delete cycles. Reports throughput,
+latency percentiles, error and shed (429) rates per request type, and
+event-loop lag measured by a ticker coroutine running alongside.
+
+LLM calls use the local mock by default; --backend fake swaps the SDK for
+a stub with simulated latency (see reprocess_latency.py) so admission,
+fair-share slots and hedging behave as they would against a slow model.
+Drafts are written to a temporary copy of drafts.json.
+
+Usage:
+    python api/benchmarks/load_test.py [--rate 50] [--duration 10] [--backend mock|fake]
+        [--mix load=4,process=1,chat=3,stream=1,drafts=2] [--users 5] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import defaultdict
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = 'load=4,process=1,chat=3,stream=1,drafts=2'
+
+CHAT_QUERIES = [
+    ('summarize this email', True),
+    ('draft a reply to this email', True),
+    ('what should I focus on today?', False),
+    ('show me important emails', False),
+    ('what are my tasks?', False),
+]
+
+
+def parse_mix(spec):
+    """Parse "scenario=weight,..." into a dict of positive weights"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() and float(weight or 0) > 0:
+            mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}; expected {', '.join(SCENARIOS)}")
+    return mix
+
+
+class Recorder:
+    """Latency samples and outcomes per request label"""
+    
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.shed = defaultdict(int)
+    
+    async def request(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            status = response.status_code
+        except Exception as e:
+            status = None
+            print(f"⚠️  {label}: {e}")
+        self.latencies[label].append(time.perf_counter() - started)
+        if status == 429:
+            self.shed[label] += 1
+        elif status is None or status >= 400:
+            self.errors[label] += 1
+        return response if status is not None else None
+
+
+async def scenario_load(client, recorder, ctx):
+    await recorder.request(client, 'GET /api/emails/load', 'GET', '/api/emails/load')
+
+
+async def scenario_process(client, recorder, ctx):
+    emails = random.sample(ctx['emails'], min(ctx['process_size'], len(ctx['emails'])))
+    await recorder.request(client, 'POST /api/emails/process', 'POST', '/api/emails/process',
+                           json={'emails': emails, 'precompute': False}, headers=ctx['headers']())
+
+
+async def scenario_chat(client, recorder, ctx):
+    query, needs_email = random.choice(CHAT_QUERIES)
+    body = {'query': query, 'emails': ctx['emails']}
+    if needs_email:
+        body['emailId'] = random.choice(ctx['emails'])['id']
+    await recorder.request(client, 'POST /api/chat/query', 'POST', '/api/chat/query', json=body, headers=ctx['headers']())
+
+
+async def scenario_stream(client, recorder, ctx):
+    email = random.choice(ctx['emails'])
+    body = {'query': 'summarize this email', 'emailId': email['id'], 'emails': ctx['emails']}
+    await recorder.request(client, 'POST /api/chat/stream', 'POST', '/api/chat/stream', json=body, headers=ctx['headers']())
+
+
+async def scenario_drafts(client, recorder, ctx):
+    draft_id = f"load-{random.getrandbits(48):012x}"
+    draft = {'id': draft_id, 'to': 'someone@example.com', 'subject': 'Re: load test', 'body': 'Thanks, will do.'}
+    await recorder.request(client, 'POST /api/drafts', 'POST', '/api/drafts', json=draft)
+    await recorder.request(client, 'GET /api/drafts', 'GET', '/api/drafts')
+    await recorder.request(client, 'DELETE /api/drafts/{id}', 'DELETE', f"/api/drafts/{draft_id}")
+
+
+SCENARIOS = {
+    'load': scenario_load,
+    'process': scenario_process,
+    'chat': scenario_chat,
+    'stream': scenario_stream,
+    'drafts': scenario_drafts,
+}
+
+
+async def measure_loop_lag(samples, stop, interval=0.01):
+    """Record how late a fixed-interval sleep wakes up while the test runs"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+async def run(app, args, ctx):
+    import httpx
+    
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    lag = []
+    stop = asyncio.Event()
+    tasks = set()
+    offered = 0
+    dropped = 0
+    
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', timeout=None) as client:
+        lag_task = asyncio.create_task(measure_loop_lag(lag, stop))
+        started = time.perf_counter()
+        deadline = started + args.duration
+        
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(random.expovariate(args.rate))
+            offered += 1
+            if len(tasks) >= args.max_in_flight:
+                dropped += 1
+                continue
+            scenario = SCENARIOS[random.choices(names, weights)[0]]
+            task = asyncio.create_task(scenario(client, recorder, ctx))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+    
+    return recorder, lag, elapsed, offered, dropped
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def build_report(recorder, lag, elapsed, offered, dropped, args):
+    rows = {}
+    for label, samples in sorted(recorder.latencies.items()):
+        rows[label] = {
+            'count': len(samples),
+            'throughput': round(len(samples) / elapsed, 2),
+            'p50Ms': round(percentile(samples, 50) * 1000, 1),
+            'p95Ms': round(percentile(samples, 95) * 1000, 1),
+            'p99Ms': round(percentile(samples, 99) * 1000, 1),
+            'maxMs': round(max(samples) * 1000, 1),
+            'errorRate': round(recorder.errors[label] / len(samples), 4),
+            'shedRate': round(recorder.shed[label] / len(samples), 4)
+        }
+    total = sum(row['count'] for row in rows.values())
+    return {
+        'backend': args.backend,
+        'durationSeconds': round(elapsed, 2),
+        'offeredRate': args.rate,
+        'scenariosStarted': offered - dropped,
+        'scenariosDropped': dropped,
+        'requests': total,
+        'throughput': round(total / elapsed, 2),
+        'errors': sum(recorder.errors.values()),
+        'shed': sum(recorder.shed.values()),
+        'loopLagMs': {
+            'p50': round(statistics.median(lag) * 1000, 2) if lag else None,
+            'p99': round(percentile(lag, 99) * 1000, 2) if lag else None,
+            'max': round(max(lag) * 1000, 2) if lag else None
+        },
+        'requestTypes': rows
+    }
+
+
+def print_report(report):
+    print(f"\n{'request':<28} {'count':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>6} {'429%':>6}")
+    for label, row in report['requestTypes'].items():
+        print(
+            f"{label:<28} {row['count']:>6} {row['throughput']:>7.1f} {row['p50Ms']:>6.1f}ms {row['p95Ms']:>6.1f}ms "
+            f"{row['p99Ms']:>6.1f}ms {row['maxMs']:>6.1f}ms {row['errorRate'] * 100:>5.1f}% {row['shedRate'] * 100:>5.1f}%"
+        )
+    lag = report['loopLagMs']
+    print(
+        f"\n{report['requests']} requests in {report['durationSeconds']}s ({report['throughput']} req/s), "
+        f"{report['errors']} errors, {report['shed']} shed, {report['scenariosDropped']} scenarios dropped at the in-flight cap"
+    )
+    print(f"Event-loop lag: p50 {lag['p50']}ms, p99 {lag['p99']}ms, max {lag['max']}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rate', type=float, default=50, help='scenario arrivals per second (Poisson)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to generate load')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='scenario weights, e.g. "load=4,chat=3"')
+    parser.add_argument('--backend', choices=('mock', 'fake'), default='mock', help='LLM backend')
+    parser.add_argument('--call-latency', type=float, default=0.4, help='fake backend: seconds per call')
+    parser.add_argument('--token-latency', type=float, default=0.004, help='fake backend: seconds per output token')
+    parser.add_argument('--process-size', type=int, default=10, help='emails per process request')
+    parser.add_argument('--users', type=int, default=5, help='distinct X-User-Id values to spread requests over')
+    parser.add_argument('--max-in-flight', type=int, default=1000, help='scenarios running at once before arrivals are dropped')
+    parser.add_argument('--seed', type=int, default=None, help='random seed for a repeatable mix')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    if args.backend == 'fake':
+        from reprocess_latency import install_simulator
+        install_simulator(args.call_latency, args.token_latency)
+    else:
+        os.environ['MOCK_LLM'] = 'true'
+    
+    import index
+    
+    with open(os.path.join(API_DIR, 'data', 'mock_inbox.json'), 'r', encoding='utf-8') as f:
+        emails = json.load(f)
+    
+    users = [f"load-user-{i}" for i in range(max(1, args.users))]
+    ctx = {
+        'emails': emails,
+        'process_size': args.process_size,
+        'headers': lambda: {'X-User-Id': random.choice(users)}
+    }
+    
+    scratch = tempfile.mkdtemp(prefix='loadtest-')
+    drafts_file = os.path.join(scratch, 'drafts.json')
+    if os.path.exists(index.DRAFTS_FILE):
+        shutil.copyfile(index.DRAFTS_FILE, drafts_file)
+    index.DRAFTS_FILE = drafts_file
+    
+    try:
+        recorder, lag, elapsed, offered, dropped = asyncio.run(run(index.app, args, ctx))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    
+    report = build_report(recorder, lag, elapsed, offered, dropped, args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
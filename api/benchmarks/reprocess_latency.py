@@ -0,0 +1,121 @@
+"""
+Reprocess Latency Benchmark - Per-email latency of each single-email strategy
+
+Runs process_email over the sample inbox with every strategy in
+REPROCESS_STRATEGIES and reports median and p95 latency, split by whether
+the email needed action items, plus upstream calls per email (parallel
+pays for a discarded call on emails that need no action items).
+
+By default the Gemini SDK is replaced with a stub that sleeps a fixed
+per-call latency plus a per-output-token cost, so results show the shape
+of each strategy without an API key. --live calls the real API.
+
+Usage:
+    python api/benchmarks/reprocess_latency.py [--rounds 3] [--call-latency 0.4] [--token-latency 0.004] [--live]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class SimulatedModel:
+    """GenerativeModel stand-in answering from the local mock with simulated latency"""
+    
+    calls = 0
+    _lock = threading.Lock()
+    
+    def __init__(self, mock, call_latency, token_latency):
+        self.mock = mock
+        self.call_latency = call_latency
+        self.token_latency = token_latency
+    
+    def generate_content(self, contents, stream=False, **options):
+        with SimulatedModel._lock:
+            SimulatedModel.calls += 1
+        if options.get('generation_config') or 'Respond ONLY with valid JSON' in contents:
+            text = json.dumps(self.mock._mock_generate_json(contents))
+        else:
+            text = self.mock._mock_generate_text(contents)
+        
+        tokens = max(1, len(text) // 4)
+        time.sleep(self.call_latency * random.uniform(0.8, 1.2) + tokens * self.token_latency)
+        return iter([_Chunk(text)]) if stream else _Chunk(text)
+
+
+def install_simulator(call_latency, token_latency):
+    """Route GeminiService through SimulatedModel instead of the SDK"""
+    from services import llm_service
+    
+    os.environ['GEMINI_API_KEY'] = os.environ.get('GEMINI_API_KEY') or 'simulated'
+    os.environ['MOCK_LLM'] = 'false'
+    os.environ['HEDGE_ENABLED'] = 'false'
+    mock = llm_service.GeminiService.__new__(llm_service.GeminiService)
+    
+    class SimulatedSDK:
+        @staticmethod
+        def GenerativeModel(name):
+            return SimulatedModel(mock, call_latency, token_latency)
+    
+    llm_service.load_genai = lambda api_key: SimulatedSDK
+    llm_service.hedger.enabled = False
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=3, help='passes over the sample inbox per strategy')
+    parser.add_argument('--call-latency', type=float, default=0.4, help='simulated seconds per call')
+    parser.add_argument('--token-latency', type=float, default=0.004, help='simulated seconds per output token')
+    parser.add_argument('--live', action='store_true', help='call the real Gemini API')
+    args = parser.parse_args()
+    
+    if not args.live:
+        install_simulator(args.call_latency, args.token_latency)
+    
+    from services.email_processor import process_email, REPROCESS_STRATEGIES
+    from services.prompt_registry import prompt_registry
+    
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    with open(os.path.join(data_dir, 'mock_inbox.json'), 'r', encoding='utf-8') as f:
+        emails = json.load(f)
+    prompts = prompt_registry.resolve()
+    
+    print(f"{'strategy':<11} {'actionable p50':>15} {'p95':>8} {'other p50':>10} {'p95':>8} {'calls/email':>12}")
+    for strategy in REPROCESS_STRATEGIES:
+        actionable, other = [], []
+        calls_before = SimulatedModel.calls
+        for _ in range(args.rounds):
+            for email in emails:
+                started = time.perf_counter()
+                result = process_email(email, prompts, strategy)
+                elapsed = (time.perf_counter() - started) * 1000
+                (actionable if result['category'] in ('Important', 'To-Do') else other).append(elapsed)
+        
+        # Let discarded speculative calls finish so they are counted
+        time.sleep(args.call_latency * 2 if not args.live else 0)
+        calls = (SimulatedModel.calls - calls_before) / (args.rounds * len(emails)) if not args.live else float('nan')
+        row = [strategy]
+        for samples in (actionable, other):
+            row += [statistics.median(samples), percentile(samples, 95)] if samples else [float('nan')] * 2
+        print(f"{row[0]:<11} {row[1]:>13.0f}ms {row[2]:>6.0f}ms {row[3]:>8.0f}ms {row[4]:>6.0f}ms {calls:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
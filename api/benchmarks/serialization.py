@@ -0,0 +1,85 @@
+"""
+Serialization Benchmark - Encode time and payload size for large inbox responses
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json) with
+FastJSONResponse, and gzip/brotli against the uncompressed body. The
+payload cycles through the 15 sample emails, so compression ratios are
+better than a real inbox would get; encode times are representative.
+
+Usage:
+    python api/benchmarks/serialization.py [--count 10000] [--repeat 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from services import responses
+from services.responses import dumps, compress
+
+
+def build_payload(count):
+    """Inbox-load style payload with processed results, built from the sample inbox"""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    with open(os.path.join(data_dir, 'mock_inbox.json'), 'r', encoding='utf-8') as f:
+        sample = json.load(f)
+    
+    emails = []
+    for i in range(count):
+        email = dict(sample[i % len(sample)])
+        email['id'] = f"email-{i:06d}"
+        email['category'] = 'To-Do'
+        email['actionItems'] = [{'task': 'Review agenda and prepare materials', 'deadline': 'none', 'priority': 'high'}]
+        emails.append(email)
+    return {'success': True, 'emails': emails, 'count': len(emails)}
+
+
+def best_of(repeat, fn):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def default_fastapi_encode(payload):
+    """What a plain `return dict` endpoint costs: jsonable_encoder, then JSONResponse.render"""
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--count', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    
+    payload = build_payload(args.count)
+    print(f"Payload: {args.count:,} emails (orjson {'available' if responses.orjson else 'NOT installed'}, "
+          f"brotli {'available' if responses.brotli else 'NOT installed'})\n")
+    
+    baseline, baseline_time = best_of(args.repeat, lambda: default_fastapi_encode(payload))
+    fast, fast_time = best_of(args.repeat, lambda: dumps(payload))
+    assert json.loads(fast) == json.loads(baseline)
+    
+    print("Encode")
+    print(f"  jsonable_encoder + json   {baseline_time * 1000:>9.1f} ms")
+    print(f"  FastJSONResponse          {fast_time * 1000:>9.1f} ms  ({baseline_time / fast_time:.1f}x faster)\n")
+    
+    print("Wire size")
+    print(f"  identity                  {len(fast) / 1024:>9.1f} KiB")
+    codecs = ['gzip'] + (['br'] if responses.brotli else [])
+    for codec in codecs:
+        body, elapsed = best_of(args.repeat, lambda: compress(fast, codec))
+        print(f"  {codec:<24}  {len(body) / 1024:>9.1f} KiB  ({len(body) / len(fast):.1%} of identity, {elapsed * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
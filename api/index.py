@@ -1,18 +1,48 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import json
+import asyncio
 import os
+import time
+import threading
 
 # Import services with absolute imports for Vercel compatibility
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
 
-from services.email_processor import process_emails_batch
-from services.chat_service import process_chat_query
+# Local development reads settings from a .env file before the services
+# load them; deployments set the environment directly and skip dotenv
+for _env_file in (os.path.join(os.path.dirname(__file__), '.env'), os.path.join(os.path.dirname(__file__), '..', '.env')):
+    if os.path.exists(_env_file):
+        from dotenv import load_dotenv
+        load_dotenv(_env_file)
+        break
 
-app = FastAPI()
+from services.email_processor import process_emails_batch, process_email, REPROCESS_STRATEGIES, REPROCESS_STRATEGY
+from services.chat_service import process_chat_query, stream_chat_query, generate_drafts_batch, schedule_precompute
+from services.job_queue import job_queue
+from services.scheduler import scheduler
+from services.inbox_sync import inbox_sync
+from services.mail_import import iter_mail_archive, iter_email_batches, resolve_import_path, IMPORT_BATCH_SIZE
+from services.responses import FastJSONResponse, ClosingStreamingResponse, CompressionMiddleware
+from services.precompute import precomputer, PRECOMPUTE_ENABLED
+from services.prompt_registry import prompt_registry, PROMPT_TYPES
+from services.llm_service import model_router
+from services.hedging import hedger
+from services.context_cache import context_cache
+from services.admission import admission, AdmissionRejected
+from services.tenancy import TenantMiddleware, fair_share
+from services.change_log import change_log, CHANGES_PAGE_SIZE
+from services.batch_reclassify import batch_reclassifier
+from services.log import get_logger, log_pipeline, RequestIdMiddleware
+
+app = FastAPI(default_response_class=FastJSONResponse)
+
+logger = get_logger(__name__)
 
 # CORS Configuration
 app.add_middleware(
@@ -23,19 +53,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Brotli/gzip for large JSON payloads; streamed responses pass through
+app.add_middleware(CompressionMiddleware)
+
+# Request IDs for log correlation, plus one access record per request
+app.add_middleware(RequestIdMiddleware)
+
+# Attributes each request's LLM calls to a tenant for fair sharing
+app.add_middleware(TenantMiddleware)
+
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
 DRAFTS_FILE = os.path.join(DATA_DIR, 'drafts.json')
 
+# Serializes read-modify-write of the drafts file across worker threads
+_drafts_lock = threading.Lock()
+
+# Seconds between keep-alive comments on an idle /api/changes/stream
+CHANGES_HEARTBEAT = float(os.getenv('CHANGES_HEARTBEAT', '15'))
+# Seconds before re-reading a change whose data failed to load
+CHANGES_RETRY_DELAY = float(os.getenv('CHANGES_RETRY_DELAY', '1'))
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """Shed load with 429 and a Retry-After hint instead of queueing without bound"""
+    return FastJSONResponse(
+        status_code=429,
+        content={'success': False, 'error': str(exc), 'retryAfter': exc.retry_after},
+        headers={'Retry-After': str(exc.retry_after)}
+    )
+
 # Pydantic models
 class EmailProcessRequest(BaseModel):
     emails: List[Dict[str, Any]]
-    prompts: Dict[str, Any]
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    precompute: Optional[bool] = None
+
+class ReprocessRequest(BaseModel):
+    email: Dict[str, Any]
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    strategy: Optional[str] = None
 
 class ChatQueryRequest(BaseModel):
     query: str
     emailId: Optional[str] = None
     emails: Optional[List[Dict[str, Any]]] = None
     prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+
+class ImportRequest(BaseModel):
+    path: str
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    batchSize: Optional[int] = None
+
+class SyncRequest(BaseModel):
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    pollInterval: Optional[float] = None
+
+class BulkDraftRequest(BaseModel):
+    emails: List[Dict[str, Any]]
+    emailIds: Optional[List[str]] = None
+    category: Optional[str] = None
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    instruction: Optional[str] = None
+
+class BatchReclassifyRequest(BaseModel):
+    emailIds: Optional[List[str]] = None
+    prompts: Optional[Dict[str, Any]] = None
+    promptVersions: Optional[Dict[str, str]] = None
+    backend: Optional[str] = None
+    extractActions: Optional[bool] = None
+
+class PromptVersionRequest(BaseModel):
+    prompt: str
+    name: Optional[str] = None
+    description: Optional[str] = None
 
 class DraftRequest(BaseModel):
     id: Optional[str] = None
@@ -75,7 +171,7 @@ async def get_mock_inbox():
     try:
         with open(os.path.join(DATA_DIR, 'mock_inbox.json'), 'r', encoding='utf-8') as f:
             data = json.load(f)
-        return data
+        return FastJSONResponse(data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -84,11 +180,11 @@ async def load_emails():
     try:
         with open(os.path.join(DATA_DIR, 'mock_inbox.json'), 'r', encoding='utf-8') as f:
             emails = json.load(f)
-        return {
+        return FastJSONResponse({
             'success': True,
             'emails': emails,
             'count': len(emails)
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
 
@@ -96,72 +192,550 @@ async def load_emails():
 async def process_emails(request: EmailProcessRequest):
     """
     Process emails with LLM categorization and action extraction
+    
+    Admitted through the 'batch' limiter; the LLM work runs in the
+    threadpool so it never blocks the event loop.
     """
-    try:
-        if not request.emails:
-            raise HTTPException(status_code=400, detail={'success': False, 'error': 'No emails provided'})
+    if not request.emails:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'No emails provided'})
+    
+    prompts = _resolve_prompts(request)
+    
+    async with admission['batch'].slot():
+        try:
+            result = await run_in_threadpool(process_emails_batch, request.emails, prompts)
+            scheduler.history.record(request.emails, result['results'])
+            
+            if _precompute_requested(request):
+                schedule_precompute(request.emails, result['results'], prompts)
+            
+            return FastJSONResponse(result)
         
-        result = process_emails_batch(request.emails, request.prompts)
-        return result
+        except Exception as e:
+            logger.error("Error in process_emails endpoint: %s", e)
+            raise HTTPException(status_code=500, detail={
+                'success': False,
+                'error': str(e)
+            })
+
+@app.post("/api/emails/reprocess")
+async def reprocess_email(request: ReprocessRequest):
+    """
+    Re-run categorization and action extraction for one email
     
-    except Exception as e:
-        print(f"Error in process_emails endpoint: {e}")
-        raise HTTPException(status_code=500, detail={
+    The strategy defaults to REPROCESS_STRATEGY ('parallel': both calls at
+    once, action items discarded unless the email is Important/To-Do).
+    Admitted through the 'interactive' limiter since a user is waiting.
+    """
+    strategy = request.strategy or REPROCESS_STRATEGY
+    if strategy not in REPROCESS_STRATEGIES:
+        raise HTTPException(status_code=400, detail={
             'success': False,
-            'error': str(e)
+            'error': f"Unknown strategy '{strategy}'; expected one of {', '.join(REPROCESS_STRATEGIES)}"
         })
+    
+    prompts = _resolve_prompts(request)
+    
+    async with admission['interactive'].slot():
+        try:
+            started = time.perf_counter()
+            result = await run_in_threadpool(process_email, request.email, prompts, strategy)
+            elapsed = time.perf_counter() - started
+            scheduler.history.record([request.email], [result])
+            
+            return {
+                'success': result['error'] is None,
+                'strategy': strategy,
+                'result': result,
+                'elapsedMs': round(elapsed * 1000, 1)
+            }
+        
+        except Exception as e:
+            logger.error("Error in reprocess_email endpoint: %s", e)
+            raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.post("/api/jobs/process", status_code=202)
+async def submit_process_job(request: EmailProcessRequest):
+    """
+    Queue emails for background processing and return a job ID immediately
+    """
+    if not request.emails:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'No emails provided'})
+    
+    prompts = _resolve_prompts(request)
+    
+    try:
+        on_results = None
+        if _precompute_requested(request):
+            emails_by_id = {e.get('id'): e for e in request.emails}
+            on_results = lambda results: schedule_precompute(
+                [emails_by_id[r['id']] for r in results if r.get('id') in emails_by_id],
+                results,
+                prompts
+            )
+        
+        job = job_queue.submit(request.emails, prompts, on_results=on_results)
+        return {
+            'success': True,
+            **job.to_dict(include_results=False)
+        }
+    except Exception as e:
+        logger.error("Error in submit_process_job endpoint: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.post("/api/emails/import", status_code=202)
+async def import_emails(request: ImportRequest):
+    """
+    Stream an mbox file or .eml directory into the processing pipeline
+    
+    The archive is read lazily in bounded batches by a background job, so
+    memory use does not grow with the archive size.
+    """
+    try:
+        path = resolve_import_path(request.path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': str(e)})
+    
+    prompts = _resolve_prompts(request)
+    
+    try:
+        batch_size = max(1, request.batchSize or IMPORT_BATCH_SIZE)
+        job = job_queue.submit_chunks(
+            iter_email_batches(iter_mail_archive(path), batch_size),
+            prompts
+        )
+        return {
+            'success': True,
+            **job.to_dict(include_results=False)
+        }
+    except Exception as e:
+        logger.error("Error in import_emails endpoint: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """List retained jobs without their results"""
+    jobs = [job.to_dict(include_results=False) for job in job_queue.list()]
+    return {
+        'success': True,
+        'jobs': jobs,
+        'count': len(jobs),
+        'scheduler': scheduler.status()
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, includeResults: bool = True):
+    """Get job status, progress and the results processed so far"""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Job not found'})
+    
+    return FastJSONResponse({
+        'success': True,
+        **job.to_dict(include_results=includeResults)
+    })
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Job not found'})
+    
+    return {
+        'success': True,
+        'message': 'Cancellation requested',
+        **job.to_dict(include_results=False)
+    }
+
+@app.post("/api/batch/reclassify", status_code=202)
+async def start_batch_reclassify(request: BatchReclassifyRequest):
+    """
+    Recategorize the synced inbox offline through batch prediction
+    
+    Meant for backfills after a prompt edit: the work is written as a
+    batch file and run asynchronously (BATCH_BACKEND 'local' or 'genai'),
+    off the interactive path, and results are applied to the inbox as
+    they come back. Returns a batch ID immediately.
+    """
+    prompts = _resolve_prompts(request)
+    extract_actions = request.extractActions if request.extractActions is not None else True
+    
+    try:
+        run = await run_in_threadpool(
+            batch_reclassifier.start, prompts, request.emailIds, request.backend, extract_actions
+        )
+        return {
+            'success': True,
+            **run
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': str(e)})
+    except Exception as e:
+        logger.error("Error in start_batch_reclassify endpoint: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.get("/api/batch/jobs")
+async def list_batch_jobs():
+    """List bulk reclassification runs, newest first"""
+    runs = await run_in_threadpool(batch_reclassifier.list)
+    return {
+        'success': True,
+        'jobs': runs,
+        'count': len(runs)
+    }
+
+@app.get("/api/batch/jobs/{batch_id}")
+async def get_batch_job(batch_id: str):
+    """Get a bulk reclassification run's phase, progress and applied counts"""
+    run = await run_in_threadpool(batch_reclassifier.get, batch_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Batch job not found'})
+    
+    return {
+        'success': True,
+        **run
+    }
+
+@app.post("/api/batch/resume")
+async def resume_batch_jobs(batchId: Optional[str] = None):
+    """Resume one unfinished run (or all of them), e.g. after a restart"""
+    resumed = await run_in_threadpool(batch_reclassifier.resume, batchId)
+    return {
+        'success': True,
+        'resumed': resumed,
+        'count': len(resumed)
+    }
+
+@app.delete("/api/batch/jobs/{batch_id}")
+async def cancel_batch_job(batch_id: str):
+    """Cancel a run; results applied so far are kept"""
+    run = await run_in_threadpool(batch_reclassifier.cancel, batch_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Batch job not found'})
+    
+    return {
+        'success': True,
+        'message': 'Cancellation requested',
+        **run
+    }
+
+@app.post("/api/sync/start")
+async def start_sync(request: SyncRequest):
+    """Start watching the inbox source and processing new or modified mail"""
+    prompts = _resolve_prompts(request)
+    
+    try:
+        inbox_sync.start(prompts, request.pollInterval)
+        return {
+            'success': True,
+            **inbox_sync.status()
+        }
+    except Exception as e:
+        logger.error("Error starting inbox sync: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.post("/api/sync/stop")
+async def stop_sync():
+    """Stop watching the inbox source"""
+    inbox_sync.stop()
+    return {
+        'success': True,
+        **inbox_sync.status()
+    }
+
+@app.post("/api/sync/scan")
+async def scan_sync(request: SyncRequest):
+    """Check the inbox source once and queue only new or modified mail"""
+    explicit = request.prompts or request.promptVersions
+    prompts = _resolve_prompts(request) if explicit or not inbox_sync.prompts else inbox_sync.prompts
+    
+    try:
+        changes = await run_in_threadpool(inbox_sync.scan, prompts)
+        return {
+            'success': True,
+            'changes': changes,
+            **inbox_sync.status()
+        }
+    except Exception as e:
+        logger.error("Error scanning inbox source: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.get("/api/sync/status")
+async def sync_status():
+    """Get watcher state and sync progress"""
+    return {
+        'success': True,
+        **inbox_sync.status()
+    }
+
+@app.get("/api/sync/inbox")
+async def sync_inbox():
+    """
+    Get the continuously processed inbox
+    
+    The version is read before the snapshot, so applying /api/changes
+    from it afterwards may repeat a change but never misses one.
+    """
+    version = change_log.version
+    emails = inbox_sync.inbox()
+    return FastJSONResponse({
+        'success': True,
+        'emails': emails,
+        'count': len(emails),
+        'epoch': change_log.epoch,
+        'version': version
+    })
+
+@app.get("/api/changes")
+async def get_changes(since: int = 0, epoch: Optional[str] = None, kinds: Optional[str] = None, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Get inbox and draft changes after a version
+    
+    Returns inserts, updates and deletes (latest state per record, oldest
+    first) and the version to pass as `since` next time. 'reset' means the
+    client must reload /api/sync/inbox and /api/drafts, e.g. after a
+    server restart (new epoch) or once old deletes have been compacted.
+    """
+    kind_list = [kind for kind in (kinds or '').split(',') if kind]
+    result = await run_in_threadpool(change_log.changes, since, epoch, kind_list, max(1, min(limit, CHANGES_PAGE_SIZE)))
+    return FastJSONResponse({
+        'success': True,
+        **result
+    })
+
+@app.get("/api/changes/stream")
+async def stream_changes(request: Request, since: int = 0, epoch: Optional[str] = None, kinds: Optional[str] = None):
+    """
+    Push changes as Server-Sent Events
+    
+    Emits a 'changes' event (same payload as /api/changes) whenever
+    something changes after `since`, a keep-alive comment while idle, and
+    a final 'reset' event if the client has to reload.
+    """
+    kind_list = [kind for kind in (kinds or '').split(',') if kind]
+    
+    async def event_stream():
+        version = since
+        client_epoch = epoch
+        while not await request.is_disconnected():
+            if not await change_log.wait(version, CHANGES_HEARTBEAT):
+                yield ': keep-alive\n\n'
+                continue
+            
+            result = await run_in_threadpool(change_log.changes, version, client_epoch, kind_list)
+            if result['reset']:
+                yield _sse_event('reset', result)
+                return
+            if result['changes']:
+                yield _sse_event('changes', result)
+            elif result['version'] == version:
+                # A loader failed on the next change; retry it after a pause
+                await asyncio.sleep(CHANGES_RETRY_DELAY)
+            version, client_epoch = result['version'], result['epoch']
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.post("/api/chat/query")
 async def chat_query(request: ChatQueryRequest):
     """
     Process a chat query from the user
     """
-    try:
-        if not request.query:
-            raise HTTPException(status_code=400, detail={'success': False, 'error': 'No query provided'})
-        
-        email = None
-        if request.emailId and request.emails:
-            email = next((e for e in request.emails if e.get('id') == request.emailId), None)
-        
+    if not request.query:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'No query provided'})
+    
+    prompts = _resolve_prompts(request)
+    
+    email = None
+    if request.emailId and request.emails:
+        email = next((e for e in request.emails if e.get('id') == request.emailId), None)
+    
+    def answer():
         result = process_chat_query(
             request.query,
             email,
             request.emails or [],
-            request.prompts or {}
+            prompts
         )
         
         if result.get('draft'):
-            draft = result['draft']
-            _save_draft(draft)
+            _save_draft(result['draft'])
         
         return result
     
+    async with admission['interactive'].slot():
+        try:
+            return await run_in_threadpool(answer)
+        
+        except Exception as e:
+            logger.error("Error in chat_query endpoint: %s", e)
+            raise HTTPException(status_code=500, detail={
+                'success': False,
+                'error': str(e),
+                'response': 'An error occurred processing your request.'
+            })
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatQueryRequest):
+    """
+    Process a chat query, streaming the response as Server-Sent Events
+    
+    Emits 'token' events while the LLM is generating and a final 'done'
+    event with the same payload as /api/chat/query. Drafts are saved once
+    the stream has finished.
+    """
+    if not request.query:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'No query provided'})
+    
+    email = None
+    if request.emailId and request.emails:
+        email = next((e for e in request.emails if e.get('id') == request.emailId), None)
+    
+    prompts = _resolve_prompts(request)
+    
+    # The slot is held until the stream ends, not just until it starts, and
+    # is given back even if the body is never iterated
+    slot = await admission['interactive'].hold()
+    
+    def event_stream():
+        try:
+            for event in stream_chat_query(
+                request.query,
+                email,
+                request.emails or [],
+                prompts
+            ):
+                event_type = event.pop('type')
+                if event_type == 'done' and event.get('draft'):
+                    _save_draft(event['draft'])
+                yield _sse_event(event_type, event)
+        except Exception as e:
+            logger.error("Error in chat_stream endpoint: %s", e)
+            yield _sse_event('error', {
+                'success': False,
+                'error': str(e),
+                'response': 'An error occurred processing your request.'
+            })
+    
+    try:
+        return ClosingStreamingResponse(
+            event_stream(),
+            on_close=slot.release,
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception:
+        slot.release()
+        raise
+
+@app.get("/api/prompts")
+async def get_prompts():
+    """Get the latest version of every prompt type"""
+    try:
+        return {
+            'success': True,
+            'prompts': prompt_registry.resolve()
+        }
     except Exception as e:
-        print(f"Error in chat_query endpoint: {e}")
-        raise HTTPException(status_code=500, detail={
-            'success': False,
-            'error': str(e),
-            'response': 'An error occurred processing your request.'
-        })
+        logger.error("Error loading prompts: %s", e)
+        raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
+@app.get("/api/prompts/{prompt_type}/versions")
+async def get_prompt_versions(prompt_type: str):
+    """Get the version history of one prompt type, oldest first"""
+    if prompt_type not in PROMPT_TYPES:
+        raise HTTPException(status_code=404, detail={'success': False, 'error': 'Unknown prompt type'})
+    
+    versions = prompt_registry.versions(prompt_type)
+    return {
+        'success': True,
+        'type': prompt_type,
+        'versions': [v.to_dict() for v in versions],
+        'count': len(versions)
+    }
+
+@app.post("/api/prompts/{prompt_type}")
+async def save_prompt_version(prompt_type: str, request: PromptVersionRequest):
+    """
+    Save an edited prompt as a new version
+    
+    Versions are identified by a hash of the prompt text, so saving
+    unchanged text returns the existing version.
+    """
+    try:
+        version = await run_in_threadpool(prompt_registry.create, prompt_type, request.prompt, request.name, request.description)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': str(e)})
+    
+    return {
+        'success': True,
+        'type': prompt_type,
+        'prompt': version.to_dict()
+    }
+
+@app.get("/api/models")
+async def model_routes():
+    """Get model routing, overload state, hedging and context cache metrics"""
+    return {
+        'success': True,
+        **model_router.status(),
+        'hedging': hedger.status(),
+        'contextCache': context_cache.status()
+    }
+
+@app.get("/api/admission")
+async def admission_status():
+    """Get concurrency, queue depth and shed counts per endpoint class"""
+    return {
+        'success': True,
+        'classes': {name: limiter.status() for name, limiter in admission.items()}
+    }
+
+@app.get("/api/tenants")
+async def tenant_usage():
+    """Get shared LLM slot usage and per-tenant queueing and usage accounting"""
+    return {
+        'success': True,
+        **fair_share.status()
+    }
+
+@app.get("/api/logging")
+async def logging_status():
+    """Get log level, format, queue depth and records dropped at a full queue"""
+    return {
+        'success': True,
+        **log_pipeline.status()
+    }
+
+@app.get("/api/precompute/status")
+async def precompute_status():
+    """Get background precompute queue and cache statistics"""
+    return {
+        'success': True,
+        'enabled': PRECOMPUTE_ENABLED,
+        **precomputer.status()
+    }
 
 @app.get("/api/drafts")
 async def get_drafts():
     """Get all saved drafts"""
     try:
-        if os.path.exists(DRAFTS_FILE):
-            with open(DRAFTS_FILE, 'r', encoding='utf-8') as f:
-                drafts = json.load(f)
-        else:
-            drafts = []
+        version = change_log.version
+        drafts = await run_in_threadpool(_read_drafts)
         
-        return {
+        return FastJSONResponse({
             'success': True,
             'drafts': drafts,
-            'count': len(drafts)
-        }
+            'count': len(drafts),
+            'epoch': change_log.epoch,
+            'version': version
+        })
     except Exception as e:
-        print(f"Error loading drafts: {e}")
+        logger.error("Error loading drafts: %s", e)
         raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
 
 @app.post("/api/drafts")
@@ -169,7 +743,7 @@ async def save_draft(draft: DraftRequest):
     """Save a new draft or update existing"""
     try:
         draft_dict = draft.dict()
-        _save_draft(draft_dict)
+        await run_in_threadpool(_save_draft, draft_dict)
         
         return {
             'success': True,
@@ -177,46 +751,132 @@ async def save_draft(draft: DraftRequest):
             'draft': draft_dict
         }
     except Exception as e:
-        print(f"Error saving draft: {e}")
+        logger.error("Error saving draft: %s", e)
         raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
 
+@app.post("/api/drafts/bulk")
+async def bulk_drafts(request: BulkDraftRequest):
+    """
+    Generate and save reply drafts for many emails at once
+    
+    Emails are selected by ID or by category; replies are generated in
+    chunked batch LLM calls and all drafts are saved in one write.
+    """
+    if request.emailIds is None and not request.category:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'Provide emailIds or category'})
+    
+    if request.emailIds is not None:
+        wanted = set(request.emailIds)
+        selected = [e for e in request.emails if e.get('id') in wanted]
+    else:
+        selected = [e for e in request.emails if e.get('category') == request.category]
+    
+    if not selected:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': 'No matching emails'})
+    
+    prompts = _resolve_prompts(request)
+    
+    def generate():
+        result = generate_drafts_batch(selected, prompts, request.instruction or "")
+        _save_drafts(result['drafts'])
+        return result
+    
+    async with admission['batch'].slot():
+        try:
+            result = await run_in_threadpool(generate)
+            
+            return FastJSONResponse({
+                'success': True,
+                'drafts': result['drafts'],
+                'count': len(result['drafts']),
+                'missing': result['missing']
+            })
+        except Exception as e:
+            logger.error("Error in bulk_drafts endpoint: %s", e)
+            raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
+
 @app.delete("/api/drafts/{draft_id}")
 async def delete_draft(draft_id: str):
     """Delete a specific draft"""
     try:
-        if os.path.exists(DRAFTS_FILE):
-            with open(DRAFTS_FILE, 'r', encoding='utf-8') as f:
-                drafts = json.load(f)
-        else:
-            drafts = []
-        
-        drafts = [d for d in drafts if d.get('id') != draft_id]
-        
-        with open(DRAFTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(drafts, f, indent=2)
+        await run_in_threadpool(_delete_draft, draft_id)
         
         return {
             'success': True,
             'message': 'Draft deleted successfully'
         }
     except Exception as e:
-        print(f"Error deleting draft: {e}")
+        logger.error("Error deleting draft: %s", e)
         raise HTTPException(status_code=500, detail={'success': False, 'error': str(e)})
 
-def _save_draft(draft):
-    """Helper function to save a draft to the JSON file"""
+def _precompute_requested(request):
+    """Per-request precompute flag, falling back to PRECOMPUTE_ENABLED"""
+    return PRECOMPUTE_ENABLED if request.precompute is None else request.precompute
+
+def _resolve_prompts(request):
+    """Resolve inline prompts and version references against the prompt registry"""
+    try:
+        return prompt_registry.resolve(request.prompts, request.promptVersions)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail={'success': False, 'error': e.args[0]})
+
+def _read_drafts():
+    """Load all drafts from the JSON file"""
     if os.path.exists(DRAFTS_FILE):
         with open(DRAFTS_FILE, 'r', encoding='utf-8') as f:
-            drafts = json.load(f)
-    else:
-        drafts = []
-    
-    existing_index = next((i for i, d in enumerate(drafts) if d.get('id') == draft.get('id')), None)
-    
-    if existing_index is not None:
-        drafts[existing_index] = draft
-    else:
-        drafts.append(draft)
-    
-    with open(DRAFTS_FILE, 'w', encoding='utf-8') as f:
+            return json.load(f)
+    return []
+
+def _write_drafts(drafts):
+    """Replace the drafts file atomically, so readers never see it half-written"""
+    tmp = DRAFTS_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
         json.dump(drafts, f, indent=2)
+    os.replace(tmp, DRAFTS_FILE)
+
+def _save_draft(draft):
+    """Helper function to save a draft to the JSON file"""
+    _save_drafts([draft])
+
+def _save_drafts(new_drafts):
+    """Insert or update several drafts in a single read-modify-write of the JSON file"""
+    with _drafts_lock:
+        drafts = _read_drafts()
+        index_by_id = {d.get('id'): i for i, d in enumerate(drafts)}
+        
+        for draft in new_drafts:
+            existing_index = index_by_id.get(draft.get('id'))
+            
+            if existing_index is not None:
+                drafts[existing_index] = draft
+            else:
+                index_by_id[draft.get('id')] = len(drafts)
+                drafts.append(draft)
+        
+        _write_drafts(drafts)
+        
+        change_log.record('draft', [draft.get('id') for draft in new_drafts])
+
+def _delete_draft(draft_id):
+    """Remove a draft from the JSON file, recording the deletion for sync"""
+    with _drafts_lock:
+        drafts = _read_drafts()
+        remaining = [d for d in drafts if d.get('id') != draft_id]
+        
+        _write_drafts(remaining)
+        
+        if len(remaining) < len(drafts):
+            change_log.record('draft', [draft_id], deleted=True)
+
+def _drafts_by_id(ids):
+    """Change log loader: current drafts for the given ids"""
+    wanted = set(ids)
+    with _drafts_lock:
+        drafts = _read_drafts()
+    return {d.get('id'): d for d in drafts if d.get('id') in wanted}
+
+change_log.register('draft', _drafts_by_id)
+
+def _sse_event(event_type, data):
+    """Format a Server-Sent Event frame"""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
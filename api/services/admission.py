@@ -0,0 +1,191 @@
+"""
+Admission - Concurrency and queue-depth limits for LLM-bound endpoints
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '15'))
+
+# Endpoint class -> (concurrent requests, queued requests)
+ADMISSION_LIMITS = {
+    'batch': (
+        int(os.getenv('ADMISSION_BATCH_CONCURRENCY', '2')),
+        int(os.getenv('ADMISSION_BATCH_QUEUE', '4'))
+    ),
+    'interactive': (
+        int(os.getenv('ADMISSION_INTERACTIVE_CONCURRENCY', '8')),
+        int(os.getenv('ADMISSION_INTERACTIVE_QUEUE', '16'))
+    )
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed; carries a Retry-After hint in seconds"""
+    
+    def __init__(self, endpoint_class: str, retry_after: int, reason: str):
+        super().__init__(f"{endpoint_class} requests are at capacity ({reason})")
+        self.endpoint_class = endpoint_class
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionLimiter:
+    """
+    Bounded concurrency with a bounded FIFO wait queue
+    
+    Up to max_concurrent requests run at once and up to max_queue wait for
+    a slot. Anything beyond that, or a request still waiting after
+    queue_timeout seconds, is rejected straight away so overload turns into
+    fast 429s instead of every request slowing down together. Slots can be
+    released from any thread (e.g. the end of a streamed response).
+    """
+    
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters: 'deque[asyncio.Future]' = deque()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._avg_hold = 1.0
+    
+    async def acquire(self) -> None:
+        """
+        Wait for a slot
+        
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(self.name, self._retry_after(), 'queue full')
+            future = loop.create_future()
+            self._waiters.append(future)
+        
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(future, max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self.timed_out += 1
+                        if future in self._waiters:
+                            self._waiters.remove(future)
+                        # A wake-up may have been aimed at us just as we gave up
+                        if self.active < self.max_concurrent:
+                            self._wake_next()
+                    raise AdmissionRejected(self.name, self._retry_after(), 'queue wait timed out')
+                
+                with self._lock:
+                    if self.active < self.max_concurrent:
+                        self.active += 1
+                        self.admitted += 1
+                        return
+                    # A new arrival took the slot first; keep our place at the front
+                    future = loop.create_future()
+                    self._waiters.appendleft(future)
+        finally:
+            with self._lock:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+    
+    def release(self, held: float) -> None:
+        """Free a slot held for `held` seconds and wake the next waiter"""
+        with self._lock:
+            self.active -= 1
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            self._wake_next()
+    
+    async def hold(self) -> 'HeldSlot':
+        """
+        Acquire a slot that outlives the current block, e.g. for a stream
+        
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        await self.acquire()
+        return HeldSlot(self)
+    
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block"""
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'active': self.active,
+                'queued': len(self._waiters),
+                'maxConcurrent': self.max_concurrent,
+                'maxQueue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timedOut': self.timed_out,
+                'avgHoldSeconds': round(self._avg_hold, 3)
+            }
+    
+    def _wake_next(self) -> None:
+        """Wake the longest-waiting request (lock held)"""
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.get_loop().call_soon_threadsafe(_wake, future)
+                return
+    
+    def _retry_after(self) -> int:
+        """Seconds until the current queue has likely drained (lock held or racy read)"""
+        backlog = len(self._waiters) + 1
+        return max(1, math.ceil(self._avg_hold * backlog / self.max_concurrent))
+
+
+class HeldSlot:
+    """An acquired admission slot that is given back exactly once"""
+    
+    def __init__(self, limiter: 'AdmissionLimiter'):
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+    
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.limiter.release(time.monotonic() - self.started)
+
+
+admission = {
+    name: AdmissionLimiter(name, concurrency, queue)
+    for name, (concurrency, queue) in ADMISSION_LIMITS.items()
+}
@@ -0,0 +1,677 @@
+"""
+Batch Reclassify - Offline bulk recategorization of the inbox through asynchronous batch prediction
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+from .llm_service import GeminiService, json_generation_config, llm_activity, model_router
+from .json_stream import JsonArrayStreamParser
+from .email_processor import (
+    CATEGORIZATION_COMPACT_TEMPLATE, ACTION_COMPACT_TEMPLATE, CATEGORY_CODES, PRIORITY_CODES,
+    CATEGORY_PAIRS_SCHEMA, ACTION_ITEMS_SCHEMA, render_email_blocks,
+    decode_category_pairs, decode_action_entries
+)
+from .inbox_sync import inbox_sync
+from .tenancy import current_tenant, tenant_context, BATCH
+from .log import get_logger
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+BATCH_DIR = os.getenv('BATCH_DIR', os.path.join(DATA_DIR, 'batch_jobs'))
+# 'local' runs batch files in-process; 'genai' submits them to the Gemini
+# Batch API (requires the google-genai package)
+BATCH_BACKEND = os.getenv('BATCH_BACKEND', 'local')
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '50'))
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', '30'))
+# Result lines applied between manifest checkpoints
+BATCH_CHECKPOINT_EVERY = int(os.getenv('BATCH_CHECKPOINT_EVERY', '20'))
+
+PHASES = ('categorization', 'actionExtraction')
+
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+GENAI_DONE_STATES = {
+    'JOB_STATE_SUCCEEDED': SUCCEEDED,
+    'JOB_STATE_FAILED': FAILED,
+    'JOB_STATE_CANCELLED': FAILED,
+    'JOB_STATE_EXPIRED': FAILED
+}
+
+logger = get_logger(__name__)
+
+
+def phase_paths(job_dir: str, phase: str) -> Tuple[str, str, str]:
+    """Chunk index, request file and result file of one phase"""
+    return (
+        os.path.join(job_dir, f"chunks_{phase}.jsonl"),
+        os.path.join(job_dir, f"requests_{phase}.jsonl"),
+        os.path.join(job_dir, f"results_{phase}.jsonl")
+    )
+
+
+def batch_request(text: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """One GenerateContentRequest in batch-file form"""
+    return {
+        'contents': [{'role': 'user', 'parts': [{'text': text}]}],
+        'generation_config': json_generation_config(schema)
+    }
+
+
+def response_text(line: Dict[str, Any]) -> Optional[str]:
+    """Text of a batch result line, or None if the request failed"""
+    if line.get('error'):
+        return None
+    candidates = (line.get('response') or {}).get('candidates') or []
+    if not candidates:
+        return None
+    parts = (candidates[0].get('content') or {}).get('parts') or []
+    return ''.join(part.get('text', '') for part in parts if isinstance(part, dict))
+
+
+def parse_json_array(text: str) -> Optional[List[Any]]:
+    """Every well-formed element of a JSON array response, or None if it has no array"""
+    parser = JsonArrayStreamParser()
+    elements = parser.feed(text)
+    elements.extend(parser.close())
+    if not elements and not parser.finished and not parser.dropped:
+        return None
+    return elements
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    """Parsed lines of a JSONL file, skipping a torn last line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def _write_json_atomic(path: str, data: Any) -> None:
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class LocalBatchBackend:
+    """
+    In-process stand-in for a provider batch API
+    
+    Runs each request of a batch file through GeminiService (mock or live)
+    in a background thread, in the batch lane and outside the foreground
+    activity count, appending result lines in the provider's output
+    format. Requests whose key already has a result line are skipped, so
+    a run interrupted by a restart picks up where it stopped.
+    """
+    
+    name = 'local'
+    
+    def __init__(self):
+        self._runs: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+        self._lock = threading.Lock()
+    
+    def submit(self, job_dir: str, phase: str, model: str, tenant: str) -> str:
+        handle = f"{job_dir}::{phase}"
+        self._start(handle, job_dir, phase, tenant)
+        return handle
+    
+    def poll(self, handle: str, tenant: str) -> str:
+        job_dir, phase = handle.split('::', 1)
+        _, _, results_path = phase_paths(job_dir, phase)
+        if os.path.exists(results_path + '.done'):
+            return SUCCEEDED
+        # Not finished and not running: the process restarted mid-run
+        self._start(handle, job_dir, phase, tenant)
+        return RUNNING
+    
+    def fetch(self, handle: str, results_path: str) -> None:
+        """Results are written in place as requests complete"""
+    
+    def cancel(self, handle: str) -> None:
+        with self._lock:
+            run = self._runs.get(handle)
+        if run is not None:
+            run[1].set()
+    
+    def _start(self, handle: str, job_dir: str, phase: str, tenant: str) -> None:
+        with self._lock:
+            run = self._runs.get(handle)
+            if run is not None and run[0].is_alive():
+                return
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._run, args=(job_dir, phase, tenant, stop),
+                name=f"batch-local-{phase}", daemon=True
+            )
+            self._runs[handle] = (thread, stop)
+            thread.start()
+    
+    def _run(self, job_dir: str, phase: str, tenant: str, stop: threading.Event) -> None:
+        _, requests_path, results_path = phase_paths(job_dir, phase)
+        done = {line.get('key') for line in iter_jsonl(results_path)}
+        service = GeminiService(phase)
+        
+        with open(results_path, 'a', encoding='utf-8') as out, \
+                tenant_context(tenant, BATCH), llm_activity.background():
+            for line in iter_jsonl(requests_path):
+                if stop.is_set():
+                    return
+                if line['key'] in done:
+                    continue
+                
+                request = line['request']
+                text = request['contents'][0]['parts'][0]['text']
+                schema = (request.get('generation_config') or {}).get('response_schema')
+                try:
+                    elements = list(service.iter_json(text, schema=schema))
+                    result = {'key': line['key'], 'response': {
+                        'candidates': [{'content': {'parts': [{'text': json.dumps(elements)}]}}]
+                    }}
+                except Exception as e:
+                    result = {'key': line['key'], 'error': {'message': str(e)}}
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+        
+        open(results_path + '.done', 'w').close()
+
+
+def load_batch_client(api_key: str):
+    """Create a google-genai client; the package is only needed for this backend"""
+    try:
+        from google import genai
+    except ImportError:
+        raise RuntimeError("BATCH_BACKEND=genai requires the google-genai package (pip install google-genai)")
+    return genai.Client(api_key=api_key)
+
+
+class GenAIBatchBackend:
+    """
+    Gemini Batch API: the request file is uploaded and run asynchronously
+    at batch pricing, outside the interactive rate limits
+    """
+    
+    name = 'genai'
+    
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+    
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                api_key = os.getenv('GEMINI_API_KEY')
+                if not api_key:
+                    raise RuntimeError("GEMINI_API_KEY is required for BATCH_BACKEND=genai")
+                self._client = load_batch_client(api_key)
+            return self._client
+    
+    def submit(self, job_dir: str, phase: str, model: str, tenant: str) -> str:
+        _, requests_path, _ = phase_paths(job_dir, phase)
+        display_name = f"{os.path.basename(job_dir)}-{phase}"
+        uploaded = self.client.files.upload(
+            file=requests_path,
+            config={'display_name': display_name, 'mime_type': 'jsonl'}
+        )
+        job = self.client.batches.create(model=model, src=uploaded.name, config={'display_name': display_name})
+        logger.info("Submitted batch", extra={'batch': job.name, 'displayName': display_name})
+        return job.name
+    
+    def poll(self, handle: str, tenant: str) -> str:
+        job = self.client.batches.get(name=handle)
+        return GENAI_DONE_STATES.get(job.state.name, RUNNING)
+    
+    def fetch(self, handle: str, results_path: str) -> None:
+        job = self.client.batches.get(name=handle)
+        content = self.client.files.download(file=job.dest.file_name)
+        tmp = results_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, results_path)
+    
+    def cancel(self, handle: str) -> None:
+        self.client.batches.cancel(name=handle)
+
+
+BACKENDS = {
+    LocalBatchBackend.name: LocalBatchBackend,
+    GenAIBatchBackend.name: GenAIBatchBackend
+}
+
+
+class BatchReclassifier:
+    """
+    Bulk recategorization runs driven through batch prediction files
+    
+    A run writes the inbox as compact, schema-constrained categorization
+    requests (BATCH_CHUNK_SIZE emails each) to a JSONL batch file, submits
+    it, polls until the backend is done, then streams the result lines
+    into the inbox store. A second phase does the same for action items of
+    emails that are now Important/To-Do but have none. Everything a run
+    needs is kept in its directory under BATCH_DIR, with a manifest
+    checkpointed as results are applied, so resume() continues a run after
+    a restart; result lines applied twice are harmless.
+    """
+    
+    def __init__(
+        self,
+        directory: str = BATCH_DIR,
+        backend: str = BATCH_BACKEND,
+        chunk_size: int = BATCH_CHUNK_SIZE,
+        poll_interval: float = BATCH_POLL_INTERVAL
+    ):
+        self.directory = directory
+        self.default_backend = backend
+        self.chunk_size = max(1, chunk_size)
+        self.poll_interval = poll_interval
+        self._backends: Dict[str, Any] = {}
+        self._drivers: Dict[str, Tuple[threading.Thread, threading.Event]] = {}
+        self._lock = threading.Lock()
+        # Serializes manifest writes between drivers and cancel()
+        self._manifest_lock = threading.Lock()
+    
+    def start(
+        self,
+        prompts: Dict[str, Any],
+        email_ids: Optional[List[str]] = None,
+        backend: Optional[str] = None,
+        extract_actions: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Start a bulk run over the inbox (or some of its emails)
+        
+        Args:
+            prompts: Dictionary containing prompt objects
+            email_ids: Emails to reclassify; defaults to the whole inbox
+            backend: 'local' or 'genai'; defaults to BATCH_BACKEND
+            extract_actions: Also extract action items for emails that
+                become Important/To-Do
+        
+        Returns:
+            The run's status
+        
+        Raises:
+            ValueError: Unknown backend, missing prompt or no emails
+        """
+        backend = backend or self.default_backend
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown batch backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+        phases = PHASES if extract_actions else PHASES[:1]
+        for phase in phases:
+            if not prompts.get(phase, {}).get('prompt'):
+                raise ValueError(f"{phase} prompt not found")
+        
+        ids = email_ids if email_ids is not None else inbox_sync.ids()
+        if not ids:
+            raise ValueError("No emails to reclassify")
+        
+        run_id = f"batch-{uuid.uuid4().hex[:12]}"
+        job_dir = os.path.join(self.directory, run_id)
+        os.makedirs(job_dir, exist_ok=True)
+        
+        manifest = {
+            'id': run_id,
+            'backend': backend,
+            'status': 'preparing',
+            'tenant': current_tenant(),
+            'phase': phases[0],
+            'prompts': {phase: prompts[phase] for phase in phases},
+            'total': len(ids),
+            'updated': 0,
+            'phases': {phase: self._new_phase() for phase in phases},
+            'error': None,
+            'createdAt': time.time(),
+            'updatedAt': time.time(),
+            'finishedAt': None
+        }
+        self._write_chunks(job_dir, phases[0], ids)
+        manifest['phases'][phases[0]]['emails'] = len(ids)
+        self._save(manifest)
+        
+        self._drive(run_id)
+        logger.info("Batch run started", extra={'batchId': run_id, 'emails': len(ids), 'backend': backend})
+        return self.to_dict(manifest)
+    
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        manifest = self._load(run_id)
+        return self.to_dict(manifest) if manifest else None
+    
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        runs = [self._load(name) for name in os.listdir(self.directory)]
+        runs = [run for run in runs if run]
+        runs.sort(key=lambda run: run['createdAt'], reverse=True)
+        return [self.to_dict(run) for run in runs]
+    
+    def resume(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Restart the driver of an unfinished run, or of every unfinished run
+        
+        Returns:
+            Status of each resumed run
+        """
+        names = [run_id] if run_id else (os.listdir(self.directory) if os.path.isdir(self.directory) else [])
+        resumed = []
+        for name in names:
+            manifest = self._load(name)
+            if manifest is None or manifest['status'] in FINISHED_STATUSES:
+                continue
+            self._drive(name)
+            resumed.append(self.to_dict(manifest))
+        return resumed
+    
+    def cancel(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a run; results already applied stay applied
+        
+        Returns:
+            The run's status, or None if it does not exist
+        """
+        with self._lock:
+            driver = self._drivers.get(run_id)
+        
+        with self._manifest_lock:
+            manifest = self._load(run_id)
+            if manifest is None:
+                return None
+            if manifest['status'] in FINISHED_STATUSES:
+                return self.to_dict(manifest)
+            
+            # Once the stop event is set the driver's own writes are dropped,
+            # so it cannot overwrite the cancellation with a stale manifest
+            if driver is not None:
+                driver[1].set()
+            manifest['status'] = 'cancelled'
+            manifest['finishedAt'] = time.time()
+            manifest['updatedAt'] = time.time()
+            _write_json_atomic(os.path.join(self._job_dir(manifest['id']), 'manifest.json'), manifest)
+        
+        phase = manifest['phases'].get(manifest['phase'] or '')
+        if phase and phase['handle'] and phase['state'] == 'submitted':
+            self._cancel_backend(manifest['backend'], phase['handle'], run_id)
+        return self.to_dict(manifest)
+    
+    def to_dict(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Run status for API responses (prompt text left out)"""
+        return {
+            'batchId': manifest['id'],
+            'backend': manifest['backend'],
+            'status': manifest['status'],
+            'tenant': manifest['tenant'],
+            'phase': manifest['phase'],
+            'total': manifest['total'],
+            'updated': manifest['updated'],
+            'promptVersions': {phase: prompt.get('version') for phase, prompt in manifest['prompts'].items()},
+            'phases': {
+                name: {
+                    'state': phase['state'],
+                    'emails': phase['emails'],
+                    'requests': phase['requests'],
+                    'applied': len(phase['applied']),
+                    'failed': len(phase['failed']),
+                    'skipped': len(phase.get('skipped', [])),
+                    'handle': phase['handle']
+                }
+                for name, phase in manifest['phases'].items()
+            },
+            'error': manifest['error'],
+            'createdAt': manifest['createdAt'],
+            'updatedAt': manifest['updatedAt'],
+            'finishedAt': manifest['finishedAt']
+        }
+    
+    @staticmethod
+    def _new_phase() -> Dict[str, Any]:
+        return {'state': 'pending', 'emails': 0, 'requests': 0, 'handle': None, 'applied': [], 'failed': [], 'skipped': []}
+    
+    def _backend(self, name: str):
+        with self._lock:
+            if name not in self._backends:
+                self._backends[name] = BACKENDS[name]()
+            return self._backends[name]
+    
+    def _job_dir(self, run_id: str) -> str:
+        return os.path.join(self.directory, run_id)
+    
+    def _load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self._job_dir(os.path.basename(run_id)), 'manifest.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+    
+    def _save(self, manifest: Dict[str, Any], stop: Optional[threading.Event] = None) -> bool:
+        """
+        Write a manifest checkpoint
+        
+        Args:
+            manifest: The run's manifest
+            stop: The writing driver's stop event; the write is dropped
+                once it is set, i.e. after the run was cancelled
+        
+        Returns:
+            Whether the manifest was written
+        """
+        with self._manifest_lock:
+            if stop is not None and stop.is_set():
+                return False
+            manifest['updatedAt'] = time.time()
+            _write_json_atomic(os.path.join(self._job_dir(manifest['id']), 'manifest.json'), manifest)
+            return True
+    
+    def _cancel_backend(self, backend: str, handle: str, run_id: str) -> None:
+        try:
+            self._backend(backend).cancel(handle)
+        except Exception as e:
+            logger.warning("Batch backend cancel failed: %s", e, extra={'batchId': run_id})
+    
+    def _write_chunks(self, job_dir: str, phase: str, ids: List[str]) -> None:
+        """Chunk index for a phase: which emails, in prompt order, each request covers"""
+        chunks_path, _, _ = phase_paths(job_dir, phase)
+        tmp = chunks_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for number, start in enumerate(range(0, len(ids), self.chunk_size)):
+                f.write(json.dumps({'key': f"{phase}-{number:06d}", 'ids': ids[start:start + self.chunk_size]}) + '\n')
+        os.replace(tmp, chunks_path)
+    
+    def _write_requests(self, job_dir: str, phase: str, prompt_text: str) -> Tuple[int, List[str]]:
+        """
+        Render the phase's batch file from its chunk index
+        
+        Email content is read from the inbox store chunk by chunk, so the
+        whole archive is never held in memory. Emails no longer in the
+        inbox are left out of both the requests and the chunk index, which
+        is rewritten to match what was sent.
+        
+        Returns:
+            The request count and the ids of skipped emails
+        """
+        chunks_path, requests_path, _ = phase_paths(job_dir, phase)
+        if phase == 'categorization':
+            preamble = CATEGORIZATION_COMPACT_TEMPLATE.render(instructions=prompt_text, codes=CATEGORY_CODES)
+            schema = CATEGORY_PAIRS_SCHEMA
+        else:
+            preamble = ACTION_COMPACT_TEMPLATE.render(instructions=prompt_text, codes=PRIORITY_CODES)
+            schema = ACTION_ITEMS_SCHEMA
+        
+        count = 0
+        skipped = []
+        tmp = requests_path + '.tmp'
+        chunks_tmp = chunks_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f, open(chunks_tmp, 'w', encoding='utf-8') as index:
+            for chunk in iter_jsonl(chunks_path):
+                records = inbox_sync.records(chunk['ids'])
+                skipped.extend(email_id for email_id in chunk['ids'] if email_id not in records)
+                # Numbering must follow the chunk index, which decoding uses
+                emails = [records[email_id] for email_id in chunk['ids'] if email_id in records]
+                if not emails:
+                    continue
+                index.write(json.dumps({'key': chunk['key'], 'ids': [email['id'] for email in emails]}) + '\n')
+                text = preamble + render_email_blocks(emails, numbered=True)
+                f.write(json.dumps({'key': chunk['key'], 'request': batch_request(text, schema)}) + '\n')
+                count += 1
+        os.replace(chunks_tmp, chunks_path)
+        os.replace(tmp, requests_path)
+        return count, skipped
+    
+    def _drive(self, run_id: str) -> None:
+        with self._lock:
+            driver = self._drivers.get(run_id)
+            if driver is not None and driver[0].is_alive():
+                return
+            stop = threading.Event()
+            thread = threading.Thread(target=self._run, args=(run_id, stop), name=f"batch-{run_id}", daemon=True)
+            self._drivers[run_id] = (thread, stop)
+            thread.start()
+    
+    def _run(self, run_id: str, stop: threading.Event) -> None:
+        """Driver loop: submit, poll, apply, advance, until done or stopped"""
+        manifest = self._load(run_id)
+        try:
+            while manifest and manifest['phase'] and not stop.is_set():
+                if not self._step(manifest, stop):
+                    stop.wait(self.poll_interval)
+        except Exception as e:
+            logger.error("Batch run failed: %s", e, extra={'batchId': run_id})
+            manifest['status'] = 'failed'
+            manifest['error'] = str(e)
+            manifest['finishedAt'] = time.time()
+            self._save(manifest, stop)
+    
+    def _step(self, manifest: Dict[str, Any], stop: threading.Event) -> bool:
+        """
+        Advance the current phase by one state
+        
+        Returns:
+            False when the backend is still running and the driver should
+            wait before polling again
+        """
+        job_dir = self._job_dir(manifest['id'])
+        name = manifest['phase']
+        phase = manifest['phases'][name]
+        backend = self._backend(manifest['backend'])
+        
+        if phase['state'] == 'pending':
+            phase['requests'], phase['skipped'] = self._write_requests(job_dir, name, manifest['prompts'][name]['prompt'])
+            manifest['status'] = 'running'
+            if not phase['requests']:
+                phase['state'] = 'done'
+                self._advance(manifest)
+                self._save(manifest, stop)
+                return True
+            if stop.is_set():
+                return True
+            
+            phase['handle'] = backend.submit(job_dir, name, model_router.primary(name), manifest['tenant'])
+            phase['state'] = 'submitted'
+            if not self._save(manifest, stop):
+                # Cancelled while submitting: the handle never reached the manifest
+                self._cancel_backend(manifest['backend'], phase['handle'], manifest['id'])
+            return True
+        
+        if phase['state'] == 'submitted':
+            state = backend.poll(phase['handle'], manifest['tenant'])
+            if state == RUNNING:
+                return False
+            if state == FAILED:
+                raise RuntimeError(f"Backend reported the {name} batch as failed")
+            backend.fetch(phase['handle'], phase_paths(job_dir, name)[2])
+            phase['state'] = 'applying'
+            self._save(manifest, stop)
+            return True
+        
+        if phase['state'] == 'applying':
+            self._apply(manifest, name, stop)
+            if stop.is_set():
+                return True
+            if phase['failed'] and len(phase['failed']) >= len(phase['applied']):
+                raise RuntimeError(f"No {name} result could be decoded")
+            phase['state'] = 'done'
+            self._advance(manifest)
+            self._save(manifest, stop)
+        return True
+    
+    def _apply(self, manifest: Dict[str, Any], name: str, stop: threading.Event) -> None:
+        """Stream result lines into the inbox store, checkpointing applied keys"""
+        chunks_path, _, results_path = phase_paths(self._job_dir(manifest['id']), name)
+        phase = manifest['phases'][name]
+        applied = set(phase['applied'])
+        chunk_ids = {chunk['key']: chunk['ids'] for chunk in iter_jsonl(chunks_path)}
+        
+        pending = 0
+        for line in iter_jsonl(results_path):
+            key = line.get('key')
+            if key in applied or key not in chunk_ids:
+                continue
+            if stop.is_set():
+                break
+            
+            emails = [{'id': email_id} for email_id in chunk_ids[key]]
+            text = response_text(line)
+            elements = parse_json_array(text) if text else None
+            if name == 'categorization':
+                decoded = decode_category_pairs(elements or [], emails)
+                ok = bool(decoded)
+            else:
+                decoded = dict(decode_action_entries(elements or [], emails))
+                # Emails without action items are omitted, so only an empty array may decode to nothing
+                ok = elements is not None and (bool(decoded) or not elements)
+            
+            if not ok:
+                # These emails keep their previous results
+                logger.warning("Batch result line failed", extra={'batchId': manifest['id'], 'key': key})
+                phase['failed'].append(key)
+            elif name == 'categorization':
+                manifest['updated'] += inbox_sync.apply_categories(decoded)
+            else:
+                inbox_sync.apply_action_items(decoded)
+            
+            applied.add(key)
+            phase['applied'].append(key)
+            pending += 1
+            if pending >= BATCH_CHECKPOINT_EVERY:
+                self._save(manifest, stop)
+                pending = 0
+        
+        if pending:
+            self._save(manifest, stop)
+    
+    def _advance(self, manifest: Dict[str, Any]) -> None:
+        """Move to the next phase, or finish the run (phase state saved by the caller)"""
+        job_dir = self._job_dir(manifest['id'])
+        if manifest['phase'] == 'categorization' and 'actionExtraction' in manifest['phases']:
+            chunks_path, _, _ = phase_paths(job_dir, 'categorization')
+            ids = [email_id for chunk in iter_jsonl(chunks_path) for email_id in chunk['ids']]
+            needing = inbox_sync.needing_actions(ids)
+            if needing:
+                self._write_chunks(job_dir, 'actionExtraction', needing)
+                manifest['phases']['actionExtraction']['emails'] = len(needing)
+                manifest['phase'] = 'actionExtraction'
+                return
+            manifest['phases']['actionExtraction']['state'] = 'done'
+        
+        manifest['phase'] = None
+        manifest['status'] = 'completed'
+        manifest['finishedAt'] = time.time()
+        logger.info("Batch run completed", extra={'batchId': manifest['id'], 'updated': manifest['updated']})
+
+
+batch_reclassifier = BatchReclassifier()
@@ -0,0 +1,214 @@
+"""
+Change Log - Monotonic change versions for delta sync of inbox and drafts
+"""
+
+import os
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple
+from .log import get_logger
+
+
+CHANGE_LOG_MAX_TOMBSTONES = int(os.getenv('CHANGE_LOG_MAX_TOMBSTONES', '10000'))
+CHANGES_PAGE_SIZE = int(os.getenv('CHANGES_PAGE_SIZE', '500'))
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+logger = get_logger(__name__)
+
+
+class _Entry:
+    __slots__ = ('version', 'created', 'deleted')
+    
+    def __init__(self, version: int, created: int, deleted: bool):
+        self.version = version
+        self.created = created
+        self.deleted = deleted
+
+
+class ChangeLog:
+    """
+    Latest change per record, ordered by a monotonic version
+    
+    Every insert, update or delete of a tracked record bumps the version.
+    Only the newest change per (kind, id) is kept, in version order, so a
+    changes(since) call walks back from the newest entry and its cost
+    grows with the number of changes since that version, not with the
+    data size. Current record data is fetched from per-kind loaders at
+    read time. Deletes are kept as tombstones up to max_tombstones; a
+    client whose version predates the oldest dropped tombstone, or that
+    comes from another process (epoch), is told to reset and reload.
+    """
+    
+    def __init__(self, max_tombstones: int = CHANGE_LOG_MAX_TOMBSTONES):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.max_tombstones = max_tombstones
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Tuple[str, str], _Entry]' = OrderedDict()
+        self._tombstones: 'OrderedDict[Tuple[str, str], int]' = OrderedDict()
+        self._version = 0
+        self._floor = 0
+        self._loaders: Dict[str, Callable[[List[str]], Dict[str, Dict[str, Any]]]] = {}
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+    
+    @property
+    def version(self) -> int:
+        return self._version
+    
+    def register(self, kind: str, loader: Callable[[List[str]], Dict[str, Dict[str, Any]]]) -> None:
+        """Set the loader returning current data for a kind's record ids"""
+        self._loaders[kind] = loader
+    
+    def record(self, kind: str, ids: Iterable[str], deleted: bool = False) -> int:
+        """
+        Record inserts/updates (or deletes) of records
+        
+        Args:
+            kind: Record kind, e.g. 'email' or 'draft'
+            ids: IDs of the changed records
+            deleted: Whether the records were removed
+        
+        Returns:
+            The new version
+        """
+        with self._lock:
+            for record_id in ids:
+                key = (kind, record_id)
+                self._version += 1
+                previous = self._entries.pop(key, None)
+                created = previous.created if previous is not None and not previous.deleted else self._version
+                self._entries[key] = _Entry(self._version, created, deleted)
+                self._tombstones.pop(key, None)
+                if deleted:
+                    self._tombstones[key] = self._version
+            self._compact()
+            version = self._version
+            subscribers = list(self._subscribers)
+        
+        for loop, event in subscribers:
+            loop.call_soon_threadsafe(event.set)
+        return version
+    
+    def changes(
+        self,
+        since: int,
+        epoch: Optional[str] = None,
+        kinds: Optional[Iterable[str]] = None,
+        limit: int = CHANGES_PAGE_SIZE
+    ) -> Dict[str, Any]:
+        """
+        Changes after a version, oldest first
+        
+        Record data is read through the kind's loader; if a loader fails,
+        the page ends before that kind's first change (with hasMore set),
+        so the change is read again rather than skipped.
+        
+        Args:
+            since: Last version the client has applied (0 for everything)
+            epoch: Epoch the client's version came from
+            kinds: Only report these kinds
+            limit: Maximum changes to return; the rest follow with the
+                returned version as the next since
+        
+        Returns:
+            {'epoch', 'version', 'reset', 'hasMore', 'changes': [
+                {'kind', 'id', 'op', 'version', 'data'}
+            ]}; data is None for deletes
+        """
+        kinds = set(kinds) if kinds else None
+        with self._lock:
+            current = self._version
+            if (epoch is not None and epoch != self.epoch) or since < self._floor or since > current:
+                return {'epoch': self.epoch, 'version': current, 'reset': True, 'hasMore': False, 'changes': []}
+            
+            pending = []
+            for key in reversed(self._entries):
+                entry = self._entries[key]
+                if entry.version <= since:
+                    break
+                if kinds is None or key[0] in kinds:
+                    pending.append((key, entry.version, entry.created, entry.deleted))
+        pending.reverse()
+        
+        has_more = len(pending) > limit
+        pending = pending[:limit]
+        version = pending[-1][1] if has_more else current
+        
+        by_kind: Dict[str, List[str]] = {}
+        for (kind, record_id), _, _, deleted in pending:
+            if not deleted:
+                by_kind.setdefault(kind, []).append(record_id)
+        data = {kind: self._load(kind, ids) for kind, ids in by_kind.items()}
+        
+        changes = []
+        for (kind, record_id), entry_version, created, deleted in pending:
+            if not deleted and data[kind] is None:
+                # Loader failed: stop before this change so it is read again
+                version = changes[-1]['version'] if changes else since
+                has_more = True
+                break
+            record = None if deleted else data[kind].get(record_id)
+            if not deleted and record is None:
+                # Removed after the change was read; its delete follows later
+                continue
+            changes.append({
+                'kind': kind,
+                'id': record_id,
+                'op': DELETE if deleted else (INSERT if created > since else UPDATE),
+                'version': entry_version,
+                'data': record
+            })
+        
+        return {'epoch': self.epoch, 'version': version, 'reset': False, 'hasMore': has_more, 'changes': changes}
+    
+    async def wait(self, since: int, timeout: float) -> bool:
+        """Wait until the version moves past since; False on timeout"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            if self._version > since:
+                return True
+            self._subscribers.append(subscriber)
+        try:
+            await asyncio.wait_for(subscriber[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'epoch': self.epoch,
+                'version': self._version,
+                'floor': self._floor,
+                'tracked': len(self._entries),
+                'tombstones': len(self._tombstones),
+                'subscribers': len(self._subscribers)
+            }
+    
+    def _load(self, kind: str, ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Current data for a kind's records, or None if its loader failed"""
+        loader = self._loaders.get(kind)
+        if loader is None:
+            return {}
+        try:
+            return loader(ids)
+        except Exception as e:
+            logger.warning("Change loader failed: %s", e, extra={'kind': kind})
+            return None
+    
+    def _compact(self) -> None:
+        """Drop the oldest tombstones past the cap (lock held)"""
+        while len(self._tombstones) > self.max_tombstones:
+            key, version = self._tombstones.popitem(last=False)
+            self._entries.pop(key, None)
+            self._floor = max(self._floor, version)
+
+
+change_log = ChangeLog()
@@ -2,8 +2,55 @@
 Chat Service - Handles intelligent email agent queries
 """
 
-from typing import Dict, List, Any, Optional
-from .llm_service import GeminiService
+import os
+import re
+import time
+from typing import Dict, List, Any, Optional, Iterator
+from .llm_service import GeminiService, prompt_fingerprint, model_router
+from .precompute import precomputer
+from .prompt_registry import CompiledTemplate
+from .email_processor import render_email_blocks
+from .log import get_logger
+
+
+DRAFT_KEYWORDS = ['draft', 'reply', 'respond', 'write back', 'compose', 'generate reply']
+SUMMARY_KEYWORDS = ['summarize', 'summary', 'tldr', 'brief']
+TASK_KEYWORDS = ['what tasks', 'show tasks', 'list tasks', 'action items', 'to-do', 'need to do', 'what do i need']
+SHOW_KEYWORDS = ['show', 'list', 'get', 'find', 'display', 'give me', 'get me']
+CATEGORY_KEYWORDS = ['urgent', 'important', 'spam', 'newsletter']
+
+DRAFT_BATCH_SIZE = int(os.getenv('DRAFT_BATCH_SIZE', '10'))
+DEFAULT_REPLY_PROMPT = 'Draft a professional and helpful reply to this email.'
+
+# Instruction used for precomputed drafts; generic chat draft requests are
+# normalized to it so they can be served from the precompute cache
+PRECOMPUTED_DRAFT_INSTRUCTION = 'Draft a reply to this email'
+_GENERIC_DRAFT_WORDS = {
+    'draft', 'reply', 'respond', 'response', 'write', 'back', 'compose', 'generate',
+    'a', 'an', 'the', 'to', 'this', 'that', 'email', 'message', 'please', 'for', 'me', 'it'
+}
+
+# Model routing task for each chat intent and precomputed result kind
+INTENT_TASKS = {'draft': 'autoReply', 'summary': 'summary', 'general': 'chat'}
+PRECOMPUTE_TASKS = {'draft': 'autoReply', 'summary': 'summary'}
+
+SUMMARY_FALLBACK_RESPONSE = "Unable to generate summary at this time."
+GENERAL_FALLBACK_RESPONSE = "I'm not sure how to help with that. Try asking about summarizing emails, viewing tasks, or drafting replies."
+
+logger = get_logger(__name__)
+
+
+def _detect_intent(query_lower: str) -> str:
+    """Classify a lowercased query as draft, summary, tasks, list or general"""
+    if any(keyword in query_lower for keyword in DRAFT_KEYWORDS):
+        return 'draft'
+    if any(word in query_lower for word in SUMMARY_KEYWORDS):
+        return 'summary'
+    if any(keyword in query_lower for keyword in TASK_KEYWORDS):
+        return 'tasks'
+    if any(show in query_lower for show in SHOW_KEYWORDS) and any(cat in query_lower for cat in CATEGORY_KEYWORDS):
+        return 'list'
+    return 'general'
 
 
 def process_chat_query(
@@ -29,7 +76,6 @@ def process_chat_query(
             'error': Optional[str]
         }
     """
-    llm_service = GeminiService()
     query_lower = query.lower()
     
     result = {
@@ -40,9 +86,10 @@ def process_chat_query(
     }
     
     try:
-        draft_keywords = ['draft', 'reply', 'respond', 'write back', 'compose', 'generate reply']
+        intent = _detect_intent(query_lower)
+        llm_service = GeminiService(INTENT_TASKS.get(intent, 'chat'))
         
-        if any(keyword in query_lower for keyword in draft_keywords):
+        if intent == 'draft':
             if not email:
                 result['response'] = "Please select an email first to draft a reply."
                 result['success'] = True
@@ -50,11 +97,11 @@ def process_chat_query(
             
             draft = _generate_draft(email, prompts, llm_service, query)
             result['draft'] = draft
-            result['response'] = f"I've generated a draft reply:\n\n**Subject:** {draft['subject']}\n\n**Body:**\n{draft['body']}\n\nYou can find this draft in the Drafts tab for editing."
+            result['response'] = _format_draft_response(draft)
             result['success'] = True
             return result
         
-        if any(word in query_lower for word in ['summarize', 'summary', 'tldr', 'brief']):
+        if intent == 'summary':
             if not email:
                 result['response'] = "Please select an email first to summarize it."
                 result['success'] = True
@@ -65,69 +112,13 @@ def process_chat_query(
             result['success'] = True
             return result
         
-        task_keywords = ['what tasks', 'show tasks', 'list tasks', 'action items', 'to-do', 'need to do', 'what do i need']
-        if any(keyword in query_lower for keyword in task_keywords):
-            if email:
-                action_items = email.get('actionItems', [])
-                if action_items:
-                    tasks_text = "\n".join([
-                        f"• {item['task']}" + 
-                        (f" (Deadline: {item['deadline']})" if item.get('deadline') and item['deadline'] != 'none' else "") +
-                        (f" [{item['priority'].upper()}]" if item.get('priority') else "")
-                        for item in action_items
-                    ])
-                    result['response'] = f"Here are the action items from this email:\n\n{tasks_text}"
-                else:
-                    result['response'] = "No action items found in this email."
-            elif emails:
-                all_tasks = []
-                for e in emails:
-                    if e.get('actionItems'):
-                        for item in e['actionItems']:
-                            all_tasks.append(f"• {item['task']} (from: {e.get('senderName', 'Unknown')})")
-                
-                if all_tasks:
-                    result['response'] = f"Here are all action items from your inbox ({len(all_tasks)} total):\n\n" + "\n".join(all_tasks)
-                else:
-                    result['response'] = "No action items found in your inbox."
-            else:
-                result['response'] = "No email context available. Please select an email or load your inbox."
-            
+        if intent == 'tasks':
+            result['response'] = _list_action_items(email, emails)
             result['success'] = True
             return result
         
-        show_keywords = ['show', 'list', 'get', 'find', 'display', 'give me', 'get me']
-        category_keywords = ['urgent', 'important', 'spam', 'newsletter']
-        
-        is_list_request = any(show in query_lower for show in show_keywords) and any(cat in query_lower for cat in category_keywords)
-        
-        if is_list_request:
-            if not emails:
-                result['response'] = "No inbox data available."
-                result['success'] = True
-                return result
-            
-            category = None
-            if 'important' in query_lower or 'urgent' in query_lower:
-                category = 'Important'
-            elif 'spam' in query_lower:
-                category = 'Spam'
-            elif 'newsletter' in query_lower:
-                category = 'Newsletter'
-            
-            if category:
-                filtered = [e for e in emails if e.get('category') == category]
-                if filtered:
-                    email_list = "\n".join([
-                        f"• {e.get('subject', 'No subject')} (from {e.get('senderName', 'Unknown')})"
-                        for e in filtered
-                    ])
-                    result['response'] = f"Found {len(filtered)} {category} email(s):\n\n{email_list}"
-                else:
-                    result['response'] = f"No {category} emails found in your inbox."
-            else:
-                result['response'] = "I can help you filter emails by: Important, Spam, or Newsletter."
-            
+        if intent == 'list':
+            result['response'] = _list_category_emails(query_lower, emails)
             result['success'] = True
             return result
         
@@ -137,48 +128,160 @@ def process_chat_query(
         return result
     
     except Exception as e:
-        print(f"Error processing chat query: {e}")
+        logger.error("Error processing chat query: %s", e)
         result['error'] = str(e)
         result['response'] = "I encountered an error processing your request. Please try again."
         return result
 
 
-def _summarize_email(email: Dict[str, Any], llm_service: GeminiService) -> str:
-    """Generate a concise summary of an email"""
-    prompt = f"""Summarize this email in 2-3 sentences. Focus on the key points and any action items.
-
-From: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
-Subject: {email.get('subject', 'No subject')}
+def stream_chat_query(
+    query: str,
+    email: Optional[Dict[str, Any]] = None,
+    emails: Optional[List[Dict[str, Any]]] = None,
+    prompts: Optional[Dict[str, Any]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Process a chat query, streaming LLM tokens as they arrive
+    
+    Summaries, drafts and general queries forward each chunk from the model
+    as a 'token' event. Intents answered without the LLM produce only the
+    final event. The final event has the same shape as process_chat_query's
+    result; for drafts it carries the draft assembled from the full stream.
+    
+    Args:
+        query: User's question/command
+        email: Optional selected email for context
+        emails: Optional list of all emails for general queries
+        prompts: Dictionary containing prompt objects
+    
+    Yields:
+        {'type': 'token', 'text': str} for each streamed chunk, then
+        {'type': 'done', 'response', 'draft', 'success', 'error'}
+    """
+    query_lower = query.lower()
+    intent = _detect_intent(query_lower)
+    
+    if intent == 'general' or (intent in ('draft', 'summary') and email):
+        cached = None
+        if intent == 'draft':
+            prompt = _build_draft_prompt(email, prompts, _draft_instruction(query))
+            cached = _precomputed('draft', email, prompt)
+        elif intent == 'summary':
+            prompt = _build_summary_prompt(email)
+            cached = _precomputed('summary', email, prompt)
+        else:
+            prompt = _build_general_prompt(query, email, emails)
+        
+        result = {
+            'response': '',
+            'draft': None,
+            'success': False,
+            'error': None
+        }
+        
+        chunks = []
+        try:
+            for text in ([cached] if cached else GeminiService(INTENT_TASKS[intent]).generate_text_stream(prompt, hedge=True)):
+                chunks.append(text)
+                yield {'type': 'token', 'text': text}
+        except Exception as e:
+            logger.error("Error streaming chat query: %s", e)
+            result['error'] = str(e)
+            result['response'] = "I encountered an error processing your request. Please try again."
+            yield {'type': 'done', **result}
+            return
+        
+        response = ''.join(chunks)
+        if intent == 'draft':
+            result['draft'] = _parse_draft(email, response)
+            result['response'] = _format_draft_response(result['draft'])
+        elif intent == 'summary':
+            result['response'] = response if response else SUMMARY_FALLBACK_RESPONSE
+        else:
+            result['response'] = response if response else GENERAL_FALLBACK_RESPONSE
+        
+        result['success'] = True
+        yield {'type': 'done', **result}
+        return
+    
+    # Remaining intents (and missing selections) are answered without the LLM
+    yield {'type': 'done', **process_chat_query(query, email, emails, prompts)}
 
-{email.get('body', '')}
 
-Provide a brief, helpful summary:"""
+def _list_action_items(
+    email: Optional[Dict[str, Any]],
+    emails: Optional[List[Dict[str, Any]]]
+) -> str:
+    """List action items for the selected email or the whole inbox"""
+    if email:
+        action_items = email.get('actionItems', [])
+        if action_items:
+            tasks_text = "\n".join([
+                f"• {item['task']}" + 
+                (f" (Deadline: {item['deadline']})" if item.get('deadline') and item['deadline'] != 'none' else "") +
+                (f" [{item['priority'].upper()}]" if item.get('priority') else "")
+                for item in action_items
+            ])
+            return f"Here are the action items from this email:\n\n{tasks_text}"
+        return "No action items found in this email."
     
-    response = llm_service.generate_text(prompt)
-    return response if response else "Unable to generate summary at this time."
+    if emails:
+        all_tasks = []
+        for e in emails:
+            if e.get('actionItems'):
+                for item in e['actionItems']:
+                    all_tasks.append(f"• {item['task']} (from: {e.get('senderName', 'Unknown')})")
+        
+        if all_tasks:
+            return f"Here are all action items from your inbox ({len(all_tasks)} total):\n\n" + "\n".join(all_tasks)
+        return "No action items found in your inbox."
+    
+    return "No email context available. Please select an email or load your inbox."
 
 
-def _generate_draft(
-    email: Dict[str, Any],
-    prompts: Optional[Dict[str, Any]],
-    llm_service: GeminiService,
-    user_instruction: str = ""
-) -> Dict[str, Any]:
-    """Generate a draft reply to an email"""
+def _list_category_emails(query_lower: str, emails: Optional[List[Dict[str, Any]]]) -> str:
+    """List inbox emails in the category named by the query"""
+    if not emails:
+        return "No inbox data available."
     
-    auto_reply_prompt = ""
-    if prompts and 'autoReply' in prompts:
-        auto_reply_prompt = prompts['autoReply'].get('prompt', '')
+    category = None
+    if 'important' in query_lower or 'urgent' in query_lower:
+        category = 'Important'
+    elif 'spam' in query_lower:
+        category = 'Spam'
+    elif 'newsletter' in query_lower:
+        category = 'Newsletter'
     
-    email_context = f"""Original Email:
-From: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
-Subject: {email.get('subject', 'No subject')}
-
-{email.get('body', '')}"""
+    if not category:
+        return "I can help you filter emails by: Important, Spam, or Newsletter."
+    
+    filtered = [e for e in emails if e.get('category') == category]
+    if not filtered:
+        return f"No {category} emails found in your inbox."
     
-    full_prompt = f"""{auto_reply_prompt if auto_reply_prompt else 'Draft a professional and helpful reply to this email.'}
+    email_list = "\n".join([
+        f"• {e.get('subject', 'No subject')} (from {e.get('senderName', 'Unknown')})"
+        for e in filtered
+    ])
+    return f"Found {len(filtered)} {category} email(s):\n\n{email_list}"
+
+
+SUMMARY_TEMPLATE = CompiledTemplate("""Summarize this email in 2-3 sentences. Focus on the key points and any action items.
+
+From: {senderName} <{sender}>
+Subject: {subject}
 
-{email_context}
+{body}
+
+Provide a brief, helpful summary:""")
+
+DRAFT_TEMPLATE = CompiledTemplate("""{instructions}
+
+Original Email:
+From: {senderName} <{sender}>
+Subject: {subject}
+
+{body}
 
 Additional instruction: {user_instruction}
 
@@ -189,10 +292,48 @@ Generate a reply with:
 Format your response as:
 Subject: [subject line]
 
-[email body]"""
-    
-    response = llm_service.generate_text(full_prompt)
+[email body]""")
+
+
+def _build_summary_prompt(email: Dict[str, Any]) -> str:
+    """Build the prompt used to summarize an email"""
+    return SUMMARY_TEMPLATE.render(
+        senderName=email.get('senderName', 'Unknown'),
+        sender=email.get('sender', ''),
+        subject=email.get('subject', 'No subject'),
+        body=email.get('body', '')
+    )
+
+
+def _summarize_email(email: Dict[str, Any], llm_service: GeminiService) -> str:
+    """Generate a concise summary of an email"""
+    prompt = _build_summary_prompt(email)
+    response = _precomputed('summary', email, prompt) or llm_service.generate_text(prompt, hedge=True)
+    return response if response else SUMMARY_FALLBACK_RESPONSE
+
+
+def _build_draft_prompt(
+    email: Dict[str, Any],
+    prompts: Optional[Dict[str, Any]],
+    user_instruction: str = ""
+) -> str:
+    """Build the prompt used to draft a reply to an email"""
+    auto_reply_prompt = ""
+    if prompts and 'autoReply' in prompts:
+        auto_reply_prompt = prompts['autoReply'].get('prompt', '')
     
+    return DRAFT_TEMPLATE.render(
+        instructions=auto_reply_prompt if auto_reply_prompt else DEFAULT_REPLY_PROMPT,
+        senderName=email.get('senderName', 'Unknown'),
+        sender=email.get('sender', ''),
+        subject=email.get('subject', 'No subject'),
+        body=email.get('body', ''),
+        user_instruction=user_instruction
+    )
+
+
+def _parse_draft(email: Dict[str, Any], response: Optional[str]) -> Dict[str, Any]:
+    """Turn a raw LLM reply into a draft object"""
     if not response:
         return {
             'id': f"draft-{email.get('id')}-{int(time.time() * 1000)}",
@@ -214,8 +355,11 @@ Subject: [subject line]
         if len(parts) > 1:
             body = parts[1].strip()
     
-    import time
-    
+    return _draft_object(email, subject, body)
+
+
+def _draft_object(email: Dict[str, Any], subject: str, body: str) -> Dict[str, Any]:
+    """Build a draft for a reply to email"""
     return {
         'id': f"draft-{email.get('id')}-{int(time.time() * 1000)}",
         'originalEmailId': email.get('id'),
@@ -230,14 +374,29 @@ Subject: [subject line]
     }
 
 
-def _handle_general_query(
+def _format_draft_response(draft: Dict[str, Any]) -> str:
+    """Chat message presenting a generated draft"""
+    return f"I've generated a draft reply:\n\n**Subject:** {draft['subject']}\n\n**Body:**\n{draft['body']}\n\nYou can find this draft in the Drafts tab for editing."
+
+
+def _generate_draft(
+    email: Dict[str, Any],
+    prompts: Optional[Dict[str, Any]],
+    llm_service: GeminiService,
+    user_instruction: str = ""
+) -> Dict[str, Any]:
+    """Generate a draft reply to an email"""
+    prompt = _build_draft_prompt(email, prompts, _draft_instruction(user_instruction))
+    response = _precomputed('draft', email, prompt) or llm_service.generate_text(prompt, hedge=True)
+    return _parse_draft(email, response)
+
+
+def _build_general_prompt(
     query: str,
     email: Optional[Dict[str, Any]],
-    emails: Optional[List[Dict[str, Any]]],
-    llm_service: GeminiService
+    emails: Optional[List[Dict[str, Any]]]
 ) -> str:
-    """Handle general queries about inbox or email"""
-    
+    """Build the prompt used for general questions about the inbox or email"""
     context = "You are an email productivity assistant. Answer the user's question helpfully.\n\n"
     
     if email:
@@ -257,7 +416,153 @@ Body: {email.get('body', '')[:200]}...
             categories[cat] = categories.get(cat, 0) + 1
         context += f"Categories breakdown: {categories}\n\n"
     
-    full_prompt = f"{context}User Question: {query}\n\nProvide a helpful answer:"
+    return f"{context}User Question: {query}\n\nProvide a helpful answer:"
+
+
+def _handle_general_query(
+    query: str,
+    email: Optional[Dict[str, Any]],
+    emails: Optional[List[Dict[str, Any]]],
+    llm_service: GeminiService
+) -> str:
+    """Handle general queries about inbox or email"""
+    response = llm_service.generate_text(_build_general_prompt(query, email, emails), hedge=True)
+    return response if response else GENERAL_FALLBACK_RESPONSE
+
+
+def generate_drafts_batch(
+    emails: List[Dict[str, Any]],
+    prompts: Optional[Dict[str, Any]] = None,
+    user_instruction: str = "",
+    chunk_size: int = DRAFT_BATCH_SIZE
+) -> Dict[str, Any]:
+    """
+    Generate reply drafts for many emails with one LLM call per chunk
+    
+    Args:
+        emails: Emails to reply to
+        prompts: Dictionary containing prompt objects (uses 'autoReply')
+        user_instruction: Optional extra instruction applied to every reply
+        chunk_size: Maximum emails per LLM call
+    
+    Returns:
+        {
+            'drafts': List of draft objects, in email order,
+            'missing': IDs of emails the model returned no usable reply for
+        }
+    """
+    llm_service = GeminiService('autoReply')
+    
+    auto_reply_prompt = ""
+    if prompts and 'autoReply' in prompts:
+        auto_reply_prompt = prompts['autoReply'].get('prompt', '')
+    
+    # Instructions and format are the same for every chunk and go in
+    # the cacheable prefix; only the emails change
+    prefix = f"""{auto_reply_prompt if auto_reply_prompt else DEFAULT_REPLY_PROMPT}
+
+IMPORTANT: Write one reply for EACH of the following emails. Return a JSON array with one object per email.
+Format: [{{"emailId": "email-001", "subject": "Re: ...", "body": "..."}}, ...]
+Use "\\n" for line breaks inside the body. Do not include any text outside the JSON array.
+"""
+    if user_instruction:
+        prefix += f"\nAdditional instruction: {user_instruction}\n"
+    prefix += "\nHere are the emails to reply to:\n"
+    
+    drafts = []
+    missing = []
+    
+    for start in range(0, len(emails), chunk_size):
+        chunk = emails[start:start + chunk_size]
+        logger.debug("Generating drafts in one batch", extra={'emails': len(chunk)})
+        
+        emails_text = render_email_blocks(chunk)
+        
+        replies = {}
+        for item in llm_service.iter_json(emails_text, prefix=prefix):
+            if isinstance(item, dict) and item.get('emailId') and isinstance(item.get('body'), str) and item['body'].strip():
+                replies[item['emailId']] = item
+        
+        for email in chunk:
+            reply = replies.get(email.get('id'))
+            if reply is None:
+                missing.append(email.get('id'))
+                continue
+            
+            subject = reply.get('subject')
+            if not isinstance(subject, str) or not subject.strip():
+                subject = f"Re: {email.get('subject', 'No subject')}"
+            drafts.append(_draft_object(email, subject.strip(), reply['body'].strip()))
+    
+    logger.info("Batch drafts generated", extra={'generated': len(drafts), 'emails': len(emails)})
+    
+    return {
+        'drafts': drafts,
+        'missing': missing
+    }
+
+
+def _draft_instruction(user_instruction: str) -> str:
+    """Normalize generic draft requests to the precomputed draft instruction"""
+    words = re.findall(r"[a-z']+", user_instruction.lower())
+    if words and all(word in _GENERIC_DRAFT_WORDS for word in words):
+        return PRECOMPUTED_DRAFT_INSTRUCTION
+    return user_instruction
+
+
+def _precompute_version(kind: str, prompt: str) -> str:
+    return prompt_fingerprint(kind, model_router.primary(PRECOMPUTE_TASKS[kind]), prompt)
+
+
+def _precomputed(kind: str, email: Dict[str, Any], prompt: str) -> Optional[str]:
+    """Look up a background-generated result for this exact prompt"""
+    if not email.get('id'):
+        return None
+    return precomputer.cache.get(kind, email['id'], _precompute_version(kind, prompt))
+
+
+def schedule_precompute(
+    emails: List[Dict[str, Any]],
+    results: List[Dict[str, Any]],
+    prompts: Optional[Dict[str, Any]] = None
+) -> int:
+    """
+    Queue background summaries for processed emails and drafts for Important ones
+    
+    Important emails are queued first. Each result is cached under the
+    fingerprint of the exact prompt chat would send, so any change to the
+    email or the autoReply prompt invalidates it.
+    
+    Args:
+        emails: Email objects that were processed
+        results: Processing results with 'id' and 'category'
+        prompts: Dictionary containing prompt objects
+    
+    Returns:
+        Number of tasks queued
+    """
+    categories = {r.get('id'): r.get('category') for r in results}
+    processed = [
+        {**email, 'category': categories[email.get('id')]}
+        for email in emails if email.get('id') in categories
+    ]
+    processed.sort(key=lambda email: email['category'] != 'Important')
+    
+    queued = 0
+    for email in processed:
+        summary_prompt = _build_summary_prompt(email)
+        queued += precomputer.submit(
+            'summary', email['id'], _precompute_version('summary', summary_prompt),
+            lambda prompt=summary_prompt: GeminiService(PRECOMPUTE_TASKS['summary']).generate_text(prompt)
+        )
+        
+        if email['category'] == 'Important':
+            draft_prompt = _build_draft_prompt(email, prompts, PRECOMPUTED_DRAFT_INSTRUCTION)
+            queued += precomputer.submit(
+                'draft', email['id'], _precompute_version('draft', draft_prompt),
+                lambda prompt=draft_prompt: GeminiService(PRECOMPUTE_TASKS['draft']).generate_text(prompt)
+            )
     
-    response = llm_service.generate_text(full_prompt)
-    return response if response else "I'm not sure how to help with that. Try asking about summarizing emails, viewing tasks, or drafting replies."
+    if queued:
+        logger.debug("Queued background precompute tasks", extra={'queued': queued})
+    return queued
@@ -0,0 +1,219 @@
+"""
+Context Cache - Model-side caching of static prompt prefixes
+"""
+
+import os
+import time
+import hashlib
+import datetime
+import threading
+from typing import Dict, Any, Optional, Tuple
+from .prompt_registry import prompt_registry
+from .log import get_logger
+
+
+CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+CONTEXT_CACHE_TTL = int(os.getenv('CONTEXT_CACHE_TTL', '900'))
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv('CONTEXT_CACHE_REFRESH_MARGIN', '60'))
+# Gemini rejects cached contents below a model-specific minimum size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('CONTEXT_CACHE_MIN_TOKENS', '1024'))
+CONTEXT_CACHE_RETRY_AFTER = int(os.getenv('CONTEXT_CACHE_RETRY_AFTER', '600'))
+
+logger = get_logger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4
+
+
+class CachedPrefix:
+    """Handle to a cached prompt prefix for one model"""
+    
+    __slots__ = ('key', 'model', 'tag', 'tokens', 'expires_at', 'content', 'client', 'hits')
+    
+    def __init__(self, key: Tuple[str, str], model: str, tag: str, tokens: int, expires_at: float, content=None, client=None):
+        self.key = key
+        self.model = model
+        self.tag = tag
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.content = content
+        self.client = client
+        self.hits = 0
+    
+    @property
+    def is_local(self) -> bool:
+        return self.content is None
+
+
+class ContextCache:
+    """
+    TTL-managed handles for static prompt prefixes
+    
+    A prefix (instructions plus output format) is uploaded once per model
+    as Gemini cached content, and later calls send only their own emails
+    against it. Handles are refreshed shortly before they expire and
+    dropped when a prompt of the same type is edited. The local stand-in
+    (used in mock mode) keeps the same bookkeeping without any API calls
+    and without the minimum-size rule.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = CONTEXT_CACHE_ENABLED,
+        ttl: int = CONTEXT_CACHE_TTL,
+        refresh_margin: int = CONTEXT_CACHE_REFRESH_MARGIN,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+        retry_after: int = CONTEXT_CACHE_RETRY_AFTER
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.retry_after = retry_after
+        self._handles: Dict[Tuple[str, str], CachedPrefix] = {}
+        self._failed: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+        self.created = 0
+        self.refreshed = 0
+        self.invalidated = 0
+        self.failed = 0
+        self.hits = 0
+        self.tokens_saved = 0
+    
+    def acquire(self, model: str, prefix: str, tag: str = '', local: bool = False) -> Optional[CachedPrefix]:
+        """
+        Get a live handle for a prefix, creating or refreshing it as needed
+        
+        Args:
+            model: Model name the prefix is cached for
+            prefix: Static prompt prefix
+            tag: Prompt type the prefix derives from, used for invalidation
+            local: Use the local stand-in instead of the Gemini API
+        
+        Returns:
+            Handle, or None if the prefix should be sent inline
+        """
+        if not self.enabled or not prefix:
+            return None
+        tokens = estimate_tokens(prefix)
+        if not local and tokens < self.min_tokens:
+            return None
+        
+        key = (model, hashlib.sha256(prefix.encode('utf-8')).hexdigest())
+        handle = self._live(key)
+        if handle is not None:
+            return handle
+        
+        with self._create_lock:
+            handle = self._live(key)
+            if handle is not None:
+                return handle
+            if self._failed.get(key, 0) > time.time():
+                return None
+            
+            with self._lock:
+                stale = self._handles.get(key)
+            if stale is not None and stale.expires_at > time.time() and self._refresh(stale, local):
+                return stale
+            
+            try:
+                handle = self._create(key, model, prefix, tag, tokens, local)
+            except Exception as e:
+                self.failed += 1
+                self._failed[key] = time.time() + self.retry_after
+                logger.warning("Context cache unavailable: %s", e, extra={'model': model})
+                return None
+            
+            with self._lock:
+                self._handles[key] = handle
+            self.created += 1
+            return handle
+    
+    def invalidate(self, tag: str) -> int:
+        """Drop every handle derived from a prompt type (e.g. after an edit)"""
+        with self._lock:
+            dropped = [h for h in self._handles.values() if h.tag == tag]
+            for handle in dropped:
+                del self._handles[handle.key]
+        
+        for handle in dropped:
+            if not handle.is_local:
+                try:
+                    handle.content.delete()
+                except Exception as e:
+                    logger.warning("Failed to delete cached content: %s", e)
+        
+        self.invalidated += len(dropped)
+        return len(dropped)
+    
+    def discard(self, handle: CachedPrefix) -> None:
+        """Forget a handle the API no longer accepts (expired or deleted)"""
+        with self._lock:
+            if self._handles.get(handle.key) is handle:
+                del self._handles[handle.key]
+    
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            live = [h for h in self._handles.values() if h.expires_at > now]
+        return {
+            'enabled': self.enabled,
+            'handles': len(live),
+            'created': self.created,
+            'refreshed': self.refreshed,
+            'invalidated': self.invalidated,
+            'failed': self.failed,
+            'hits': self.hits,
+            'tokensSaved': self.tokens_saved
+        }
+    
+    def _live(self, key: Tuple[str, str]) -> Optional[CachedPrefix]:
+        """Handle that stays valid past the refresh margin, counted as a hit"""
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle is None or handle.expires_at <= time.time() + self.refresh_margin:
+                return None
+            handle.hits += 1
+            self.hits += 1
+            self.tokens_saved += handle.tokens
+            return handle
+    
+    def _refresh(self, handle: CachedPrefix, local: bool) -> bool:
+        """Extend a handle's TTL; False if it has to be recreated"""
+        try:
+            if not local and not handle.is_local:
+                handle.content.update(ttl=datetime.timedelta(seconds=self.ttl))
+        except Exception as e:
+            logger.warning("Failed to refresh cached content: %s", e)
+            return False
+        handle.expires_at = time.time() + self.ttl
+        self.refreshed += 1
+        return True
+    
+    def _create(self, key: Tuple[str, str], model: str, prefix: str, tag: str, tokens: int, local: bool) -> CachedPrefix:
+        expires_at = time.time() + self.ttl
+        if local:
+            return CachedPrefix(key, model, tag, tokens, expires_at)
+        
+        import google.generativeai as genai
+        from google.generativeai import caching
+        
+        content = caching.CachedContent.create(
+            model=f"models/{model}",
+            display_name=f"{tag or 'prompt'}-{key[1][:12]}",
+            contents=[prefix],
+            ttl=datetime.timedelta(seconds=self.ttl)
+        )
+        client = genai.GenerativeModel.from_cached_content(cached_content=content)
+        logger.info("Cached prompt prefix", extra={'model': model, 'tokens': tokens, 'tag': tag or 'prompt'})
+        return CachedPrefix(key, model, tag, tokens, expires_at, content, client)
+
+
+context_cache = ContextCache()
+
+# Edited prompts produce new prefixes; release the old cached contents now
+# instead of paying for them until their TTL runs out
+prompt_registry.subscribe(lambda prompt_type, version: context_cache.invalidate(prompt_type))
@@ -0,0 +1,276 @@
+"""
+Email Model - Compact in-memory representation for large inboxes
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from enum import IntEnum
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+
+class Category(IntEnum):
+    """Email category stored as a small integer"""
+    UNCATEGORIZED = 0
+    IMPORTANT = 1
+    NEWSLETTER = 2
+    SPAM = 3
+    TODO = 4
+    
+    @property
+    def label(self) -> str:
+        return _CATEGORY_LABELS[self]
+    
+    @classmethod
+    def from_label(cls, label: Optional[str]) -> Optional['Category']:
+        """Map an API category name to the enum; None stays None (unprocessed)"""
+        if label is None:
+            return None
+        return _CATEGORY_BY_LABEL.get(label, cls.UNCATEGORIZED)
+
+
+_CATEGORY_LABELS = {
+    Category.UNCATEGORIZED: 'Uncategorized',
+    Category.IMPORTANT: 'Important',
+    Category.NEWSLETTER: 'Newsletter',
+    Category.SPAM: 'Spam',
+    Category.TODO: 'To-Do'
+}
+_CATEGORY_BY_LABEL = {label: category for category, label in _CATEGORY_LABELS.items()}
+
+
+class Priority(IntEnum):
+    """Action item priority stored as a small integer"""
+    NONE = 0
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+    
+    @property
+    def label(self) -> Optional[str]:
+        return None if self is Priority.NONE else self.name.lower()
+    
+    @classmethod
+    def from_label(cls, label: Optional[str]) -> 'Priority':
+        return cls.__members__.get(str(label or '').upper(), cls.NONE)
+
+
+class ActionItem:
+    """Slotted action item with an interned deadline and enum priority"""
+    
+    __slots__ = ('task', 'deadline', 'priority')
+    
+    def __init__(self, task: str, deadline: Optional[str], priority: Priority):
+        self.task = task
+        self.deadline = deadline
+        self.priority = priority
+    
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> 'ActionItem':
+        deadline = item.get('deadline')
+        return cls(
+            str(item.get('task', '')),
+            sys.intern(deadline) if isinstance(deadline, str) else None,
+            Priority.from_label(item.get('priority'))
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'task': self.task,
+            'deadline': self.deadline,
+            'priority': self.priority.label
+        }
+
+
+class BodyStore:
+    """
+    Append-only spill file holding email bodies off the Python heap
+    
+    Records keep only an (offset, length) reference; the text is read back
+    on demand. Rewritten bodies are appended, so the file grows until the
+    store is discarded.
+    """
+    
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._lock = threading.Lock()
+        self._size = 0
+    
+    def write(self, body: str) -> Tuple[int, int]:
+        """Append a body and return its (offset, length) reference"""
+        data = body.encode('utf-8')
+        with self._lock:
+            offset = self._size
+            self._file.seek(offset)
+            self._file.write(data)
+            self._size += len(data)
+        return offset, len(data)
+    
+    def read(self, ref: Tuple[int, int]) -> str:
+        offset, length = ref
+        if length == 0:
+            return ''
+        with self._lock:
+            self._file.flush()
+            data = os.pread(self._file.fileno(), length, offset) if hasattr(os, 'pread') else self._read_seek(offset, length)
+        return data.decode('utf-8')
+    
+    @property
+    def size(self) -> int:
+        """Bytes written to the spill file"""
+        return self._size
+    
+    def close(self) -> None:
+        self._file.close()
+    
+    def _read_seek(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+
+_IS_READ = 1
+_HAS_ATTACHMENTS = 2
+
+
+class EmailRecord:
+    """
+    Slotted email with interned sender fields and enum category
+    
+    The body is either kept inline or, when the owning store spills bodies,
+    referenced in its BodyStore and loaded lazily.
+    """
+    
+    __slots__ = (
+        'id', 'sender', 'sender_name', 'subject', 'timestamp',
+        'category', 'flags', 'action_items', '_body', '_store'
+    )
+    
+    def __init__(self, store: 'EmailStore'):
+        self._store = store
+    
+    @property
+    def body(self) -> str:
+        if isinstance(self._body, tuple):
+            return self._store.body_store.read(self._body)
+        return self._body or ''
+    
+    @property
+    def is_read(self) -> bool:
+        return bool(self.flags & _IS_READ)
+    
+    @property
+    def has_attachments(self) -> bool:
+        return bool(self.flags & _HAS_ATTACHMENTS)
+    
+    def to_dict(self, include_body: bool = True) -> Dict[str, Any]:
+        """Expand to the email dict shape used by the API"""
+        data = {
+            'id': self.id,
+            'sender': self.sender,
+            'senderName': self.sender_name,
+            'subject': self.subject,
+            'timestamp': self.timestamp,
+            'category': self.category.label if self.category is not None else None,
+            'actionItems': [item.to_dict() for item in self.action_items],
+            'isRead': self.is_read,
+            'hasAttachments': self.has_attachments
+        }
+        if include_body:
+            data['body'] = self.body
+        return data
+
+
+def _intern(value: Any) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else None
+
+
+class EmailStore:
+    """
+    Compact, id-indexed collection of EmailRecord objects
+    
+    Senders, sender names and deadlines are interned so repeated values are
+    stored once; categories and priorities are small enums. With
+    spill_bodies enabled, bodies live in a temporary file instead of the
+    heap. Insertion order is preserved.
+    """
+    
+    def __init__(self, spill_bodies: bool = False, spill_dir: Optional[str] = None):
+        self.body_store = BodyStore(spill_dir) if spill_bodies else None
+        self._records: Dict[str, EmailRecord] = {}
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    def __contains__(self, email_id: str) -> bool:
+        return email_id in self._records
+    
+    def __iter__(self) -> Iterator[EmailRecord]:
+        return iter(list(self._records.values()))
+    
+    def get(self, email_id: str) -> Optional[EmailRecord]:
+        return self._records.get(email_id)
+    
+    def ids(self) -> List[str]:
+        return list(self._records)
+    
+    def put(self, email: Dict[str, Any]) -> EmailRecord:
+        """
+        Insert or replace an email from its dict form
+        
+        Args:
+            email: Email object with id and optional category/actionItems
+        
+        Returns:
+            The stored record
+        """
+        record = EmailRecord(self)
+        record.id = email['id']
+        record.sender = _intern(email.get('sender')) or ''
+        record.sender_name = _intern(email.get('senderName')) or ''
+        record.subject = email.get('subject') or ''
+        record.timestamp = email.get('timestamp')
+        record.category = Category.from_label(email.get('category'))
+        record.flags = (_IS_READ if email.get('isRead') else 0) | (_HAS_ATTACHMENTS if email.get('hasAttachments') else 0)
+        record.action_items = tuple(
+            ActionItem.from_dict(item) for item in email.get('actionItems') or []
+            if isinstance(item, dict)
+        )
+        
+        body = email.get('body') or ''
+        record._body = self.body_store.write(body) if self.body_store is not None and body else body
+        
+        self._records[record.id] = record
+        return record
+    
+    def set_result(self, email_id: str, category: Optional[str], action_items: List[Dict[str, Any]]) -> bool:
+        """
+        Apply processing results to a stored email
+        
+        Returns:
+            False if the email is not in the store
+        """
+        record = self._records.get(email_id)
+        if record is None:
+            return False
+        record.category = Category.from_label(category)
+        record.action_items = tuple(
+            ActionItem.from_dict(item) for item in action_items
+            if isinstance(item, dict)
+        )
+        return True
+    
+    def remove(self, email_id: str) -> None:
+        self._records.pop(email_id, None)
+    
+    def to_dicts(self, ids: Optional[List[str]] = None, include_body: bool = True) -> List[Dict[str, Any]]:
+        """Expand records (optionally a given id order) to API dicts"""
+        if ids is None:
+            records = list(self._records.values())
+        else:
+            records = [self._records[email_id] for email_id in ids if email_id in self._records]
+        return [record.to_dict(include_body) for record in records]
+    
+    def close(self) -> None:
+        if self.body_store is not None:
+            self.body_store.close()
@@ -2,17 +2,354 @@
 Email Processor - Categorizes emails and extracts action items using LLM
 """
 
-from typing import Dict, List, Any
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Iterable, Iterator, Tuple
 from .llm_service import GeminiService, parse_category
+from .prompt_registry import CompiledTemplate
+from .email_model import Category, Priority
+from .log import get_logger
 
 
-def process_email(email: Dict[str, Any], prompts: Dict[str, Any]) -> Dict[str, Any]:
+# Ask for positional indices and integer codes under a response schema
+# instead of verbose per-email JSON objects
+STRUCTURED_BATCH_OUTPUT = os.getenv('STRUCTURED_BATCH_OUTPUT', 'true').lower() == 'true'
+
+# Single-email strategies: categorize then extract, both at once, or one
+# combined call
+REPROCESS_STRATEGIES = ('sequential', 'parallel', 'combined')
+REPROCESS_STRATEGY = os.getenv('REPROCESS_STRATEGY', 'parallel')
+SPECULATION_WORKERS = int(os.getenv('SPECULATION_WORKERS', '4'))
+
+ACTIONABLE_CATEGORIES = ('Important', 'To-Do')
+
+logger = get_logger(__name__)
+
+# Runs the speculative action extraction next to categorization
+_speculation_pool = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix='speculative')
+
+
+# Batch prompt templates, parsed once at import instead of rebuilt per call
+CATEGORIZATION_BATCH_TEMPLATE = CompiledTemplate("""{instructions}
+
+IMPORTANT: You must categorize ALL of the following emails. Return a JSON array with one object per email.
+Format: [{{"emailId": "email-001", "category": "Important"}}, {{"emailId": "email-002", "category": "Newsletter"}}, ...]
+
+Valid categories: Important, Newsletter, Spam, To-Do, Uncategorized
+
+Here are the emails to categorize:
+""")
+
+ACTION_BATCH_TEMPLATE = CompiledTemplate("""{instructions}
+
+IMPORTANT: Extract action items from ALL of the following emails. Return a JSON array with one object per email.
+Format: [{{"emailId": "email-001", "actionItems": [{{"task": "...", "deadline": "...", "priority": "..."}}]}}, ...]
+
+Here are the emails:
+""")
+
+CATEGORIZATION_COMPACT_TEMPLATE = CompiledTemplate("""{instructions}
+
+IMPORTANT: You must categorize ALL of the following emails. Emails are numbered from 0. Return a JSON array with one [email number, category code] pair per email.
+Format: [[0, 1], [1, 2], ...]
+
+Category codes: {codes}
+
+Here are the emails to categorize:
+""")
+
+ACTION_COMPACT_TEMPLATE = CompiledTemplate("""{instructions}
+
+IMPORTANT: Extract action items from ALL of the following emails. Emails are numbered from 0. Return a JSON array with one object per email that has action items: "i" is the email number and "a" the list of items, each with "t" (task), "d" (deadline, or "none") and "p" (priority code).
+Format: [{{"i": 0, "a": [{{"t": "...", "d": "...", "p": 3}}]}}, ...]
+
+Priority codes: {codes}
+
+Here are the emails:
+""")
+
+CATEGORY_CODES = ', '.join(
+    f"{category.value} = {category.label}"
+    for category in sorted(Category, key=lambda c: c or len(Category))
+)
+PRIORITY_CODES = ', '.join(
+    f"{priority.value} = {priority.label}"
+    for priority in sorted(Priority, reverse=True) if priority
+)
+
+# Response schemas (OpenAPI subset) for Gemini JSON mode
+CATEGORY_PAIRS_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {'type': 'ARRAY', 'items': {'type': 'INTEGER'}}
+}
+_COMPACT_ACTION_ITEMS = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            't': {'type': 'STRING'},
+            'd': {'type': 'STRING'},
+            'p': {'type': 'INTEGER'}
+        },
+        'required': ['t', 'd', 'p']
+    }
+}
+ACTION_ITEMS_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'i': {'type': 'INTEGER'},
+            'a': _COMPACT_ACTION_ITEMS
+        },
+        'required': ['i', 'a']
+    }
+}
+COMBINED_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'c': {'type': 'INTEGER'},
+            'a': _COMPACT_ACTION_ITEMS
+        },
+        'required': ['c', 'a']
+    }
+}
+
+COMBINED_TEMPLATE = CompiledTemplate("""{categorization}
+
+{actionExtraction}
+
+IMPORTANT: Do both tasks above for the one email below in a single answer. Return a JSON array with one object: "c" is the category code and "a" the action items (an empty list unless the category is Important or To-Do), each with "t" (task), "d" (deadline, or "none") and "p" (priority code).
+Format: [{{"c": 1, "a": [{{"t": "...", "d": "...", "p": 3}}]}}]
+
+Category codes: {categoryCodes}
+Priority codes: {priorityCodes}
+
+Email:
+{email}""")
+
+EMAIL_BLOCK_TEMPLATE = CompiledTemplate("""
+---
+Email ID: {id}
+Sender: {senderName} <{sender}>
+Subject: {subject}
+Body:
+{body}
+---
+""")
+
+
+NUMBERED_EMAIL_BLOCK_TEMPLATE = CompiledTemplate("""
+---
+Email #{id}
+Sender: {senderName} <{sender}>
+Subject: {subject}
+Body:
+{body}
+---
+""")
+
+
+def render_email_blocks(emails: List[Dict[str, Any]], numbered: bool = False) -> str:
+    """Render the per-email part of a batch prompt, labelled by id or by position"""
+    template = NUMBERED_EMAIL_BLOCK_TEMPLATE if numbered else EMAIL_BLOCK_TEMPLATE
+    return ''.join(
+        template.render(
+            id=index if numbered else email.get('id', 'unknown'),
+            senderName=email.get('senderName', 'Unknown'),
+            sender=email.get('sender', ''),
+            subject=email.get('subject', 'No subject'),
+            body=email.get('body', '')
+        )
+        for index, email in enumerate(emails)
+    )
+
+
+def _is_code(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_category_pairs(items: Iterable[Any], emails: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Map compact [index, category code] pairs back to email ids and labels
+    
+    Pairs with an out-of-range index or unknown code are dropped, as is any
+    repeat of an index already seen; those emails stay Uncategorized.
+    
+    Args:
+        items: Parsed array elements from the model
+        emails: The emails in the order they were numbered in the prompt
+    
+    Returns:
+        Email id -> category label
+    """
+    categories = {}
+    rejected = 0
+    for item in items:
+        if (
+            isinstance(item, list) and len(item) == 2
+            and _is_code(item[0]) and _is_code(item[1])
+            and 0 <= item[0] < len(emails) and item[0] not in categories
+            and item[1] in Category._value2member_map_
+        ):
+            categories[item[0]] = Category(item[1]).label
+        else:
+            rejected += 1
+    
+    if rejected:
+        logger.warning("Rejected invalid category pairs", extra={'rejected': rejected})
+    return {emails[index].get('id'): label for index, label in categories.items()}
+
+
+def decode_action_entries(items: Iterable[Any], emails: List[Dict[str, Any]]) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Map compact {"i", "a"} entries back to email ids and action item dicts
+    
+    Entries with an out-of-range or repeated index are dropped. Items
+    without a task are dropped; an unknown priority code becomes None.
+    
+    Args:
+        items: Parsed array elements from the model
+        emails: The emails in the order they were numbered in the prompt
+    
+    Yields:
+        (email id, action items) as each entry arrives
+    """
+    seen = set()
+    rejected = 0
+    for item in items:
+        index = item.get('i') if isinstance(item, dict) else None
+        if not _is_code(index) or not 0 <= index < len(emails) or index in seen or not isinstance(item.get('a'), list):
+            rejected += 1
+            continue
+        seen.add(index)
+        
+        action_items, dropped = _decode_action_items(item['a'])
+        rejected += dropped
+        yield emails[index].get('id'), action_items
+    
+    if rejected:
+        logger.warning("Rejected invalid action items", extra={'rejected': rejected})
+
+
+def _decode_action_items(raw: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+    """Compact {"t", "d", "p"} items to action item dicts, plus the number dropped"""
+    action_items = []
+    dropped = 0
+    for ai in raw:
+        if not isinstance(ai, dict) or not isinstance(ai.get('t'), str) or not ai['t'].strip():
+            dropped += 1
+            continue
+        code = ai.get('p')
+        priority = Priority(code) if _is_code(code) and code in Priority._value2member_map_ else Priority.NONE
+        deadline = ai.get('d')
+        action_items.append({
+            'task': ai['t'],
+            'deadline': deadline if isinstance(deadline, str) else 'none',
+            'priority': priority.label
+        })
+    return action_items, dropped
+
+
+def _categorize_batch(categorizer: GeminiService, emails: List[Dict[str, Any]], instructions: str) -> Dict[str, str]:
+    """Categorize emails in one streamed call; returns email id -> category label"""
+    # The preamble is identical for every chunk, so it is sent as a
+    # prefix the model can keep cached between calls
+    if STRUCTURED_BATCH_OUTPUT:
+        preamble = CATEGORIZATION_COMPACT_TEMPLATE.render(instructions=instructions, codes=CATEGORY_CODES)
+        items = categorizer.iter_json(render_email_blocks(emails, numbered=True), prefix=preamble, schema=CATEGORY_PAIRS_SCHEMA)
+        return decode_category_pairs(items, emails)
+    
+    preamble = CATEGORIZATION_BATCH_TEMPLATE.render(instructions=instructions)
+    category_map = {}
+    for item in categorizer.iter_json(render_email_blocks(emails), prefix=preamble):
+        if isinstance(item, dict) and 'emailId' in item and 'category' in item:
+            category_map[item['emailId']] = parse_category(item['category'])
+    return category_map
+
+
+def _extract_actions_batch(
+    extractor: GeminiService,
+    emails: List[Dict[str, Any]],
+    instructions: str
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """Extract action items in one streamed call, yielding (email id, items) as they arrive"""
+    if STRUCTURED_BATCH_OUTPUT:
+        preamble = ACTION_COMPACT_TEMPLATE.render(instructions=instructions, codes=PRIORITY_CODES)
+        items = extractor.iter_json(render_email_blocks(emails, numbered=True), prefix=preamble, schema=ACTION_ITEMS_SCHEMA)
+        yield from decode_action_entries(items, emails)
+        return
+    
+    preamble = ACTION_BATCH_TEMPLATE.render(instructions=instructions)
+    for item in extractor.iter_json(render_email_blocks(emails), prefix=preamble):
+        if isinstance(item, dict) and 'emailId' in item:
+            action_items = item.get('actionItems', [])
+            if isinstance(action_items, list):
+                yield item['emailId'], [
+                    ai for ai in action_items
+                    if isinstance(ai, dict) and 'task' in ai
+                ]
+
+
+def _email_context(email: Dict[str, Any]) -> str:
+    return f"""Sender: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
+Subject: {email.get('subject', 'No subject')}
+
+Body:
+{email.get('body', '')}"""
+
+
+def _extract_actions(extractor: GeminiService, email_context: str, instructions: str) -> List[Dict[str, Any]]:
+    """Single-email action extraction call"""
+    action_items = extractor.generate_json(f"{instructions}\n\nEmail:\n{email_context}")
+    if not isinstance(action_items, list):
+        return []
+    return [item for item in action_items if isinstance(item, dict) and 'task' in item]
+
+
+def _process_combined(email_context: str, prompts: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """Categorize and extract action items with one schema-constrained call"""
+    prompt = COMBINED_TEMPLATE.render(
+        categorization=prompts.get('categorization', {}).get('prompt', ''),
+        actionExtraction=prompts.get('actionExtraction', {}).get('prompt', ''),
+        categoryCodes=CATEGORY_CODES,
+        priorityCodes=PRIORITY_CODES,
+        email=email_context
+    )
+    items = GeminiService('actionExtraction').generate_json(prompt, schema=COMBINED_SCHEMA)
+    answer = items[0] if items and isinstance(items[0], dict) else {}
+    code = answer.get('c')
+    
+    if not _is_code(code) or code not in Category._value2member_map_:
+        result['error'] = 'Failed to categorize email'
+        logger.warning("No valid category in combined response", extra={'emailId': result['id']})
+        return
+    
+    result['category'] = Category(code).label
+    logger.debug("Email categorized", extra={'emailId': result['id'], 'category': result['category'], 'sample': True})
+    if result['category'] in ACTIONABLE_CATEGORIES and isinstance(answer.get('a'), list):
+        result['actionItems'], _ = _decode_action_items(answer['a'])
+
+
+def process_email(email: Dict[str, Any], prompts: Dict[str, Any], strategy: str = 'sequential') -> Dict[str, Any]:
     """
     Process a single email with categorization and action extraction
     
+    Strategies:
+    - sequential: categorize, then extract action items only if needed
+    - parallel: start action extraction alongside categorization and
+      discard it if the category does not need action items; costs an
+      extra call for other categories but halves latency for the ones
+      that matter
+    - combined: one schema-constrained call returning both
+    
     Args:
         email: Email object with id, subject, body, sender, etc.
         prompts: Dictionary containing prompt objects with 'prompt' field
+        strategy: One of REPROCESS_STRATEGIES
     
     Returns:
         {
@@ -23,8 +360,13 @@ def process_email(email: Dict[str, Any], prompts: Dict[str, Any]) -> Dict[str, A
             ],
             'error': Optional error message if processing failed
         }
+    
+    Raises:
+        ValueError: If the strategy is unknown
     """
-    llm_service = GeminiService()
+    if strategy not in REPROCESS_STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    
     result = {
         'id': email.get('id'),
         'category': 'Uncategorized',
@@ -33,38 +375,43 @@ def process_email(email: Dict[str, Any], prompts: Dict[str, Any]) -> Dict[str, A
     }
     
     try:
-        email_context = f"""Sender: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
-Subject: {email.get('subject', 'No subject')}
-
-Body:
-{email.get('body', '')}"""
-        
+        email_context = _email_context(email)
         cat_prompt_text = prompts.get('categorization', {}).get('prompt', '')
+        action_prompt_text = prompts.get('actionExtraction', {}).get('prompt', '')
+        
+        if strategy == 'combined' and cat_prompt_text and action_prompt_text:
+            _process_combined(email_context, prompts, result)
+            return result
+        
+        speculative = None
+        if strategy == 'parallel' and cat_prompt_text and action_prompt_text:
+            # Copy the context so the call stays attributed to this tenant
+            speculative = _speculation_pool.submit(
+                contextvars.copy_context().run,
+                _extract_actions, GeminiService('actionExtraction'), email_context, action_prompt_text
+            )
+        
         if cat_prompt_text:
             full_prompt = f"{cat_prompt_text}\n\nEmail:\n{email_context}"
-            category_response = llm_service.generate_text(full_prompt)
+            category_response = GeminiService('categorization').generate_text(full_prompt)
             
             if category_response:
                 result['category'] = parse_category(category_response)
-                print(f"✓ Email {email.get('id')}: Category = {result['category']}")
+                logger.debug("Email categorized", extra={'emailId': email.get('id'), 'category': result['category'], 'sample': True})
             else:
                 result['error'] = 'Failed to categorize email'
-                print(f"✗ Email {email.get('id')}: Failed to get category response")
+                logger.warning("No category response", extra={'emailId': email.get('id')})
         
-        if result['category'] in ['Important', 'To-Do']:
-            action_prompt_text = prompts.get('actionExtraction', {}).get('prompt', '')
-            if action_prompt_text:
-                full_prompt = f"{action_prompt_text}\n\nEmail:\n{email_context}"
-                action_items = llm_service.generate_json(full_prompt)
-                
-                if isinstance(action_items, list):
-                    result['actionItems'] = [
-                        item for item in action_items
-                        if isinstance(item, dict) and 'task' in item
-                    ]
+        if result['category'] in ACTIONABLE_CATEGORIES and action_prompt_text:
+            if speculative is not None:
+                result['actionItems'] = speculative.result()
+            else:
+                result['actionItems'] = _extract_actions(GeminiService('actionExtraction'), email_context, action_prompt_text)
+        elif speculative is not None and not speculative.cancel():
+            logger.debug("Discarding speculative action items", extra={'emailId': email.get('id'), 'category': result['category'], 'sample': True})
         
     except Exception as e:
-        print(f"Error processing email {email.get('id')}: {e}")
+        logger.error("Error processing email: %s", e, extra={'emailId': email.get('id')})
         result['error'] = str(e)
     
     return result
@@ -91,51 +438,23 @@ def process_emails_batch(emails: List[Dict[str, Any]], prompts: Dict[str, Any])
             'errors': List of error messages
         }
     """
-    llm_service = GeminiService()
+    categorizer = GeminiService('categorization')
+    extractor = GeminiService('actionExtraction')
     results = []
     errors = []
     
     try:
-        print(f"🚀 Starting batch categorization for {len(emails)} emails...")
+        logger.debug("Starting batch categorization", extra={'emails': len(emails)})
         
         cat_prompt_text = prompts.get('categorization', {}).get('prompt', '')
         if not cat_prompt_text:
             raise Exception("Categorization prompt not found")
         
-        # Build batch categorization prompt
-        batch_prompt = f"""{cat_prompt_text}
-
-IMPORTANT: You must categorize ALL of the following emails. Return a JSON array with one object per email.
-Format: [{{"emailId": "email-001", "category": "Important"}}, {{"emailId": "email-002", "category": "Newsletter"}}, ...]
-
-Valid categories: Important, Newsletter, Spam, To-Do, Uncategorized
-
-Here are the emails to categorize:
-"""
-        
-        for email in emails:
-            email_id = email.get('id', 'unknown')
-            batch_prompt += f"""
----
-Email ID: {email_id}
-Sender: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
-Subject: {email.get('subject', 'No subject')}
-Body:
-{email.get('body', '')}
----
-"""
-        
-        categories_response = llm_service.generate_json(batch_prompt)
-        
-        if not isinstance(categories_response, list):
-            raise Exception(f"Expected JSON array, got: {type(categories_response)}")
-        
-        category_map = {}
-        for item in categories_response:
-            if isinstance(item, dict) and 'emailId' in item and 'category' in item:
-                category_map[item['emailId']] = parse_category(item['category'])
+        # Results are consumed as they stream in; a truncated response
+        # still keeps every email categorized before the cut
+        category_map = _categorize_batch(categorizer, emails, cat_prompt_text)
         
-        print(f"✓ Batch categorization complete: {len(category_map)} emails categorized")
+        logger.debug("Batch categorization complete", extra={'categorized': len(category_map)})
         
         for email in emails:
             email_id = email.get('id')
@@ -148,63 +467,29 @@ Body:
         
         emails_needing_actions = [
             email for email in emails 
-            if category_map.get(email.get('id')) in ['Important', 'To-Do']
+            if category_map.get(email.get('id')) in ACTIONABLE_CATEGORIES
         ]
         
         if emails_needing_actions:
-            print(f"🚀 Starting batch action extraction for {len(emails_needing_actions)} emails...")
+            logger.debug("Starting batch action extraction", extra={'emails': len(emails_needing_actions)})
             
             action_prompt_text = prompts.get('actionExtraction', {}).get('prompt', '')
             if not action_prompt_text:
-                print("⚠️  Action extraction prompt not found, skipping action items")
+                logger.warning("Action extraction prompt not found, skipping action items")
             else:
-                action_batch_prompt = f"""{action_prompt_text}
-
-IMPORTANT: Extract action items from ALL of the following emails. Return a JSON array with one object per email.
-Format: [{{"emailId": "email-001", "actionItems": [{{"task": "...", "deadline": "...", "priority": "..."}}]}}, ...]
-
-Here are the emails:
-"""
-                
-                for email in emails_needing_actions:
-                    email_id = email.get('id', 'unknown')
-                    action_batch_prompt += f"""
----
-Email ID: {email_id}
-Sender: {email.get('senderName', 'Unknown')} <{email.get('sender', '')}>
-Subject: {email.get('subject', 'No subject')}
-Body:
-{email.get('body', '')}
----
-"""
+                results_by_id = {result['id']: result for result in results}
                 
-                actions_response = llm_service.generate_json(action_batch_prompt)
+                for email_id, action_items in _extract_actions_batch(extractor, emails_needing_actions, action_prompt_text):
+                    result = results_by_id.get(email_id)
+                    if result is not None:
+                        result['actionItems'] = action_items
                 
-                if isinstance(actions_response, list):
-                    for item in actions_response:
-                        if isinstance(item, dict) and 'emailId' in item:
-                            email_id = item['emailId']
-                            action_items = item.get('actionItems', [])
-                            
-                            if isinstance(action_items, list):
-                                validated_items = [
-                                    ai for ai in action_items 
-                                    if isinstance(ai, dict) and 'task' in ai
-                                ]
-                                
-                                for result in results:
-                                    if result['id'] == email_id:
-                                        result['actionItems'] = validated_items
-                                        break
-                    
-                    print(f"✓ Batch action extraction complete")
-                else:
-                    print(f"⚠️  Expected JSON array for actions, got: {type(actions_response)}")
+                logger.debug("Batch action extraction complete")
         else:
-            print("ℹ️  No emails need action extraction (none are Important/To-Do)")
+            logger.debug("No emails need action extraction")
         
     except Exception as e:
-        print(f"❌ Batch processing failed: {e}")
+        logger.error("Batch processing failed: %s", e, extra={'emails': len(emails)})
         errors.append(f"Batch processing error: {str(e)}")
         
         if not results:
@@ -217,7 +502,7 @@ Body:
     
     processed_count = len([r for r in results if not r.get('error')])
     
-    print(f"📊 Batch processing summary: {processed_count}/{len(emails)} emails processed successfully")
+    logger.info("Batch processed", extra={'processed': processed_count, 'emails': len(emails)})
     
     return {
         'success': len(errors) == 0,
@@ -0,0 +1,296 @@
+"""
+Hedging - Backup requests for slow interactive LLM calls
+"""
+
+import os
+import time
+import queue
+import threading
+import contextvars
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, Iterator, Optional
+
+
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'true').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.5'))
+HEDGE_INITIAL_DELAY = float(os.getenv('HEDGE_INITIAL_DELAY', '5'))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+HEDGE_WINDOW = int(os.getenv('HEDGE_WINDOW', '200'))
+HEDGE_BUDGET = float(os.getenv('HEDGE_BUDGET', '0.05'))
+HEDGE_BURST = int(os.getenv('HEDGE_BURST', '3'))
+# Shared threads running attempts (two per call at most, so twice the
+# interactive admission limit); a hedge takes one only once its delay passes
+HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', '16'))
+
+_DONE = object()
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies per key"""
+    
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+    
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[key].append(seconds)
+    
+    def percentile(self, key: str, pct: float) -> Optional[float]:
+        """Nearest-rank percentile, or None with no samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, int(round(pct / 100 * len(samples))) - 1))
+        return samples[rank]
+    
+    def count(self, key: str) -> int:
+        with self._lock:
+            return len(self._samples.get(key, ()))
+
+
+class Hedger:
+    """
+    Sends a backup request when a call runs past its usual latency
+    
+    The hedge delay is the HEDGE_PERCENTILE latency of recent calls for the
+    same task (HEDGE_INITIAL_DELAY until HEDGE_MIN_SAMPLES are seen). The
+    first usable response wins and the other attempt is cancelled. Hedges
+    are capped at HEDGE_BUDGET of calls (plus a small burst allowance), so
+    they cut the tail without doubling cost. Attempts run on a shared
+    pool of worker threads rather than a new thread per call.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = HEDGE_ENABLED,
+        percentile: float = HEDGE_PERCENTILE,
+        min_delay: float = HEDGE_MIN_DELAY,
+        initial_delay: float = HEDGE_INITIAL_DELAY,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        budget: float = HEDGE_BUDGET,
+        burst: int = HEDGE_BURST,
+        workers: int = HEDGE_WORKERS
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.budget = budget
+        self.burst = burst
+        self.latencies = LatencyTracker()
+        self._executor = ThreadPoolExecutor(max_workers=max(2, workers), thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self.denied = 0
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {'calls': 0, 'hedged': 0, 'hedgeWins': 0})
+    
+    def delay(self, key: str) -> float:
+        """Seconds to wait before hedging a call for this key"""
+        if self.latencies.count(key) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(key, self.percentile))
+    
+    def run(self, task: str, attempt: Callable[[threading.Event], Any]) -> Any:
+        """
+        Run attempt, hedging it with a second identical attempt if slow
+        
+        Args:
+            task: Latency key, e.g. the model routing task
+            attempt: Callable taking a cancel event and returning a result;
+                None counts as a failed attempt
+        
+        Returns:
+            The first non-None result, or None if every attempt failed
+        
+        Raises:
+            Exception: The first attempt's error if every attempt raised
+        """
+        results: 'queue.Queue' = queue.Queue()
+        cancels = []
+        
+        def launch(index: int) -> None:
+            cancel = threading.Event()
+            cancels.append(cancel)
+            started = time.monotonic()
+            
+            def target():
+                try:
+                    result = attempt(cancel)
+                    if result is not None and not cancel.is_set():
+                        self.latencies.record(task, time.monotonic() - started)
+                    results.put((index, result, None))
+                except Exception as e:
+                    results.put((index, None, e))
+            
+            # Run in a copy of the caller's context so the tenant carries over
+            self._executor.submit(contextvars.copy_context().run, target)
+        
+        self._count_call(task)
+        launch(0)
+        timeout = self.delay(task)
+        finished = 0
+        first_error = None
+        
+        try:
+            while True:
+                try:
+                    index, result, error = results.get(timeout=timeout)
+                except queue.Empty:
+                    timeout = None
+                    if self._allow_hedge(task):
+                        launch(1)
+                    continue
+                
+                finished += 1
+                if result is not None:
+                    if index > 0:
+                        self._count_win(task)
+                    return result
+                first_error = first_error or error
+                if finished == len(cancels):
+                    # Every launched attempt failed; a primary that fails
+                    # before the hedge delay is not hedged (retries are its job)
+                    if first_error is not None:
+                        raise first_error
+                    return None
+        finally:
+            for cancel in cancels:
+                cancel.set()
+    
+    def stream(self, task: str, open_stream: Callable[[threading.Event], Iterator[str]]) -> Iterator[str]:
+        """
+        Stream from the attempt that produces output first
+        
+        The hedge delay applies to time to first chunk. Once one attempt
+        has produced a chunk, the other is cancelled and only the winner's
+        chunks are yielded.
+        
+        Args:
+            task: Latency key, e.g. the model routing task
+            open_stream: Callable taking a cancel event and returning a
+                chunk iterator that stops once the event is set
+        
+        Yields:
+            Chunks from the winning attempt
+        """
+        key = f"{task}:first-chunk"
+        chunks: 'queue.Queue' = queue.Queue()
+        cancels = []
+        
+        def launch(index: int) -> None:
+            cancel = threading.Event()
+            cancels.append(cancel)
+            started = time.monotonic()
+            
+            def target():
+                first = True
+                try:
+                    for text in open_stream(cancel):
+                        if cancel.is_set():
+                            break
+                        if first:
+                            self.latencies.record(key, time.monotonic() - started)
+                            first = False
+                        chunks.put((index, text, None))
+                    chunks.put((index, _DONE, None))
+                except Exception as e:
+                    chunks.put((index, _DONE, e))
+            
+            # Run in a copy of the caller's context so the tenant carries over
+            self._executor.submit(contextvars.copy_context().run, target)
+        
+        self._count_call(task)
+        launch(0)
+        timeout = self.delay(key)
+        finished = 0
+        first_error = None
+        winner = None
+        
+        try:
+            while winner is None:
+                try:
+                    index, item, error = chunks.get(timeout=timeout)
+                except queue.Empty:
+                    timeout = None
+                    if self._allow_hedge(task):
+                        launch(1)
+                    continue
+                
+                if item is _DONE:
+                    finished += 1
+                    first_error = first_error or error
+                    if finished == len(cancels):
+                        if first_error is not None:
+                            raise first_error
+                        return
+                    continue
+                
+                winner = index
+                if index > 0:
+                    self._count_win(task)
+                for other, cancel in enumerate(cancels):
+                    if other != winner:
+                        cancel.set()
+                yield item
+            
+            while True:
+                index, item, error = chunks.get()
+                if index != winner:
+                    continue
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            for cancel in cancels:
+                cancel.set()
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats_by_task = {task: dict(stats) for task, stats in self._stats.items()}
+        tasks = {}
+        for task, stats in stats_by_task.items():
+            tasks[task] = {
+                **stats,
+                'hedgeDelay': round(self.delay(task), 3),
+                'firstChunkHedgeDelay': round(self.delay(f"{task}:first-chunk"), 3)
+            }
+        return {
+            'enabled': self.enabled,
+            'calls': self._calls,
+            'hedged': self._hedges,
+            'hedgeRate': round(self._hedges / self._calls, 4) if self._calls else 0.0,
+            'budget': self.budget,
+            'denied': self.denied,
+            'tasks': tasks
+        }
+    
+    def _count_call(self, task: str) -> None:
+        with self._lock:
+            self._calls += 1
+            self._stats[task]['calls'] += 1
+    
+    def _count_win(self, task: str) -> None:
+        with self._lock:
+            self._stats[task]['hedgeWins'] += 1
+    
+    def _allow_hedge(self, task: str) -> bool:
+        """Spend hedge budget if any is left"""
+        with self._lock:
+            if self._hedges >= self.budget * self._calls + self.burst:
+                self.denied += 1
+                return False
+            self._hedges += 1
+            self._stats[task]['hedged'] += 1
+            return True
+
+
+hedger = Hedger()
@@ -0,0 +1,335 @@
+"""
+Inbox Sync - Watches the inbox source and processes only new or modified mail
+"""
+
+import os
+import json
+import time
+import hashlib
+import mailbox
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+from .job_queue import job_queue
+from .mail_import import message_to_email
+from .email_model import EmailStore
+from .change_log import change_log
+from .email_processor import ACTIONABLE_CATEGORIES
+from .log import get_logger
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+INBOX_SOURCE = os.getenv('INBOX_SOURCE', os.path.join(DATA_DIR, 'mock_inbox.json'))
+SYNC_POLL_INTERVAL = float(os.getenv('SYNC_POLL_INTERVAL', '5'))
+SYNC_SPILL_BODIES = os.getenv('SYNC_SPILL_BODIES', 'false').lower() == 'true'
+
+HASHED_FIELDS = ('sender', 'senderName', 'subject', 'body')
+
+logger = get_logger(__name__)
+
+
+def email_content_hash(email: Dict[str, Any]) -> str:
+    """Hash the fields that affect categorization and action extraction"""
+    digest = hashlib.sha256()
+    for field in HASHED_FIELDS:
+        digest.update(str(email.get(field) or '').encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def load_inbox_source(source: str) -> List[Dict[str, Any]]:
+    """
+    Load every email from an inbox source
+    
+    Args:
+        source: Path to a JSON array of emails or a Maildir directory
+    
+    Returns:
+        List of email objects
+    """
+    if os.path.isdir(source):
+        maildir = mailbox.Maildir(source, create=False)
+        return [message_to_email(key, message) for key, message in maildir.iteritems()]
+    
+    with open(source, 'r', encoding='utf-8') as f:
+        emails = json.load(f)
+    return emails if isinstance(emails, list) else []
+
+
+def source_signature(source: str) -> Tuple:
+    """Cheap change marker for a source: mtimes and sizes, without reading mail"""
+    if os.path.isdir(source):
+        signature = []
+        for sub in ('new', 'cur'):
+            path = os.path.join(source, sub)
+            if os.path.isdir(path):
+                stat = os.stat(path)
+                signature.append((sub, stat.st_mtime_ns, len(os.listdir(path))))
+        return tuple(signature)
+    
+    stat = os.stat(source)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class InboxSync:
+    """
+    Keeps a processed copy of the inbox source current
+    
+    Each scan compares the source against the content hashes of the emails
+    already queued, and submits only new or modified messages to the job
+    queue. Results are merged back as each chunk finishes; emails removed
+    from the source are dropped. A background thread can poll the source.
+    """
+    
+    def __init__(self, source: str = INBOX_SOURCE, poll_interval: float = SYNC_POLL_INTERVAL):
+        self.source = source
+        self.poll_interval = poll_interval
+        self.prompts: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._order: List[str] = []
+        self._emails = EmailStore(spill_bodies=SYNC_SPILL_BODIES)
+        self._hashes: Dict[str, str] = {}
+        self._signature = None
+        self._job_ids: List[str] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_scan_at = None
+        self.last_changes = {'new': 0, 'modified': 0, 'deleted': 0}
+        self.last_error = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, prompts: Dict[str, Any], poll_interval: Optional[float] = None) -> None:
+        """
+        Start watching the source in a background thread
+        
+        Args:
+            prompts: Dictionary containing prompt objects used for processing
+            poll_interval: Seconds between source checks
+        """
+        self.prompts = prompts
+        if poll_interval:
+            self.poll_interval = poll_interval
+        if self.running:
+            return
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name='inbox-sync', daemon=True)
+        self._thread.start()
+        logger.info("Watching inbox source", extra={'source': self.source, 'pollInterval': self.poll_interval})
+    
+    def stop(self) -> None:
+        """Stop the background watcher"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+        self._thread = None
+    
+    def scan(self, prompts: Optional[Dict[str, Any]] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Check the source once and queue new or modified emails
+        
+        Args:
+            prompts: Prompts to use; defaults to those given to start()
+            force: Re-read the source even if its signature is unchanged
+        
+        Returns:
+            Counts of new, modified and deleted emails, and the queued job ID
+        """
+        if prompts:
+            self.prompts = prompts
+        
+        signature = source_signature(self.source)
+        if not force and signature == self._signature:
+            return {'new': 0, 'modified': 0, 'deleted': 0, 'jobId': None}
+        
+        emails = load_inbox_source(self.source)
+        changed = []
+        # Content version each queued email is processed at
+        versions = {}
+        counts = {'new': 0, 'modified': 0, 'deleted': 0}
+        
+        with self._lock:
+            seen = set()
+            order = []
+            for email in emails:
+                email_id = email.get('id')
+                if not email_id or email_id in seen:
+                    continue
+                seen.add(email_id)
+                order.append(email_id)
+                
+                content_hash = email_content_hash(email)
+                previous = self._hashes.get(email_id)
+                if previous == content_hash:
+                    continue
+                
+                counts['modified' if email_id in self._emails else 'new'] += 1
+                self._hashes[email_id] = content_hash
+                versions[email_id] = content_hash
+                self._emails.put({**email, 'category': None, 'actionItems': []})
+                changed.append(email)
+            
+            removed = set(self._emails.ids()) - seen
+            for email_id in removed:
+                counts['deleted'] += 1
+                self._emails.remove(email_id)
+                self._hashes.pop(email_id, None)
+            
+            change_log.record('email', [email.get('id') for email in changed])
+            change_log.record('email', removed, deleted=True)
+            
+            self._order = order
+            self._signature = signature
+        
+        job_id = None
+        if changed:
+            job = job_queue.submit(changed, self.prompts, on_results=lambda results: self._merge_results(results, versions))
+            job_id = job.id
+            self._job_ids = [jid for jid in self._job_ids if self._job_active(jid)] + [job_id]
+            logger.info("Inbox sync queued emails", extra={'queued': len(changed), 'new': counts['new'], 'modified': counts['modified'], 'jobId': job_id})
+        
+        self.last_scan_at = time.time()
+        self.last_changes = counts
+        return {**counts, 'jobId': job_id}
+    
+    def inbox(self) -> List[Dict[str, Any]]:
+        """Current processed inbox in source order"""
+        with self._lock:
+            return self._emails.to_dicts(self._order)
+    
+    def records(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Current processed emails by id, for delta sync"""
+        with self._lock:
+            return {email['id']: email for email in self._emails.to_dicts(ids)}
+    
+    def ids(self) -> List[str]:
+        """Email ids in source order"""
+        with self._lock:
+            return list(self._order)
+    
+    def apply_categories(self, categories: Dict[str, str]) -> int:
+        """
+        Set categories from an offline run, keeping the rest of each result
+        
+        Action items are kept while an email stays Important/To-Do and
+        cleared otherwise. Emails no longer in the inbox are skipped.
+        
+        Args:
+            categories: Email id -> category label
+        
+        Returns:
+            Number of emails whose category changed
+        """
+        with self._lock:
+            updated = []
+            for email_id, label in categories.items():
+                record = self._emails.get(email_id)
+                if record is None:
+                    continue
+                previous = record.category.label if record.category is not None else None
+                if previous == label:
+                    continue
+                action_items = [item.to_dict() for item in record.action_items] if label in ACTIONABLE_CATEGORIES else []
+                self._emails.set_result(email_id, label, action_items)
+                updated.append(email_id)
+            change_log.record('email', updated)
+        return len(updated)
+    
+    def apply_action_items(self, action_items: Dict[str, List[Dict[str, Any]]]) -> int:
+        """
+        Set action items from an offline run, keeping each email's category
+        
+        Returns:
+            Number of emails updated
+        """
+        with self._lock:
+            updated = []
+            for email_id, items in action_items.items():
+                record = self._emails.get(email_id)
+                if record is None:
+                    continue
+                category = record.category.label if record.category is not None else None
+                self._emails.set_result(email_id, category, items)
+                updated.append(email_id)
+            change_log.record('email', updated)
+        return len(updated)
+    
+    def needing_actions(self, ids: Optional[List[str]] = None) -> List[str]:
+        """Ids of Important/To-Do emails without action items, in source order"""
+        wanted = set(ids) if ids is not None else None
+        with self._lock:
+            pending = []
+            for email_id in self._order:
+                if wanted is not None and email_id not in wanted:
+                    continue
+                record = self._emails.get(email_id)
+                if (
+                    record is not None and record.category is not None
+                    and record.category.label in ACTIONABLE_CATEGORIES
+                    and not record.action_items
+                ):
+                    pending.append(email_id)
+            return pending
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            total = len(self._emails)
+            categorized = sum(1 for record in self._emails if record.category is not None)
+        return {
+            'source': self.source,
+            'running': self.running,
+            'pollInterval': self.poll_interval,
+            'lastScanAt': self.last_scan_at,
+            'lastChanges': self.last_changes,
+            'lastError': self.last_error,
+            'total': total,
+            'categorized': categorized,
+            'pendingJobs': [jid for jid in self._job_ids if self._job_active(jid)]
+        }
+    
+    def _merge_results(self, results: List[Dict[str, Any]], versions: Dict[str, str]) -> None:
+        """
+        Job callback: apply a chunk of processing results to the inbox
+        
+        Args:
+            results: Processing results of the chunk
+            versions: Email id -> content hash the job processed; results
+                for emails modified since (and re-queued) are stale and
+                dropped, so a slower older job cannot overwrite a newer one
+        """
+        with self._lock:
+            updated = []
+            for result in results:
+                email_id = result.get('id')
+                if email_id not in self._emails or self._hashes.get(email_id) != versions.get(email_id):
+                    continue
+                if result.get('error'):
+                    # Forget the hash so the next scan retries this email
+                    self._hashes.pop(email_id, None)
+                    self._signature = None
+                    continue
+                self._emails.set_result(email_id, result.get('category'), result.get('actionItems', []))
+                updated.append(email_id)
+            change_log.record('email', updated)
+    
+    def _job_active(self, job_id: str) -> bool:
+        job = job_queue.get(job_id)
+        return job is not None and not job.finished
+    
+    def _watch(self) -> None:
+        """Background loop polling the source for changes"""
+        while not self._stop_event.is_set():
+            try:
+                self.scan()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("Inbox sync scan failed: %s", e)
+            self._stop_event.wait(self.poll_interval)
+
+
+inbox_sync = InboxSync()
+change_log.register('email', inbox_sync.records)
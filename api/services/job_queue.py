@@ -0,0 +1,286 @@
+"""
+Job Queue - Runs inbox processing in the background with progress and cancellation
+"""
+
+import os
+import time
+import uuid
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Iterable, Callable
+from .email_processor import process_emails_batch
+from .scheduler import scheduler
+from .tenancy import current_tenant, tenant_context, BATCH
+from .log import get_logger, current_request_id, request_context
+
+
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', '25'))
+JOB_RESULT_TTL = float(os.getenv('JOB_RESULT_TTL', '3600'))
+JOB_MAX_RETAINED = int(os.getenv('JOB_MAX_RETAINED', '100'))
+# Per-email results kept per job; beyond this only category counts grow
+JOB_MAX_RESULTS = int(os.getenv('JOB_MAX_RESULTS', '1000'))
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+logger = get_logger(__name__)
+
+
+class Job:
+    """A background inbox processing run"""
+    
+    def __init__(
+        self,
+        chunks: Iterable[List[Dict[str, Any]]],
+        prompts: Dict[str, Any],
+        total: Optional[int],
+        on_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ):
+        self.id = f"job-{uuid.uuid4().hex[:12]}"
+        self.status = 'queued'
+        self.chunks = chunks
+        self.prompts = prompts
+        self.total = total
+        self.on_results = on_results
+        self.tenant = current_tenant()
+        self.request_id = current_request_id()
+        self.processed = 0
+        self.results: List[Dict[str, Any]] = []
+        self.results_dropped = 0
+        self.categories: Counter = Counter()
+        self.errors: List[str] = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+    
+    def cancel(self) -> None:
+        """Request cancellation; takes effect before the next chunk starts"""
+        self._cancel_event.set()
+    
+    def is_cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+    
+    def add_results(self, results: List[Dict[str, Any]], limit: int = JOB_MAX_RESULTS) -> None:
+        """
+        Record a chunk's results
+        
+        Category counts cover every result; per-email results are kept up
+        to limit, so a large archive import does not grow without bound.
+        The scheduler publishes likely Important/To-Do mail first, so the
+        results kept are the ones most worth reading.
+        """
+        self.categories.update(result.get('category') or 'Unknown' for result in results)
+        room = max(0, limit - len(self.results))
+        self.results.extend(results[:room])
+        self.results_dropped += max(0, len(results) - room)
+    
+    def to_dict(self, include_results: bool = True) -> Dict[str, Any]:
+        """
+        Serialize job state for API responses
+        
+        Args:
+            include_results: Whether to include per-email results
+        
+        Returns:
+            Job status, progress and (optionally) results
+        """
+        data = {
+            'jobId': self.id,
+            'status': self.status,
+            'tenant': self.tenant,
+            'processed': self.processed,
+            'total': self.total,
+            'progress': round(self.processed / self.total, 4) if self.total else None,
+            'categories': dict(self.categories),
+            'resultsDropped': self.results_dropped,
+            'errors': list(self.errors),
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at
+        }
+        if include_results:
+            data['results'] = list(self.results)
+        return data
+
+
+class JobQueue:
+    """
+    Bounded worker pool for inbox processing jobs
+    
+    Each job processes its emails chunk by chunk with process_emails_batch,
+    publishing results after every chunk. Finished jobs are retained for
+    result_ttl seconds, and at most max_retained of them are kept.
+    """
+    
+    def __init__(
+        self,
+        max_workers: int = JOB_WORKERS,
+        chunk_size: int = JOB_CHUNK_SIZE,
+        result_ttl: float = JOB_RESULT_TTL,
+        max_retained: int = JOB_MAX_RETAINED
+    ):
+        self.chunk_size = chunk_size
+        self.result_ttl = result_ttl
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='email-job')
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def submit(
+        self,
+        emails: List[Dict[str, Any]],
+        prompts: Dict[str, Any],
+        on_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> Job:
+        """
+        Queue a list of emails for background processing
+        
+        Emails are reordered and chunked by the priority scheduler, so
+        likely Important/To-Do mail is processed (and published) first.
+        
+        Args:
+            emails: List of email objects
+            prompts: Dictionary containing prompt objects
+            on_results: Optional callback receiving each chunk's results
+        
+        Returns:
+            The queued job
+        """
+        return self.submit_chunks(
+            scheduler.chunks(emails, self.chunk_size),
+            prompts,
+            total=len(emails),
+            on_results=on_results
+        )
+    
+    def submit_chunks(
+        self,
+        chunks: Iterable[List[Dict[str, Any]]],
+        prompts: Dict[str, Any],
+        total: Optional[int] = None,
+        on_results: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> Job:
+        """
+        Queue pre-chunked emails for background processing
+        
+        Args:
+            chunks: Iterable of email lists; may be a lazy generator
+            prompts: Dictionary containing prompt objects
+            total: Total number of emails, if known
+            on_results: Optional callback receiving each chunk's results
+        
+        Returns:
+            The queued job
+        """
+        job = Job(chunks, prompts, total, on_results)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job)
+        return job
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+    
+    def list(self) -> List[Job]:
+        with self._lock:
+            self._prune()
+            return list(self._jobs.values())
+    
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job
+        
+        Returns:
+            The job, or None if it does not exist
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel()
+        with self._lock:
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        return job
+    
+    def _run(self, job: Job) -> None:
+        """Worker entry point; logs carry the submitting request's ID, or the job's"""
+        with request_context(job.request_id or job.id):
+            self._process(job)
+    
+    def _process(self, job: Job) -> None:
+        """Process a job chunk by chunk"""
+        with self._lock:
+            cancelled = job.is_cancelled()
+            if not cancelled:
+                job.status = 'running'
+                job.started_at = time.time()
+        if cancelled:
+            # Cancelled while queued: still release the lazy source
+            self._release(job)
+            return
+        
+        logger.info("Job started", extra={'jobId': job.id, 'total': job.total})
+        
+        try:
+            for chunk in job.chunks:
+                if job.is_cancelled():
+                    break
+                
+                with tenant_context(job.tenant, BATCH):
+                    batch = process_emails_batch(chunk, job.prompts)
+                scheduler.history.record(chunk, batch['results'])
+                job.add_results(batch['results'])
+                job.errors.extend(batch['errors'])
+                job.processed += len(chunk)
+                
+                if job.on_results:
+                    try:
+                        job.on_results(batch['results'])
+                    except Exception as e:
+                        logger.warning("Job result callback failed: %s", e, extra={'jobId': job.id})
+            
+            job.status = 'cancelled' if job.is_cancelled() else 'completed'
+        except Exception as e:
+            logger.error("Job failed: %s", e, extra={'jobId': job.id})
+            job.errors.append(f"Job error: {str(e)}")
+            job.status = 'failed'
+        finally:
+            self._release(job)
+            job.finished_at = time.time()
+        
+        logger.info("Job %s", job.status, extra={'jobId': job.id, 'processed': job.processed})
+    
+    def _release(self, job: Job) -> None:
+        """Release lazy sources (e.g. a memory-mapped archive) right away"""
+        close = getattr(job.chunks, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                logger.warning("Closing job source failed: %s", e, extra={'jobId': job.id})
+        job.chunks = None
+        job.on_results = None
+    
+    def _prune(self) -> None:
+        """Drop expired finished jobs and enforce the retention cap (lock held)"""
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at and now - job.finished_at > self.result_ttl:
+                del self._jobs[job_id]
+        
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_retained)]:
+            del self._jobs[job_id]
+
+
+job_queue = JobQueue()
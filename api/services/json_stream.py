@@ -0,0 +1,207 @@
+"""
+JSON Stream - Incremental, tolerant parser for JSON arrays streamed by the LLM
+"""
+
+import json
+from typing import Any, List
+
+
+_SCALAR_TERMINATORS = ',]} \t\r\n'
+_INVALID = object()
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally parse a top-level JSON array from text chunks.
+    
+    Each element is returned as soon as its closing character arrives, so
+    callers can act on the first results while the model is still writing.
+    Anything before the opening '[' (markdown fences, chatter) is skipped,
+    malformed elements are dropped, and a truncated tail loses only the
+    element that was cut off.
+    
+    A '[' only counts as the array once its first element decodes, or at
+    least opens an object or array; otherwise (e.g. "Sure [note]: [...]")
+    scanning resumes right after it, looking for the next candidate.
+    
+    Example:
+        >>> parser = JsonArrayStreamParser()
+        >>> parser.feed('Sure [note]: [[0, 4], [1')
+        [[0, 4]]
+        >>> parser.feed(', 2]]') + parser.close()
+        [[1, 2]]
+    """
+    
+    def __init__(self):
+        self._text = ''
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        # Position of the candidate '[' until its first element is accepted
+        self._array_start = None
+        self._element_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.parsed = 0
+        self.dropped = 0
+    
+    @property
+    def finished(self) -> bool:
+        """True once the closing ']' of the top-level array has been seen"""
+        return self._finished
+    
+    @property
+    def truncated(self) -> bool:
+        """True if the stream ended before the array was closed"""
+        return self._started and not self._finished
+    
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Consume a chunk of text
+        
+        Args:
+            chunk: Next piece of the streamed response
+        
+        Returns:
+            Elements completed by this chunk, in order
+        """
+        if self._finished or not chunk:
+            return []
+        
+        self._text += chunk
+        elements = []
+        text = self._text
+        pos = self._pos
+        
+        while pos < len(text) and not self._finished:
+            char = text[pos]
+            
+            if not self._started:
+                if char == '[':
+                    self._started = True
+                    self._array_start = pos
+                pos += 1
+                continue
+            
+            if self._element_start is None:
+                if char == ']':
+                    self._finished = True
+                elif char not in ', \t\r\n':
+                    self._element_start = pos
+                    if char in '{[':
+                        self._depth = 1
+                    elif char == '"':
+                        self._in_string = True
+                pos += 1
+                continue
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 0 and not self._emit(text[self._element_start:pos + 1], elements):
+                        pos = self._resync()
+                        continue
+                pos += 1
+                continue
+            
+            if self._depth == 0:
+                # Scalar element (number, true, false, null) ends at a delimiter
+                if char in _SCALAR_TERMINATORS:
+                    if not self._emit(text[self._element_start:pos], elements):
+                        pos = self._resync()
+                    continue
+                pos += 1
+                continue
+            
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0 and not self._emit(text[self._element_start:pos + 1], elements):
+                    pos = self._resync()
+                    continue
+            pos += 1
+        
+        # Keep only the unfinished element (or unconfirmed array) so the
+        # buffer stays small
+        if self._array_start is not None:
+            keep_from = self._array_start
+        elif self._element_start is not None:
+            keep_from = self._element_start
+        else:
+            keep_from = pos
+        self._text = text[keep_from:]
+        self._pos = pos - keep_from
+        if self._array_start is not None:
+            self._array_start -= keep_from
+        if self._element_start is not None:
+            self._element_start -= keep_from
+        
+        return elements
+    
+    def close(self) -> List[Any]:
+        """
+        Signal end of stream
+        
+        A scalar element still open at the end is complete and is returned;
+        any other unterminated element was cut off and counts as dropped.
+        
+        Returns:
+            The salvaged tail element, if any
+        """
+        elements = []
+        if not self._finished and self._element_start is not None:
+            if self._depth == 0 and not self._in_string:
+                self._emit(self._text[self._element_start:], elements)
+            else:
+                self.dropped += 1
+        
+        self._element_start = None
+        self._array_start = None
+        self._text = ''
+        self._pos = 0
+        return elements
+    
+    def _emit(self, raw: str, elements: List[Any]) -> bool:
+        """
+        Decode a complete element and reset element state
+        
+        Returns:
+            False if the element rules out the candidate array, i.e. it is
+            the first one and neither decodes nor opens an object or array
+        """
+        self._element_start = None
+        self._depth = 0
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = _INVALID
+        
+        if self._array_start is not None:
+            if value is _INVALID and not raw.startswith(('{', '[')):
+                return False
+            self._array_start = None
+        
+        if value is _INVALID:
+            self.dropped += 1
+        else:
+            elements.append(value)
+            self.parsed += 1
+        return True
+    
+    def _resync(self) -> int:
+        """Abandon the candidate array; returns where to resume scanning"""
+        resume = self._array_start + 1
+        self._array_start = None
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        return resume
+
@@ -6,91 +6,625 @@ Handles all interactions with the Gemini API for text generation
 import os
 import json
 import time
-from typing import Optional, Dict, Any
-import google.generativeai as genai
-from dotenv import load_dotenv
+import queue
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable, Iterator, List
+from .json_stream import JsonArrayStreamParser
+from .hedging import hedger
+from .context_cache import context_cache, estimate_tokens
+from .tenancy import fair_share
+from .log import get_logger
 
-load_dotenv()
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+# Model fallback chains per task, cheapest adequate model first. Override a
+# chain with LLM_MODEL_<TASK>, e.g. LLM_MODEL_CATEGORIZATION="a,b".
+DEFAULT_MODEL_ROUTES = {
+    'categorization': ['gemini-2.5-flash-lite', 'gemini-2.5-flash'],
+    'actionExtraction': ['gemini-2.5-flash', 'gemini-2.5-flash-lite'],
+    'summary': ['gemini-2.5-flash', 'gemini-2.5-flash-lite'],
+    'autoReply': ['gemini-2.5-pro', 'gemini-2.5-flash'],
+    'chat': ['gemini-2.5-pro', 'gemini-2.5-flash'],
+    'default': [DEFAULT_MODEL]
+}
+
+MODEL_OVERLOAD_COOLDOWN = float(os.getenv('MODEL_OVERLOAD_COOLDOWN', '60'))
+# Size of the text pieces mock JSON responses are streamed in
+MOCK_STREAM_CHUNK = 64
+
+logger = get_logger(__name__)
+
+
+def json_generation_config(schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Generation config for JSON mode constrained to a response schema"""
+    if schema is None:
+        return None
+    return {'response_mime_type': 'application/json', 'response_schema': schema}
+
+
+def prompt_fingerprint(kind: str, model: str, prompt: str, schema: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build a stable fingerprint for an upstream LLM call
+    
+    Args:
+        kind: Call type (e.g. 'text')
+        model: Model name the call is sent to
+        prompt: Full prompt text
+        schema: Response schema, if any; calls differing only in schema
+            produce different output and must not share a fingerprint
+    
+    Returns:
+        Hex digest identifying identical calls
+    """
+    parts = [kind, model, prompt]
+    if schema is not None:
+        parts.append(json.dumps(schema, sort_keys=True))
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+class _InFlightCall:
+    """A single upstream call whose outcome is shared by every waiting caller"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls so only one reaches the upstream API.
+    
+    The first caller for a key runs the call; callers arriving while it is
+    still in flight block until it finishes and receive the same result (or
+    the same exception). Nothing is cached once the call completes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlightCall] = {}
+        self.coalesced = 0
+    
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once per key among concurrent callers
+        
+        Args:
+            key: Fingerprint identifying identical calls
+            fn: Zero-argument callable performing the upstream call
+        
+        Returns:
+            Result of fn, shared with any coalesced callers
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+        
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        
+        return call.result
+    
+    def in_flight(self) -> int:
+        """Number of distinct upstream calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+
+RATE_LIMIT_MARKERS = ('429', 'resource exhausted', 'resourceexhausted', 'quota', 'rate limit')
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if an upstream error looks like a rate limit / quota rejection"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+OVERLOAD_MARKERS = ('503', 'overloaded', 'unavailable', 'deadline exceeded', 'deadlineexceeded')
+
+
+def is_overload_error(error: Exception) -> bool:
+    """True if an upstream error means the model is overloaded or out of quota"""
+    text = f"{type(error).__name__} {error}".lower()
+    return is_rate_limit_error(error) or any(marker in text for marker in OVERLOAD_MARKERS)
+
+
+def load_model_routes() -> Dict[str, List[str]]:
+    """Default routes with LLM_MODEL_<TASK> environment overrides applied"""
+    routes = {}
+    for task, chain in DEFAULT_MODEL_ROUTES.items():
+        override = os.getenv(f"LLM_MODEL_{task.upper()}", '')
+        models = [m.strip() for m in override.split(',') if m.strip()]
+        routes[task] = models or list(chain)
+    return routes
+
+
+class ModelRouter:
+    """
+    Maps each task to a model fallback chain
+    
+    A model that fails with an overload or quota error is moved to the back
+    of every chain for cooldown seconds, so later calls go straight to the
+    next model instead of failing on it again.
+    """
+    
+    def __init__(self, routes: Optional[Dict[str, List[str]]] = None, cooldown: float = MODEL_OVERLOAD_COOLDOWN):
+        self.routes = routes if routes is not None else load_model_routes()
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._overloaded_until: Dict[str, float] = {}
+        self.fallbacks = 0
+    
+    def chain(self, task: str) -> List[str]:
+        """Configured models for a task, preferred first"""
+        return self.routes.get(task) or self.routes.get('default') or [DEFAULT_MODEL]
+    
+    def primary(self, task: str) -> str:
+        return self.chain(task)[0]
+    
+    def candidates(self, task: str) -> List[str]:
+        """Models to try for a task, with currently overloaded ones last"""
+        now = time.time()
+        with self._lock:
+            overloaded = {m for m, until in self._overloaded_until.items() if until > now}
+        chain = self.chain(task)
+        return [m for m in chain if m not in overloaded] + [m for m in chain if m in overloaded]
+    
+    def mark_overloaded(self, model: str) -> None:
+        with self._lock:
+            self._overloaded_until[model] = time.time() + self.cooldown
+            self.fallbacks += 1
+    
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            overloaded = sorted(m for m, until in self._overloaded_until.items() if until > now)
+        return {
+            'routes': self.routes,
+            'overloaded': overloaded,
+            'fallbacks': self.fallbacks
+        }
+
+
+class LLMActivity:
+    """
+    Tracks upstream load so background work can yield to interactive traffic
+    
+    Calls made inside background() are not counted as in flight. Any call
+    that fails with a rate-limit error marks the quota as tight for a while.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._in_flight = 0
+        self.last_rate_limited_at = 0.0
+    
+    @contextmanager
+    def background(self):
+        """Mark LLM calls made by the current thread as background work"""
+        previous = getattr(self._local, 'background', False)
+        self._local.background = True
+        try:
+            yield
+        finally:
+            self._local.background = previous
+    
+    def is_background(self) -> bool:
+        return getattr(self._local, 'background', False)
+    
+    @contextmanager
+    def call(self):
+        """Wrap one upstream request"""
+        counted = not self.is_background()
+        if counted:
+            with self._lock:
+                self._in_flight += 1
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.last_rate_limited_at = time.time()
+            raise
+        finally:
+            if counted:
+                with self._lock:
+                    self._in_flight -= 1
+    
+    def in_flight(self) -> int:
+        """Foreground upstream calls currently running"""
+        return self._in_flight
+    
+    def is_busy(self, rate_limit_backoff: float) -> bool:
+        """True while foreground calls run or a rate limit was hit recently"""
+        return self._in_flight > 0 or time.time() - self.last_rate_limited_at < rate_limit_backoff
+
+
+_genai = None
+_genai_lock = threading.Lock()
+_configured_key: Optional[str] = None
+
+
+def load_genai(api_key: str):
+    """
+    Import and configure the Gemini SDK on first use
+    
+    The SDK import dominates cold-start time, so routes that never call
+    the LLM (and mock mode) never pay for it.
+    """
+    global _genai, _configured_key
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            _genai = genai
+        if _configured_key != api_key:
+            _genai.configure(api_key=api_key)
+            _configured_key = api_key
+            logger.info("Gemini API initialized")
+    return _genai
+
+
+# Shared across GeminiService instances, which are created per request
+_single_flight = SingleFlight()
+llm_activity = LLMActivity()
+model_router = ModelRouter()
 
 
 class GeminiService:
     """Service for interacting with Google Gemini API"""
     
-    def __init__(self):
+    def __init__(self, task: str = 'default'):
+        """
+        Args:
+            task: Routing key selecting the model chain, e.g. 'categorization'
+        """
         self.api_key = os.getenv('GEMINI_API_KEY')
+        self.task = task
+        self.model_name = model_router.primary(task)
+        self._models: Dict[str, Any] = {}
+        self._sdk = None
         self.mock_mode = os.getenv('MOCK_LLM', 'false').lower() == 'true'
         
         if not self.api_key and not self.mock_mode:
-            print("⚠️  Warning: GEMINI_API_KEY not found. Using mock mode.")
+            logger.warning("GEMINI_API_KEY not found, using mock mode")
             self.mock_mode = True
         
         if not self.mock_mode and self.api_key:
             try:
-                genai.configure(api_key=self.api_key)
-                self.model = genai.GenerativeModel('gemini-2.5-flash')
-                print("✓ Gemini API initialized successfully")
+                self._sdk = load_genai(self.api_key)
             except Exception as e:
-                print(f"✗ Failed to initialize Gemini API: {e}")
-                print("  Falling back to mock mode")
+                logger.error("Failed to initialize Gemini API, falling back to mock mode: %s", e)
                 self.mock_mode = True
     
-    def generate_text(self, prompt: str, max_retries: int = 3) -> Optional[str]:
+    def generate_text(self, prompt: str, max_retries: int = 3, hedge: bool = False, prefix: str = '') -> Optional[str]:
         """
         Generate text response from LLM
         
+        Concurrent calls with an identical prompt share one upstream request.
+        
         Args:
             prompt: The prompt to send to the LLM
             max_retries: Number of retry attempts on failure
+            hedge: Send a backup request if the call runs past the task's
+                usual latency (for interactive call sites)
+            prefix: Static text sent before the prompt, cached model-side
+                when large enough (see context_cache)
         
         Returns:
             Generated text or None on failure
         """
         if self.mock_mode:
-            return self._mock_generate_text(prompt)
+            return self._mock_generate_text(self._mock_prompt(prefix, prompt))
         
-        for attempt in range(max_retries):
+        key = prompt_fingerprint('text', self.model_name, prefix + prompt)
+        if hedge and hedger.enabled:
+            return _single_flight.do(key, lambda: hedger.run(
+                self.task,
+                lambda cancel: self._generate_text_with_retries(prompt, max_retries, cancel, prefix)
+            ))
+        return _single_flight.do(key, lambda: self._generate_text_with_retries(prompt, max_retries, prefix=prefix))
+    
+    def _model(self, model_name: str):
+        """GenerativeModel client for a model name, created on first use"""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = self._sdk.GenerativeModel(model_name)
+        return model
+    
+    def _request(self, model_name: str, prefix: str, prompt: str):
+        """Client, contents and cache handle for one call; cached prefixes are sent by reference"""
+        if prefix:
+            handle = context_cache.acquire(model_name, prefix, self.task)
+            if handle is not None:
+                return handle.client, prompt, handle
+            return self._model(model_name), prefix + prompt, None
+        return self._model(model_name), prompt, None
+    
+    def _mock_prompt(self, prefix: str, prompt: str) -> str:
+        """Full mock prompt, running the prefix through the local cache stand-in"""
+        if prefix:
+            context_cache.acquire(self.model_name, prefix, self.task, local=True)
+        return prefix + prompt
+    
+    def _fall_back(self, candidates: List[str], index: int, error: Exception) -> bool:
+        """Mark the current model overloaded if a fallback is left to try"""
+        if index + 1 >= len(candidates) or not is_overload_error(error):
+            return False
+        model_router.mark_overloaded(candidates[index])
+        logger.warning("Model overloaded, falling back", extra={'model': candidates[index], 'fallback': candidates[index + 1]})
+        return True
+    
+    def _generate_text_with_retries(
+        self,
+        prompt: str,
+        max_retries: int,
+        cancel: Optional[threading.Event] = None,
+        prefix: str = ''
+    ) -> Optional[str]:
+        """
+        Call the Gemini API, retrying with exponential backoff
+        
+        Overload errors move on to the next model in the task's chain
+        straight away; that switch does not use up a retry. With a cancel
+        event the response is streamed so a losing hedge attempt can stop
+        between chunks.
+        """
+        candidates = model_router.candidates(self.task)
+        index = 0
+        attempt = 0
+        while attempt < max_retries:
+            if cancel is not None and cancel.is_set():
+                return None
+            handle = None
             try:
-                response = self.model.generate_content(prompt)
-                return response.text
+                with fair_share.slot(estimate_tokens(prefix + prompt)), llm_activity.call():
+                    client, contents, handle = self._request(candidates[index], prefix, prompt)
+                    if cancel is None:
+                        response = client.generate_content(contents)
+                        return response.text
+                    
+                    parts = []
+                    for text in _iter_text(client.generate_content(contents, stream=True)):
+                        if cancel.is_set():
+                            return None
+                        parts.append(text)
+                    return ''.join(parts)
             except Exception as e:
-                print(f"Attempt {attempt + 1}/{max_retries} failed: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
+                logger.warning("LLM attempt %d/%d failed: %s", attempt + 1, max_retries, e, extra={'model': candidates[index], 'task': self.task})
+                if handle is not None and 'cache' in str(e).lower():
+                    context_cache.discard(handle)
+                if self._fall_back(candidates, index, e):
+                    index += 1
+                    continue
+                attempt += 1
+                if attempt < max_retries:
+                    time.sleep(2 ** (attempt - 1))
                 else:
-                    print("All retry attempts failed. Returning None.")
+                    logger.error("All LLM retry attempts failed", extra={'task': self.task})
                     return None
         
         return None
     
-    def generate_json(self, prompt: str, max_retries: int = 3) -> Any:
+    def generate_text_stream(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        hedge: bool = False,
+        prefix: str = '',
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
         """
-        Generate JSON response from LLM
+        Stream a text response from LLM chunk by chunk
+        
+        A failed attempt is retried only if nothing has been yielded yet, so
+        consumers never see duplicated output.
         
         Args:
             prompt: The prompt to send to the LLM
             max_retries: Number of retry attempts on failure
+            hedge: Send a backup request if the first chunk is slower than
+                the task's usual time to first chunk
+            prefix: Static text sent before the prompt, cached model-side
+                when large enough
+            schema: Response schema; switches the model to JSON mode
         
-        Returns:
-            Parsed JSON object or empty list on failure
+        Yields:
+            Text chunks as the model produces them
         """
         if self.mock_mode:
-            return self._mock_generate_json(prompt)
+            yield self._mock_generate_text(self._mock_prompt(prefix, prompt))
+            return
         
-        response_text = self.generate_text(prompt, max_retries)
+        if hedge and hedger.enabled:
+            yield from hedger.stream(self.task, lambda cancel: self._stream_with_retries(prompt, max_retries, cancel, prefix, schema))
+        else:
+            yield from self._stream_buffered(prompt, max_retries, prefix, schema)
+    
+    def _stream_buffered(
+        self,
+        prompt: str,
+        max_retries: int,
+        prefix: str = '',
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        """
+        Stream through a queue filled by a worker thread
         
-        if not response_text:
-            return []
+        _stream_with_retries holds the fair-share slot while it yields, so
+        it is drained by a worker instead of the caller: the slot is freed
+        as soon as the model finishes, however slowly the chunks are read.
+        Closing this iterator early cancels the upstream stream.
+        """
+        chunks: 'queue.Queue' = queue.Queue()
+        cancel = threading.Event()
         
-        response_text = response_text.strip()
-        response_text = response_text.replace('```json', '').replace('```', '').strip()
+        def produce():
+            error = None
+            try:
+                for text in self._stream_with_retries(prompt, max_retries, cancel, prefix, schema):
+                    chunks.put((text, None))
+            except Exception as e:
+                error = e
+            finally:
+                chunks.put((None, error))
         
+        # Run in a copy of the caller's context so the tenant and lane carry over
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(produce,), name=f"llm-stream-{self.task}", daemon=True).start()
         try:
-            parsed = json.loads(response_text)
-            return parsed if isinstance(parsed, list) else []
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON response: {e}")
-            print(f"Response was: {response_text[:200]}...")
-            return []
+            while True:
+                text, error = chunks.get()
+                if error is not None:
+                    raise error
+                if text is None:
+                    return
+                yield text
+        finally:
+            cancel.set()
+    
+    def _stream_with_retries(
+        self,
+        prompt: str,
+        max_retries: int,
+        cancel: Optional[threading.Event] = None,
+        prefix: str = '',
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Iterator[str]:
+        """Stream from the Gemini API with model fallback and retries before the first chunk"""
+        config = json_generation_config(schema)
+        options = {'generation_config': config} if config else {}
+        candidates = model_router.candidates(self.task)
+        index = 0
+        attempt = 0
+        while attempt < max_retries:
+            yielded = False
+            handle = None
+            try:
+                with fair_share.slot(estimate_tokens(prefix + prompt)), llm_activity.call():
+                    client, contents, handle = self._request(candidates[index], prefix, prompt)
+                    response = client.generate_content(contents, stream=True, **options)
+                    for text in _iter_text(response):
+                        if cancel is not None and cancel.is_set():
+                            return
+                        yielded = True
+                        yield text
+                return
+            except Exception as e:
+                logger.warning("LLM stream attempt %d/%d failed: %s", attempt + 1, max_retries, e, extra={'model': candidates[index], 'task': self.task})
+                if handle is not None and 'cache' in str(e).lower():
+                    context_cache.discard(handle)
+                if yielded:
+                    logger.warning("LLM stream interrupted after partial output, keeping what was received", extra={'task': self.task})
+                    return
+                if self._fall_back(candidates, index, e):
+                    index += 1
+                    continue
+                attempt += 1
+                if attempt < max_retries:
+                    time.sleep(2 ** (attempt - 1))
+                else:
+                    logger.error("All LLM stream attempts failed", extra={'task': self.task})
+    
+    def iter_json(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        prefix: str = '',
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Iterator[Any]:
+        """
+        Stream elements of a JSON array response from LLM
+        
+        Elements are yielded as soon as they are complete in the streamed
+        output. Markdown fences and surrounding text are ignored, and a
+        truncated response still yields every well-formed element before
+        the cut. With a schema the model runs in JSON mode and can only
+        produce output matching it, so there is nothing to strip.
+        
+        Args:
+            prompt: The prompt to send to the LLM
+            max_retries: Number of retry attempts on failure
+            prefix: Static text sent before the prompt, cached model-side
+                when large enough
+            schema: Response schema for the JSON array (OpenAPI subset)
+        
+        Yields:
+            Parsed array elements
+        """
+        if self.mock_mode:
+            # Serialized and streamed through the parser like a real
+            # response, so output format changes are exercised end to end
+            text = json.dumps(self._mock_generate_json(self._mock_prompt(prefix, prompt)))
+            chunks = (text[i:i + MOCK_STREAM_CHUNK] for i in range(0, len(text), MOCK_STREAM_CHUNK))
+        else:
+            chunks = self.generate_text_stream(prompt, max_retries, prefix=prefix, schema=schema)
+        
+        parser = JsonArrayStreamParser()
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+            if parser.finished:
+                break
+        yield from parser.close()
+        
+        if parser.truncated:
+            logger.warning("JSON response was truncated", extra={'task': self.task, 'salvaged': parser.parsed})
+        elif not parser.finished and parser.parsed == 0:
+            logger.warning("No JSON array in response", extra={'task': self.task})
+        if parser.dropped:
+            logger.warning("Dropped malformed JSON elements", extra={'task': self.task, 'dropped': parser.dropped})
+    
+    def generate_json(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        prefix: str = '',
+        schema: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        Generate JSON response from LLM
+        
+        Args:
+            prompt: The prompt to send to the LLM
+            max_retries: Number of retry attempts on failure
+            prefix: Static text sent before the prompt, cached model-side
+                when large enough
+            schema: Response schema for the JSON array (OpenAPI subset)
+        
+        Returns:
+            List of parsed array elements (salvaged from truncated output
+            where possible) or empty list on failure
+        """
+        if self.mock_mode:
+            return list(self.iter_json(prompt, max_retries, prefix, schema))
+        
+        key = prompt_fingerprint('json', self.model_name, prefix + prompt, schema)
+        elements = _single_flight.do(key, lambda: list(self.iter_json(prompt, max_retries, prefix, schema)))
+        return list(elements)
     
     def _mock_generate_text(self, prompt: str) -> str:
         """Mock text generation for development without API key"""
@@ -137,18 +671,57 @@ class GeminiService:
         """Mock JSON generation for development without API key - supports batch processing"""
         prompt_lower = prompt.lower()
         
-        if 'categorize' in prompt_lower and prompt.count('Email ID:') > 1:
-            print(f"🔧 Mock: Detected batch categorization request")
+        if 'write one reply for each' in prompt_lower and 'Email ID:' in prompt:
+            logger.debug("Mock: batch draft request")
             results = []
             
             import re
+            for section in prompt.split('---'):
+                id_match = re.search(r'Email ID:\s*(\S+)', section)
+                subject_match = re.search(r'Subject:\s*(.*)', section)
+                sender_match = re.search(r'Sender:\s*([^<\n]+)', section)
+                if not id_match:
+                    continue
+                
+                subject = subject_match.group(1).strip() if subject_match else 'your email'
+                sender = sender_match.group(1).strip() if sender_match else 'there'
+                results.append({
+                    'emailId': id_match.group(1),
+                    'subject': f"Re: {subject}",
+                    'body': f"Hi {sender.split()[0]},\n\nThank you for your email regarding \"{subject}\". I will review it and get back to you shortly.\n\nBest regards,"
+                })
+            
+            logger.debug("Mock: returning %d drafts", len(results))
+            return results
+        
+        if 'category code' in prompt_lower and '"c"' in prompt:
+            logger.debug("Mock: combined categorization and action request")
+            from .email_model import Category, Priority
+            category = Category.from_label(self._mock_generate_text(prompt))
+            action_items = []
+            if category in (Category.IMPORTANT, Category.TODO):
+                action_items = self._mock_generate_json(prompt[prompt_lower.rfind('email:'):])
+            return [{
+                'c': category.value,
+                'a': [
+                    {'t': ai['task'], 'd': ai['deadline'], 'p': Priority.from_label(ai['priority']).value}
+                    for ai in action_items
+                ]
+            }]
+        
+        # Compact batch prompts number emails ("Email #3") and expect codes back
+        numbered = 'Email #0' in prompt
+        
+        if 'categorize' in prompt_lower and (prompt.count('Email ID:') > 1 or numbered):
+            logger.debug("Mock: batch categorization request")
+            results = []
+            
+            import re
+            from .email_model import Category
             email_sections = prompt.split('---')
             
             for section in email_sections:
-                if 'Email ID:' not in section:
-                    continue
-                
-                id_match = re.search(r'Email ID:\s*(\S+)', section)
+                id_match = re.search(r'Email (?:ID:\s*(\S+)|#(\d+))', section)
                 if not id_match:
                     continue
                 
@@ -183,26 +756,27 @@ class GeminiService:
                 if '70%' in section or 'off everything' in section_lower:
                     category = 'Spam'
                 
-                results.append({
-                    'emailId': email_id,
-                    'category': category
-                })
+                if id_match.group(2) is not None:
+                    results.append([int(id_match.group(2)), Category.from_label(category).value])
+                else:
+                    results.append({
+                        'emailId': email_id,
+                        'category': category
+                    })
             
-            print(f"🔧 Mock: Returning {len(results)} categorized emails")
+            logger.debug("Mock: returning %d categorized emails", len(results))
             return results
         
-        if 'action' in prompt_lower and 'extract' in prompt_lower and prompt.count('Email ID:') > 1:
-            print(f"🔧 Mock: Detected batch action extraction request")
+        if 'action' in prompt_lower and 'extract' in prompt_lower and (prompt.count('Email ID:') > 1 or numbered):
+            logger.debug("Mock: batch action extraction request")
             results = []
             
             import re
+            from .email_model import Priority
             email_sections = prompt.split('---')
             
             for section in email_sections:
-                if 'Email ID:' not in section:
-                    continue
-
-                id_match = re.search(r'Email ID:\s*(\S+)', section)
+                id_match = re.search(r'Email (?:ID:\s*(\S+)|#(\d+))', section)
                 if not id_match:
                     continue
                 
@@ -229,13 +803,21 @@ class GeminiService:
                         {"task": "Take required action", "deadline": "none", "priority": "high"}
                     ]
                 
-                if action_items:
+                if action_items and id_match.group(2) is not None:
+                    results.append({
+                        'i': int(id_match.group(2)),
+                        'a': [
+                            {'t': ai['task'], 'd': ai['deadline'], 'p': Priority.from_label(ai['priority']).value}
+                            for ai in action_items
+                        ]
+                    })
+                elif action_items:
                     results.append({
                         'emailId': email_id,
                         'actionItems': action_items
                     })
             
-            print(f"🔧 Mock: Returning action items for {len(results)} emails")
+            logger.debug("Mock: returning action items for %d emails", len(results))
             return results
         
         if 'meeting' in prompt_lower:
@@ -271,6 +853,18 @@ class GeminiService:
         return []
 
 
+def _iter_text(response) -> Iterator[str]:
+    """Non-empty text of each chunk in a streamed Gemini response"""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunk without text parts (e.g. a finish-reason-only chunk)
+            continue
+        if text:
+            yield text
+
+
 def parse_category(response: str) -> str:
     """
     Parse category from LLM response
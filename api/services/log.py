@@ -0,0 +1,260 @@
+"""
+Log - Structured, non-blocking logging with request-ID correlation
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Optional
+from .tenancy import current_tenant
+
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'text' for humans, 'json' for one JSON object per line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Records waiting for the writer thread; more are dropped, not waited on
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+# Share of sampled (per-email) records below WARNING that are kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+LOG_ACCESS = os.getenv('LOG_ACCESS', 'true').lower() == 'true'
+
+ROOT_LOGGER = 'inbox'
+REQUEST_ID_HEADER = 'x-request-id'
+
+_REQUEST_ID_PATTERN = re.compile(r'[^A-Za-z0-9._:-]')
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'tenant', 'sample'
+}
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar('request_id', default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def request_context(request_id: Optional[str]):
+    """Tag records logged inside the block with a request (or job) ID"""
+    token = _request_id.set(request_id)
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request ID and tenant on records in the thread that logged them"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.tenant = current_tenant()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of records logged with extra={'sample': True}
+    
+    Meant for per-email lines, whose volume grows with the inbox; records
+    at WARNING or above are always kept.
+    """
+    
+    def __init__(self, rate: float = LOG_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'sample', False) or record.levelno >= logging.WARNING:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records when the queue is full instead of blocking"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields at the top level"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'requestId': getattr(record, 'request_id', None),
+            'tenant': getattr(record, 'tenant', None)
+        }
+        entry.update(_fields(record))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable line with the request ID and extra= fields as key=value"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+        request_id = getattr(record, 'request_id', None)
+        line = f"{timestamp} {record.levelname:<7} {record.name}"
+        if request_id:
+            line += f" [{request_id}]"
+        line += f" {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class LogPipeline:
+    """
+    Logging setup for the API
+    
+    Loggers under ROOT_LOGGER hand records to a bounded queue; a single
+    listener thread formats and writes them to stderr. Producers never
+    wait on the stream: when the queue is full the record is dropped and
+    counted. Context and sampling filters run on the producer side, so
+    request IDs are captured in the right thread and sampled-out records
+    never reach the queue.
+    """
+    
+    def __init__(
+        self,
+        level: str = LOG_LEVEL,
+        fmt: str = LOG_FORMAT,
+        queue_size: int = LOG_QUEUE_SIZE,
+        sample_rate: float = LOG_SAMPLE_RATE
+    ):
+        self.level = getattr(logging, level, logging.INFO)
+        self.format = fmt
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.handler = DroppingQueueHandler(self.queue)
+        self.handler.addFilter(ContextFilter())
+        self.handler.addFilter(SamplingFilter(sample_rate))
+        self._listener: Optional[QueueListener] = None
+        self._lock = threading.Lock()
+    
+    def start(self) -> None:
+        """Attach the queue handler and start the writer thread (idempotent)"""
+        with self._lock:
+            if self._listener is not None:
+                return
+            stream = logging.StreamHandler(sys.stderr)
+            stream.setFormatter(JsonFormatter() if self.format == 'json' else TextFormatter())
+            self._listener = QueueListener(self.queue, stream)
+            self._listener.start()
+            
+            logger = logging.getLogger(ROOT_LOGGER)
+            logger.setLevel(self.level)
+            logger.addHandler(self.handler)
+            logger.propagate = False
+        atexit.register(self.stop)
+    
+    def stop(self) -> None:
+        """Flush queued records and stop the writer thread"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            'level': logging.getLevelName(self.level),
+            'format': self.format,
+            'queued': self.queue.qsize(),
+            'queueSize': self.queue.maxsize,
+            'dropped': self.handler.dropped
+        }
+
+
+log_pipeline = LogPipeline()
+log_pipeline.start()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under ROOT_LOGGER, e.g. get_logger(__name__)"""
+    return logging.getLogger(ROOT_LOGGER).getChild(name)
+
+
+_access_logger = get_logger('access')
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware assigning each request an ID
+    
+    A well-formed incoming X-Request-ID is reused so logs can be joined
+    with the caller's; otherwise one is generated. The ID is returned in
+    the response header and stamped on every record logged while the
+    request runs, including in run_in_threadpool and streamed responses.
+    With LOG_ACCESS enabled, one access record is logged per request.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        incoming = ''
+        for key, value in scope.get('headers', []):
+            if key.decode('latin-1').lower() == REQUEST_ID_HEADER:
+                incoming = _REQUEST_ID_PATTERN.sub('', value.decode('latin-1'))[:64]
+                break
+        request_id = incoming or new_request_id()
+        status = {'code': 500}
+        started = time.perf_counter()
+        
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                message['headers'] = list(message.get('headers', [])) + [
+                    (REQUEST_ID_HEADER.encode('latin-1'), request_id.encode('latin-1'))
+                ]
+            await send(message)
+        
+        with request_context(request_id):
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                if LOG_ACCESS:
+                    code = status['code']
+                    _access_logger.log(
+                        logging.WARNING if code >= 500 else logging.INFO,
+                        "%s %s %d",
+                        scope.get('method'), scope.get('path'), code,
+                        extra={'status': code, 'durationMs': round((time.perf_counter() - started) * 1000, 1)}
+                    )
@@ -0,0 +1,204 @@
+"""
+Mail Import - Streams large mbox files and .eml directories into the inbox email shape
+"""
+
+import os
+import re
+import mmap
+import email
+from datetime import timezone
+from email.header import decode_header, make_header
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Dict, List, Any, Optional, Iterable, Iterator
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+MAIL_IMPORT_DIR = os.getenv('MAIL_IMPORT_DIR', DATA_DIR)
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '25'))
+
+_MBOX_SEPARATOR = b'\nFrom '
+_QUOTED_FROM = re.compile(rb'^>(>*From )', re.MULTILINE)
+
+
+def _decode_header_value(value: Optional[str]) -> str:
+    """Decode an RFC 2047 encoded header into text"""
+    if not value:
+        return ''
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return str(value)
+
+
+def _message_body(message) -> str:
+    """Return the first text/plain part of a message"""
+    parts = message.walk() if message.is_multipart() else [message]
+    for part in parts:
+        if part.get_content_type() != 'text/plain' or part.get_filename():
+            continue
+        payload = part.get_payload(decode=True)
+        if payload is None:
+            continue
+        charset = part.get_content_charset() or 'utf-8'
+        try:
+            return payload.decode(charset, errors='replace').strip()
+        except LookupError:
+            return payload.decode('utf-8', errors='replace').strip()
+    return ''
+
+
+def message_to_email(key: str, message) -> Dict[str, Any]:
+    """
+    Convert a parsed message to the inbox email shape
+    
+    Args:
+        key: Fallback ID used when the message has no Message-ID header
+        message: email.message.Message (or mailbox message)
+    
+    Returns:
+        Email object with id, sender, senderName, subject, body, timestamp,
+        hasAttachments and unprocessed category/actionItems
+    """
+    sender_name, sender = parseaddr(_decode_header_value(message.get('From')))
+    
+    timestamp = None
+    if message.get('Date'):
+        try:
+            timestamp = parsedate_to_datetime(message['Date']).astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        except (TypeError, ValueError):
+            timestamp = None
+    
+    has_attachments = any(
+        part.get_content_disposition() == 'attachment'
+        for part in message.walk()
+    ) if message.is_multipart() else False
+    
+    flags = message.get_flags() if hasattr(message, 'get_flags') else ''
+    
+    return {
+        'id': (message.get('Message-ID') or key).strip().strip('<>'),
+        'sender': sender,
+        'senderName': sender_name or sender,
+        'subject': _decode_header_value(message.get('Subject')) or 'No subject',
+        'body': _message_body(message),
+        'timestamp': timestamp,
+        'category': None,
+        'actionItems': [],
+        'isRead': 'S' in flags,
+        'hasAttachments': has_attachments
+    }
+
+
+def iter_mbox(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream emails from an mbox file without loading it into memory
+    
+    The file is memory-mapped and scanned for "From " separator lines; only
+    one message is materialized at a time, so memory use is bounded by the
+    largest single message rather than the archive size.
+    
+    Args:
+        path: Path to an mbox file
+    
+    Yields:
+        Email objects in file order
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0 if mm[:5] == b'From ' else mm.find(_MBOX_SEPARATOR)
+            if start == -1:
+                return
+            if start > 0:
+                start += 1
+            
+            while start != -1 and start < len(mm):
+                end = mm.find(_MBOX_SEPARATOR, start)
+                next_start = end + 1 if end != -1 else -1
+                if end == -1:
+                    end = len(mm)
+                
+                # Skip the "From sender date" envelope line
+                headers_start = mm.find(b'\n', start, end)
+                if headers_start != -1:
+                    raw = _QUOTED_FROM.sub(rb'\1', mm[headers_start + 1:end])
+                    yield message_to_email(f"mbox-{start}", email.message_from_bytes(raw))
+                
+                start = next_start
+
+
+def iter_eml_dir(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream emails from a directory of .eml files
+    
+    Args:
+        path: Directory containing .eml files (searched recursively)
+    
+    Yields:
+        Email objects ordered by file path
+    """
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.lower().endswith('.eml'):
+                continue
+            file_path = os.path.join(root, name)
+            with open(file_path, 'rb') as f:
+                message = email.message_from_binary_file(f)
+            yield message_to_email(os.path.relpath(file_path, path), message)
+
+
+def iter_mail_archive(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream emails from an mbox file or a directory of .eml files"""
+    if os.path.isdir(path):
+        return iter_eml_dir(path)
+    return iter_mbox(path)
+
+
+def iter_email_batches(
+    emails: Iterable[Dict[str, Any]],
+    batch_size: int = IMPORT_BATCH_SIZE
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Group a stream of emails into lists of at most batch_size
+    
+    Args:
+        emails: Iterable of email objects
+        batch_size: Maximum emails per batch
+    
+    Yields:
+        Lists of email objects
+    """
+    batch = []
+    for item in emails:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_import_path(path: str) -> str:
+    """
+    Resolve a client-supplied archive path inside MAIL_IMPORT_DIR
+    
+    Args:
+        path: Path relative to MAIL_IMPORT_DIR
+    
+    Returns:
+        Absolute path of an existing file or directory
+    
+    Raises:
+        ValueError: If the path escapes MAIL_IMPORT_DIR or does not exist
+    """
+    base = os.path.realpath(MAIL_IMPORT_DIR)
+    resolved = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, resolved]) != base:
+        raise ValueError('Import path must be inside the import directory')
+    if not os.path.exists(resolved):
+        raise ValueError(f'Import path not found: {path}')
+    return resolved
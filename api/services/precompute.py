@@ -0,0 +1,171 @@
+"""
+Precompute - Low-priority background generation of results users are likely to ask for
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, Callable, Tuple
+from .llm_service import llm_activity
+from .log import get_logger
+
+
+PRECOMPUTE_ENABLED = os.getenv('PRECOMPUTE_ENABLED', 'false').lower() == 'true'
+PRECOMPUTE_MAX_ENTRIES = int(os.getenv('PRECOMPUTE_MAX_ENTRIES', '5000'))
+PRECOMPUTE_MAX_QUEUE = int(os.getenv('PRECOMPUTE_MAX_QUEUE', '2000'))
+PRECOMPUTE_RATE_LIMIT_BACKOFF = float(os.getenv('PRECOMPUTE_RATE_LIMIT_BACKOFF', '30'))
+PRECOMPUTE_IDLE_WAIT = float(os.getenv('PRECOMPUTE_IDLE_WAIT', '0.5'))
+
+
+CacheKey = Tuple[str, str, str]
+
+logger = get_logger(__name__)
+
+
+class PrecomputeCache:
+    """LRU cache of generated text keyed by (kind, email ID, prompt version)"""
+    
+    def __init__(self, max_entries: int = PRECOMPUTE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[CacheKey, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, kind: str, email_id: str, version: str) -> Optional[str]:
+        key = (kind, email_id, version)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, kind: str, email_id: str, version: str, value: str) -> None:
+        with self._lock:
+            self._entries[(kind, email_id, version)] = value
+            self._entries.move_to_end((kind, email_id, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __contains__(self, key: CacheKey) -> bool:
+        with self._lock:
+            return key in self._entries
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Precomputer:
+    """
+    Single background worker filling the precompute cache
+    
+    Tasks run one at a time and only while no foreground LLM call is in
+    flight and no rate limit was hit in the last rate_limit_backoff
+    seconds, so interactive requests always go first. Calls are made
+    inside llm_activity.background() so they never hold other background
+    work back.
+    """
+    
+    def __init__(
+        self,
+        cache: Optional[PrecomputeCache] = None,
+        max_queue: int = PRECOMPUTE_MAX_QUEUE,
+        rate_limit_backoff: float = PRECOMPUTE_RATE_LIMIT_BACKOFF,
+        idle_wait: float = PRECOMPUTE_IDLE_WAIT
+    ):
+        self.cache = cache or PrecomputeCache()
+        self.max_queue = max_queue
+        self.rate_limit_backoff = rate_limit_backoff
+        self.idle_wait = idle_wait
+        self._queue: 'deque[Tuple[CacheKey, Callable[[], Optional[str]]]]' = deque()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+    
+    def submit(self, kind: str, email_id: str, version: str, compute: Callable[[], Optional[str]]) -> bool:
+        """
+        Queue a background computation unless it is cached or already queued
+        
+        Args:
+            kind: Result type, e.g. 'summary' or 'draft'
+            email_id: Email the result belongs to
+            version: Prompt version / fingerprint the result is valid for
+            compute: Zero-argument callable returning the text to cache
+        
+        Returns:
+            True if the task was queued
+        """
+        key = (kind, email_id, version)
+        if key in self.cache:
+            return False
+        
+        with self._lock:
+            if key in self._queued:
+                return False
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._queue.append((key, compute))
+            self._queued.add(key)
+            self._ensure_worker()
+        
+        self._wakeup.set()
+        return True
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            'queued': len(self._queue),
+            'cached': len(self.cache),
+            'completed': self.completed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'yielding': llm_activity.is_busy(self.rate_limit_backoff)
+        }
+    
+    def _ensure_worker(self) -> None:
+        """Start the worker thread on first use (lock held)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._work, name='precompute', daemon=True)
+            self._thread.start()
+    
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                task = self._queue.popleft() if self._queue else None
+            if task is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            
+            # Yield to interactive traffic and back off after rate limits
+            while llm_activity.is_busy(self.rate_limit_backoff):
+                time.sleep(self.idle_wait)
+            
+            key, compute = task
+            try:
+                with llm_activity.background():
+                    value = compute()
+                if value:
+                    self.cache.put(*key, value)
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Precompute failed: %s", e, extra={'kind': key[0], 'emailId': key[1]})
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
+
+
+precomputer = Precomputer()
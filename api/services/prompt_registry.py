@@ -0,0 +1,260 @@
+"""
+Prompt Registry - Server-side, versioned prompts with stable content hashes
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from string import Formatter
+from typing import Dict, List, Any, Optional, Callable
+from .log import get_logger
+
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+DEFAULT_PROMPTS_FILE = os.path.join(DATA_DIR, 'default_prompts.json')
+PROMPT_REGISTRY_FILE = os.getenv('PROMPT_REGISTRY_FILE', os.path.join(DATA_DIR, 'prompt_registry.json'))
+
+PROMPT_TYPES = ('categorization', 'actionExtraction', 'autoReply')
+LATEST = 'latest'
+
+logger = get_logger(__name__)
+
+
+def prompt_hash(prompt: str) -> str:
+    """Stable content hash identifying a prompt version"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+class CompiledTemplate:
+    """
+    Prompt template parsed once into literal and field segments
+    
+    Uses str.format placeholder syntax ({field}, with {{ and }} for literal
+    braces). Values are inserted verbatim, so user-edited prompt text is
+    never itself parsed as a template.
+    """
+    
+    __slots__ = ('source', '_segments')
+    
+    def __init__(self, source: str):
+        self.source = source
+        self._segments = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if spec or conversion:
+                raise ValueError(f"Unsupported format spec in template field '{field}'")
+            self._segments.append((literal, field))
+    
+    def render(self, **values: Any) -> str:
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values[field]))
+        return ''.join(parts)
+
+
+class PromptVersion:
+    """An immutable prompt revision"""
+    
+    def __init__(
+        self,
+        prompt_type: str,
+        prompt: str,
+        name: str = '',
+        description: str = '',
+        created_at: Optional[float] = None
+    ):
+        self.type = prompt_type
+        self.prompt = prompt
+        self.name = name
+        self.description = description
+        self.version = prompt_hash(prompt)
+        self.created_at = created_at if created_at is not None else time.time()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Prompt object in the shape services expect, plus version metadata"""
+        return {
+            'name': self.name,
+            'description': self.description,
+            'prompt': self.prompt,
+            'version': self.version,
+            'createdAt': self.created_at
+        }
+
+
+class PromptRegistry:
+    """
+    Versioned prompt store seeded from default_prompts.json
+    
+    Saving a prompt creates a new version identified by its content hash;
+    saving identical text returns the existing version. Requests can refer
+    to a version by hash (or 'latest') instead of sending prompt text.
+    Versions persist to PROMPT_REGISTRY_FILE when the filesystem allows,
+    and the files are only read on first use.
+    """
+    
+    def __init__(self, path: str = PROMPT_REGISTRY_FILE, defaults_path: str = DEFAULT_PROMPTS_FILE):
+        self.path = path
+        self.defaults_path = defaults_path
+        self._lock = threading.RLock()
+        self._versions: Optional[Dict[str, List[PromptVersion]]] = None
+        self._listeners: List[Callable[[str, str], None]] = []
+    
+    def subscribe(self, listener: Callable[[str, str], None]) -> None:
+        """Call listener(prompt_type, version) whenever a new version is created"""
+        self._listeners.append(listener)
+    
+    def latest(self, prompt_type: str) -> Optional[PromptVersion]:
+        versions = self._load().get(prompt_type, [])
+        return versions[-1] if versions else None
+    
+    def get(self, prompt_type: str, version: str) -> Optional[PromptVersion]:
+        """Look up a version by hash; 'latest' returns the newest version"""
+        if version == LATEST:
+            return self.latest(prompt_type)
+        for entry in self._load().get(prompt_type, []):
+            if entry.version == version:
+                return entry
+        return None
+    
+    def versions(self, prompt_type: str) -> List[PromptVersion]:
+        return list(self._load().get(prompt_type, []))
+    
+    def create(
+        self,
+        prompt_type: str,
+        prompt: str,
+        name: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> PromptVersion:
+        """
+        Register a new prompt version
+        
+        Args:
+            prompt_type: One of PROMPT_TYPES
+            prompt: Prompt text
+            name: Display name; defaults to the previous version's
+            description: Description; defaults to the previous version's
+        
+        Returns:
+            The new version, or the existing one if the text is unchanged
+        
+        Raises:
+            ValueError: If the prompt type is unknown or the prompt is empty
+        """
+        if prompt_type not in PROMPT_TYPES:
+            raise ValueError(f"Unknown prompt type: {prompt_type}")
+        if not prompt or not prompt.strip():
+            raise ValueError('Prompt text is required')
+        
+        with self._lock:
+            versions = self._load().setdefault(prompt_type, [])
+            previous = versions[-1] if versions else None
+            if previous is not None and previous.version == prompt_hash(prompt) and name is None and description is None:
+                return previous
+            
+            entry = PromptVersion(
+                prompt_type,
+                prompt,
+                name if name is not None else (previous.name if previous else prompt_type),
+                description if description is not None else (previous.description if previous else '')
+            )
+            versions.append(entry)
+            self._save()
+        
+        for listener in self._listeners:
+            try:
+                listener(prompt_type, entry.version)
+            except Exception as e:
+                logger.warning("Prompt change listener failed: %s", e)
+        return entry
+    
+    def resolve(
+        self,
+        prompts: Optional[Dict[str, Any]] = None,
+        prompt_versions: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Build the prompts dict passed to services
+        
+        For each prompt type, an explicit version reference wins, then an
+        inline prompt object from the request, then the latest registered
+        version. Every resolved prompt carries its 'version' hash.
+        
+        Args:
+            prompts: Inline prompt objects (legacy request shape)
+            prompt_versions: Prompt type -> version hash or 'latest'
+        
+        Returns:
+            Prompt type -> prompt object with 'prompt' and 'version'
+        
+        Raises:
+            KeyError: If a referenced version does not exist
+        """
+        prompts = prompts or {}
+        prompt_versions = prompt_versions or {}
+        resolved = {}
+        
+        for prompt_type in set(PROMPT_TYPES) | set(prompts) | set(prompt_versions):
+            if prompt_type in prompt_versions:
+                entry = self.get(prompt_type, prompt_versions[prompt_type])
+                if entry is None:
+                    raise KeyError(f"Unknown {prompt_type} prompt version: {prompt_versions[prompt_type]}")
+                resolved[prompt_type] = entry.to_dict()
+            elif isinstance(prompts.get(prompt_type), dict) and prompts[prompt_type].get('prompt'):
+                inline = dict(prompts[prompt_type])
+                inline['version'] = prompt_hash(inline['prompt'])
+                resolved[prompt_type] = inline
+            else:
+                entry = self.latest(prompt_type)
+                if entry is not None:
+                    resolved[prompt_type] = entry.to_dict()
+        
+        return resolved
+    
+    def _load(self) -> Dict[str, List[PromptVersion]]:
+        """Read the registry (or seed it from the defaults) on first use"""
+        if self._versions is not None:
+            return self._versions
+        
+        with self._lock:
+            if self._versions is not None:
+                return self._versions
+            
+            versions: Dict[str, List[PromptVersion]] = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                for prompt_type, entries in stored.items():
+                    versions[prompt_type] = [
+                        PromptVersion(prompt_type, e['prompt'], e.get('name', ''), e.get('description', ''), e.get('createdAt'))
+                        for e in entries
+                    ]
+            else:
+                with open(self.defaults_path, 'r', encoding='utf-8') as f:
+                    defaults = json.load(f)
+                for prompt_type, prompt in defaults.items():
+                    versions[prompt_type] = [
+                        PromptVersion(prompt_type, prompt['prompt'], prompt.get('name', ''), prompt.get('description', ''), 0.0)
+                    ]
+            
+            self._versions = versions
+            return versions
+    
+    def _save(self) -> None:
+        """Persist all versions (lock held); keeps working in memory if the disk is read-only"""
+        data = {
+            prompt_type: [entry.to_dict() for entry in entries]
+            for prompt_type, entries in self._versions.items()
+        }
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            logger.warning("Could not persist prompt registry: %s", e)
+
+
+prompt_registry = PromptRegistry()
@@ -0,0 +1,192 @@
+"""
+Responses - Fast JSON encoding and negotiated compression for large payloads
+"""
+
+import os
+import json
+import gzip
+from typing import Any, Optional, Callable
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+# Bodies at least this large are compressed off the event loop
+COMPRESSION_THREADPOOL_SIZE = int(os.getenv('COMPRESSION_THREADPOOL_SIZE', '65536'))
+
+_UNCOMPRESSED_TYPES = ('text/event-stream', 'image/', 'video/', 'audio/', 'application/zip', 'application/gzip')
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact UTF-8 JSON, using orjson when installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson (stdlib json as fallback)
+    
+    Returning an instance directly from an endpoint also skips FastAPI's
+    jsonable_encoder pass, which otherwise walks every nested dict of a
+    large payload before encoding it.
+    """
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    Streaming response that runs on_close once sending ends
+    
+    The callback runs however the response ends: after the last chunk, on
+    client disconnect (even before the body iterator has started), or on
+    a send error. Use it to release resources acquired before the
+    response was returned.
+    """
+    
+    def __init__(self, content: Any, on_close: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+    
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best supported content coding from an Accept-Encoding header
+    
+    Args:
+        accept_encoding: Raw header value, e.g. "gzip, deflate, br;q=0.9"
+    
+    Returns:
+        'br', 'gzip' or None
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+    
+    wildcard = weights.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete responses with brotli or gzip
+    
+    Only single-message bodies of at least minimum_size bytes are
+    compressed; streamed responses (SSE, chunked output) pass through
+    untouched so tokens are not held back. Every single-message response
+    of a compressible type carries Vary: Accept-Encoding, whether or not
+    it was compressed, so shared caches key on the header. Bodies of at
+    least threadpool_size bytes are compressed in the threadpool.
+    """
+    
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        threadpool_size: int = COMPRESSION_THREADPOOL_SIZE
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.threadpool_size = threadpool_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        start_message = None
+        passthrough = False
+        
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            
+            if message['type'] == 'http.response.start':
+                headers = Headers(raw=message['headers'])
+                content_type = headers.get('content-type', '')
+                if 'content-encoding' in headers or content_type.startswith(_UNCOMPRESSED_TYPES):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            
+            if passthrough or message['type'] != 'http.response.body':
+                await send(message)
+                return
+            
+            if start_message is None:
+                # Later chunks of a response we already decided to stream
+                await send(message)
+                return
+            
+            body = message.get('body', b'')
+            start, start_message = start_message, None
+            
+            if message.get('more_body', False):
+                await send(start)
+                await send(message)
+                return
+            
+            headers = MutableHeaders(raw=start['headers'])
+            headers.add_vary_header('Accept-Encoding')
+            if encoding is None or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+            
+            if len(body) >= self.threadpool_size:
+                compressed = await run_in_threadpool(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            await send(start)
+            await send({'type': 'http.response.body', 'body': compressed, 'more_body': False})
+        
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,200 @@
+"""
+Scheduler - Orders and chunks emails so likely-important mail is processed first
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+from .email_processor import ACTIONABLE_CATEGORIES
+
+
+PRIORITY_SCHEDULING = os.getenv('PRIORITY_SCHEDULING', 'true').lower() == 'true'
+# Emails scoring at least this much are chunked ahead of, and apart from, the rest
+PRIORITY_THRESHOLD = float(os.getenv('PRIORITY_THRESHOLD', '5'))
+# Smaller first chunk so the first Important/To-Do results come back sooner
+PRIORITY_FIRST_CHUNK = int(os.getenv('PRIORITY_FIRST_CHUNK', '5'))
+PRIORITY_RECENCY_HALF_LIFE = float(os.getenv('PRIORITY_RECENCY_HALF_LIFE', '24'))
+SENDER_HISTORY_MAX = int(os.getenv('SENDER_HISTORY_MAX', '10000'))
+
+# Score weights; the maximum total is 12
+RECENCY_WEIGHT = 3.0
+UNREAD_WEIGHT = 1.0
+SENDER_WEIGHT = 4.0
+KEYWORD_CAP = 4.0
+
+URGENCY_PATTERN = re.compile(
+    r'\b(?:urgent|asap|immediately|action required|deadline|due|overdue|today|eod|'
+    r'by (?:monday|tuesday|wednesday|thursday|friday|tomorrow)|review needed|'
+    r'please (?:review|confirm|approve|respond)|critical|blocker|outage)\b',
+    re.IGNORECASE
+)
+
+# Only the start of the body is scanned; keywords further down rarely matter
+BODY_SCAN_CHARS = 500
+
+
+def chunk_emails(emails: List[Dict[str, Any]], chunk_size: int) -> List[List[Dict[str, Any]]]:
+    """Split emails into consecutive chunks of at most chunk_size"""
+    return [emails[i:i + chunk_size] for i in range(0, len(emails), chunk_size)]
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """ISO 8601 timestamp ('Z' suffix allowed) to epoch seconds, or None"""
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+class SenderHistory:
+    """
+    How often each sender's mail turned out to be Important or To-Do
+    
+    Bounded LRU of per-sender counts, learned from processing results.
+    """
+    
+    def __init__(self, max_senders: int = SENDER_HISTORY_MAX):
+        self.max_senders = max_senders
+        self._counts: 'OrderedDict[str, List[int]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def rate(self, sender: str) -> float:
+        """Smoothed share of actionable mail from a sender; 0.5 when unknown"""
+        with self._lock:
+            actionable, total = self._counts.get(sender, (0, 0))
+        return (actionable + 1) / (total + 2)
+    
+    def record(self, emails: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+        """Learn from a batch of processing results (failed results are skipped)"""
+        senders = {email.get('id'): _sender_key(email) for email in emails}
+        with self._lock:
+            for result in results:
+                sender = senders.get(result.get('id'))
+                if not sender or result.get('error'):
+                    continue
+                counts = self._counts.pop(sender, None) or [0, 0]
+                counts[0] += result.get('category') in ACTIONABLE_CATEGORIES
+                counts[1] += 1
+                self._counts[sender] = counts
+            while len(self._counts) > self.max_senders:
+                self._counts.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+def _sender_key(email: Dict[str, Any]) -> str:
+    return str(email.get('sender') or '').strip().lower()
+
+
+class PriorityScheduler:
+    """
+    Orders emails by a cheap priority score before they are chunked
+    
+    The score adds up recency (relative to the newest email in the set,
+    halving every PRIORITY_RECENCY_HALF_LIFE hours), an unread bonus, the
+    sender's history of actionable mail, and urgency keywords in the
+    subject and opening of the body. No LLM call is involved; the score
+    only decides what gets categorized first.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool = PRIORITY_SCHEDULING,
+        threshold: float = PRIORITY_THRESHOLD,
+        first_chunk: int = PRIORITY_FIRST_CHUNK,
+        half_life_hours: float = PRIORITY_RECENCY_HALF_LIFE
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.first_chunk = first_chunk
+        self.half_life = half_life_hours * 3600
+        self.history = SenderHistory()
+    
+    def score(self, email: Dict[str, Any], newest: Optional[float] = None) -> float:
+        """
+        Priority score for one email (higher goes first)
+        
+        Args:
+            email: Email object
+            newest: Epoch seconds of the newest email in the set, used as
+                the reference point for recency
+        
+        Returns:
+            Score between 0 and 12
+        """
+        score = 0.0
+        
+        sent = parse_timestamp(email.get('timestamp'))
+        if sent is not None and newest is not None:
+            age = max(0.0, newest - sent)
+            score += RECENCY_WEIGHT * 0.5 ** (age / self.half_life)
+        
+        if not email.get('isRead', False):
+            score += UNREAD_WEIGHT
+        
+        score += SENDER_WEIGHT * self.history.rate(_sender_key(email))
+        
+        subject = str(email.get('subject') or '')
+        body = str(email.get('body') or '')[:BODY_SCAN_CHARS]
+        keywords = 2 * len(URGENCY_PATTERN.findall(subject)) + len(URGENCY_PATTERN.findall(body))
+        score += min(KEYWORD_CAP, keywords)
+        
+        return score
+    
+    def rank(self, emails: List[Dict[str, Any]]) -> List[Tuple[float, Dict[str, Any]]]:
+        """(score, email) pairs by descending score; ties keep their original order"""
+        timestamps = [t for t in (parse_timestamp(e.get('timestamp')) for e in emails) if t is not None]
+        newest = max(timestamps) if timestamps else None
+        scored = [(self.score(email, newest), email) for email in emails]
+        scored.sort(key=lambda pair: -pair[0])
+        return scored
+    
+    def chunks(self, emails: List[Dict[str, Any]], chunk_size: int) -> List[List[Dict[str, Any]]]:
+        """
+        Split emails into processing chunks, most urgent first
+        
+        Emails at or above the threshold are chunked separately from the
+        rest, so a likely-important email never shares a chunk (and its
+        latency) with a pile of newsletters. The first chunk is kept small
+        so its results come back quickly.
+        
+        Args:
+            emails: List of email objects
+            chunk_size: Maximum emails per chunk
+        
+        Returns:
+            List of chunks in processing order
+        """
+        chunk_size = max(1, chunk_size)
+        if not self.enabled:
+            return chunk_emails(emails, chunk_size)
+        
+        ranked = self.rank(emails)
+        urgent = [email for score, email in ranked if score >= self.threshold]
+        rest = [email for score, email in ranked if score < self.threshold]
+        
+        chunks = []
+        for band in (urgent, rest):
+            start = 0
+            if band and not chunks and 0 < self.first_chunk < chunk_size:
+                chunks.append(band[:self.first_chunk])
+                start = self.first_chunk
+            chunks.extend(chunk_emails(band[start:], chunk_size))
+        return chunks
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'threshold': self.threshold,
+            'firstChunk': self.first_chunk,
+            'knownSenders': len(self.history)
+        }
+
+
+scheduler = PriorityScheduler()
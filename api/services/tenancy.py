@@ -0,0 +1,317 @@
+"""
+Tenancy - Per-tenant fair sharing of the upstream LLM quota
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Any, Optional
+
+
+DEFAULT_TENANT = 'anonymous'
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+# Upstream calls in flight across all tenants, and how many of those only
+# interactive calls may use
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_INTERACTIVE_RESERVE = int(os.getenv('LLM_INTERACTIVE_RESERVE', '2'))
+# Batch calls one tenant may have in flight at once
+TENANT_MAX_CONCURRENCY = int(os.getenv('TENANT_MAX_CONCURRENCY', '4'))
+# Fair-share weights, e.g. TENANT_WEIGHTS="team-a=2,team-b=1"; others get 1
+TENANT_WEIGHTS = os.getenv('TENANT_WEIGHTS', '')
+# Tenants whose usage is tracked; X-User-Id is unauthenticated, so beyond
+# this the least recently seen idle tenants are forgotten
+TENANT_MAX_TRACKED = int(os.getenv('TENANT_MAX_TRACKED', '1000'))
+
+# Request paths whose LLM calls run in the interactive lane
+INTERACTIVE_PATH_PREFIXES = ('/api/chat/', '/api/emails/reprocess')
+
+_TENANT_ID_PATTERN = re.compile(r'[^A-Za-z0-9._@-]')
+
+_tenant: contextvars.ContextVar = contextvars.ContextVar('tenant', default=DEFAULT_TENANT)
+_lane: contextvars.ContextVar = contextvars.ContextVar('lane', default=BATCH)
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parse "tenant=weight,..." into a dict, ignoring malformed entries"""
+    weights = {}
+    for part in spec.split(','):
+        name, _, value = part.partition('=')
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if name.strip() and weight > 0:
+            weights[name.strip()] = weight
+    return weights
+
+
+def tenant_from_headers(headers) -> str:
+    """
+    Tenant ID for a request
+    
+    X-User-Id wins; otherwise an API key (X-API-Key or a bearer token) is
+    identified by a short hash so keys never appear in stats or logs.
+    
+    Args:
+        headers: Request headers (case-insensitive mapping)
+    
+    Returns:
+        Tenant ID, or DEFAULT_TENANT for unidentified requests
+    """
+    user_id = headers.get('x-user-id', '').strip()
+    if user_id:
+        return _TENANT_ID_PATTERN.sub('_', user_id)[:64]
+    
+    api_key = headers.get('x-api-key', '').strip()
+    if not api_key:
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer':
+            api_key = token.strip()
+    if api_key:
+        return 'key-' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+    return DEFAULT_TENANT
+
+
+def current_tenant() -> str:
+    return _tenant.get()
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextmanager
+def tenant_context(tenant: str, lane: Optional[str] = None):
+    """Attribute LLM calls made inside the block to a tenant (and lane)"""
+    tenant_token = _tenant.set(tenant)
+    lane_token = _lane.set(lane) if lane else None
+    try:
+        yield
+    finally:
+        if lane_token is not None:
+            _lane.reset(lane_token)
+        _tenant.reset(tenant_token)
+
+
+class TenantMiddleware:
+    """
+    ASGI middleware setting the tenant and lane for each request
+    
+    Both live in context variables, so they follow the request into
+    run_in_threadpool and streamed response iterators.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        headers = {
+            key.decode('latin-1').lower(): value.decode('latin-1')
+            for key, value in scope.get('headers', [])
+        }
+        lane = INTERACTIVE if scope.get('path', '').startswith(INTERACTIVE_PATH_PREFIXES) else BATCH
+        with tenant_context(tenant_from_headers(headers), lane):
+            await self.app(scope, receive, send)
+
+
+class _Waiter:
+    __slots__ = ('tenant', 'lane', 'seq', 'granted')
+    
+    def __init__(self, tenant: str, lane: str, seq: int):
+        self.tenant = tenant
+        self.lane = lane
+        self.seq = seq
+        self.granted = False
+
+
+class FairShareScheduler:
+    """
+    Weighted fair queuing of upstream LLM calls across tenants
+    
+    Every upstream call takes one of max_concurrent slots. When calls have
+    to wait, the next slot goes to an interactive call if one is waiting,
+    otherwise to the tenant that has received the least service relative
+    to its weight (start-time fair queuing). The last interactive_reserve
+    slots are never given to batch calls, and a tenant may hold at most
+    tenant_max_concurrent batch slots, so one user's bulk run cannot crowd
+    out everyone else's chat. Usage is accounted per tenant.
+    
+    Tenant IDs come from request headers, so state is bounded: idle tenants
+    are dropped from the scheduling tables, and at most max_tracked tenants
+    keep usage stats, the least recently seen idle ones being evicted.
+    """
+    
+    def __init__(
+        self,
+        max_concurrent: int = LLM_MAX_CONCURRENCY,
+        interactive_reserve: int = LLM_INTERACTIVE_RESERVE,
+        tenant_max_concurrent: int = TENANT_MAX_CONCURRENCY,
+        weights: Optional[Dict[str, float]] = None,
+        max_tracked: int = TENANT_MAX_TRACKED
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.max_concurrent - 1)
+        self.tenant_max_concurrent = max(1, tenant_max_concurrent)
+        self.weights = weights if weights is not None else parse_weights(TENANT_WEIGHTS)
+        self.max_tracked = max(1, max_tracked)
+        self._cond = threading.Condition()
+        self._waiters: List[_Waiter] = []
+        self._seq = 0
+        self._active = 0
+        self._active_by_tenant: Dict[str, Dict[str, int]] = defaultdict(lambda: {INTERACTIVE: 0, BATCH: 0})
+        self._virtual_time: Dict[str, float] = {}
+        self._clock = 0.0
+        # Least recently seen first
+        self._usage: 'OrderedDict[str, Dict[str, float]]' = OrderedDict()
+        self._evicted = 0
+    
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """
+        Hold an upstream slot for the current tenant and lane
+        
+        Args:
+            tokens: Estimated prompt tokens, recorded in the tenant's usage
+        """
+        tenant, lane = current_tenant(), current_lane()
+        waited = self._acquire(tenant, lane)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(tenant, lane, waited, time.monotonic() - started, tokens)
+    
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = defaultdict(int)
+            for waiter in self._waiters:
+                queued[waiter.tenant] += 1
+            tenants = {}
+            for tenant in set(self._usage) | set(self._active_by_tenant) | set(queued):
+                usage = self._usage.get(tenant) or {}
+                active = self._active_by_tenant.get(tenant) or {}
+                tenants[tenant] = {
+                    'weight': self._weight(tenant),
+                    'active': sum(active.values()),
+                    'queued': queued.get(tenant, 0),
+                    'calls': usage.get('calls', 0),
+                    'interactiveCalls': usage.get('interactiveCalls', 0),
+                    'waitSeconds': round(usage.get('waitSeconds', 0.0), 3),
+                    'busySeconds': round(usage.get('busySeconds', 0.0), 3),
+                    'promptTokens': usage.get('promptTokens', 0)
+                }
+            return {
+                'maxConcurrent': self.max_concurrent,
+                'interactiveReserve': self.interactive_reserve,
+                'tenantMaxConcurrent': self.tenant_max_concurrent,
+                'active': self._active,
+                'queued': len(self._waiters),
+                'maxTracked': self.max_tracked,
+                'evictedTenants': self._evicted,
+                'tenants': tenants
+            }
+    
+    def _weight(self, tenant: str) -> float:
+        return self.weights.get(tenant, 1.0)
+    
+    def _acquire(self, tenant: str, lane: str) -> float:
+        """Block until a slot is granted; returns seconds spent waiting"""
+        started = time.monotonic()
+        with self._cond:
+            self._seq += 1
+            waiter = _Waiter(tenant, lane, self._seq)
+            self._waiters.append(waiter)
+            self._dispatch()
+            while not waiter.granted:
+                self._cond.wait()
+        return time.monotonic() - started
+    
+    def _release(self, tenant: str, lane: str, waited: float, held: float, tokens: int) -> None:
+        with self._cond:
+            self._active -= 1
+            active = self._active_by_tenant[tenant]
+            active[lane] -= 1
+            if not any(active.values()):
+                del self._active_by_tenant[tenant]
+            
+            usage = self._usage.pop(tenant, None) or {
+                'calls': 0, 'interactiveCalls': 0, 'waitSeconds': 0.0, 'busySeconds': 0.0, 'promptTokens': 0
+            }
+            self._usage[tenant] = usage
+            usage['calls'] += 1
+            usage['interactiveCalls'] += lane == INTERACTIVE
+            usage['waitSeconds'] += waited
+            usage['busySeconds'] += held
+            usage['promptTokens'] += tokens
+            self._dispatch()
+            self._evict()
+    
+    def _evict(self) -> None:
+        """Drop state of idle tenants that no longer affects scheduling (lock held)"""
+        # A virtual time at or behind the clock carries no credit or debt
+        for tenant in [t for t, start in self._virtual_time.items() if start <= self._clock]:
+            del self._virtual_time[tenant]
+        
+        excess = len(self._usage) - self.max_tracked
+        if excess <= 0:
+            return
+        waiting = {waiter.tenant for waiter in self._waiters}
+        for tenant in list(self._usage):
+            if excess <= 0:
+                break
+            if tenant in self._active_by_tenant or tenant in waiting:
+                continue
+            del self._usage[tenant]
+            self._virtual_time.pop(tenant, None)
+            self._evicted += 1
+            excess -= 1
+    
+    def _eligible(self, waiter: _Waiter) -> bool:
+        """Whether a slot may go to this waiter right now (lock held)"""
+        if waiter.lane == INTERACTIVE:
+            return self._active < self.max_concurrent
+        return (
+            self._active < self.max_concurrent - self.interactive_reserve
+            and self._active_by_tenant.get(waiter.tenant, {}).get(BATCH, 0) < self.tenant_max_concurrent
+        )
+    
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters in fair order (lock held)"""
+        granted = False
+        while self._waiters:
+            eligible = [w for w in self._waiters if self._eligible(w)]
+            if not eligible:
+                break
+            waiter = min(eligible, key=lambda w: (
+                w.lane != INTERACTIVE,
+                max(self._virtual_time.get(w.tenant, 0.0), self._clock),
+                w.seq
+            ))
+            
+            # Start-time fair queuing: a tenant that was idle restarts at the
+            # current clock instead of banking credit while away
+            start = max(self._virtual_time.get(waiter.tenant, 0.0), self._clock)
+            self._clock = start
+            self._virtual_time[waiter.tenant] = start + 1.0 / self._weight(waiter.tenant)
+            
+            self._waiters.remove(waiter)
+            self._active += 1
+            self._active_by_tenant[waiter.tenant][waiter.lane] += 1
+            waiter.granted = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+
+fair_share = FairShareScheduler()